@@ -1,8 +1,6 @@
-import json
 import random
 import os
-
-SESSIONS_PATH = "sessions.json"
+from session_logger import SESSIONS_PATH, edit_sessions
 
 def generate_session_key(existing_keys):
     while True:
@@ -15,24 +13,21 @@ def main():
         print("sessions.json bulunamadı!")
         return
 
-    with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
-        sessions = json.load(f)
-
-    # Var olan anahtarları topla
-    existing_keys = {s.get("session_key") for s in sessions if "session_key" in s}
-    existing_keys.discard(None)
+    # kilit oku-değiştir-yaz boyunca tutulur; liste değiştiyse atomik yazılır
+    with edit_sessions() as sessions:
+        # Var olan anahtarları topla
+        existing_keys = {s.get("session_key") for s in sessions if "session_key" in s}
+        existing_keys.discard(None)
 
-    changed = False
-    for s in sessions:
-        if "session_key" not in s or not s["session_key"]:
-            key = generate_session_key(existing_keys)
-            s["session_key"] = key
-            existing_keys.add(key)
-            changed = True
+        changed = False
+        for s in sessions:
+            if "session_key" not in s or not s["session_key"]:
+                key = generate_session_key(existing_keys)
+                s["session_key"] = key
+                existing_keys.add(key)
+                changed = True
 
     if changed:
-        with open(SESSIONS_PATH, "w", encoding="utf-8") as f:
-            json.dump(sessions, f, ensure_ascii=False, indent=2)
         print("Eksik session_key'ler eklendi ve dosya güncellendi.")
     else:
         print("Tüm session'larda zaten session_key mevcut. Değişiklik yapılmadı.")
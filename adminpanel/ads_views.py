@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # /var/www/instavido/adminpanel/ads_views.py
 import os
+import re
 import json
 from flask import Blueprint, render_template, request, jsonify, Response
 from adminpanel import admin_bp   # mevcut admin blueprint
@@ -8,8 +9,8 @@ from functools import wraps
 
 from ads_manager import (
     load_config, save_config,
-    set_slot, toggle_slot, get_slot,
-    set_interstitial
+    set_slot, toggle_slot,
+    set_interstitial, slot_html, config_version
 )
 
 # --- Basit login kontrolü: adminpanel/views.py'deki login_required ile aynı davranış ---
@@ -49,17 +50,19 @@ def ads_page():
 # ---------------------------
 @admin_bp.route("/ads/api/slot/<slot>.html", methods=["GET"])
 def api_slot_html(slot):
-    """templates/ads/macros.html makrosu buradan HTML çeker.
-       Slot pasifse 204 döndürür."""
-    s = get_slot(slot)
-    if not s:
-        return Response("", status=204)
-    enabled = bool(s.get("active") or s.get("enabled"))
-    html = s.get("html") or s.get("code") or ""
-    if not enabled or not html.strip():
+    """Sunucu tarafı yerleştirme yoksa templates/ads/macros.html makrosu buradan HTML çeker.
+       Slot pasifse 204 döndürür. ETag = config sürümü."""
+    etag = f"ads-{config_version()}-{re.sub(r'[^A-Za-z0-9._-]', '', slot)}"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    html = slot_html(slot)
+    if not html:
         return Response("", status=204)
     # HTML olarak döndür
-    return Response(html, mimetype="text/html; charset=utf-8")
+    resp = Response(html, mimetype="text/html; charset=utf-8")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, max-age=60"
+    return resp
 
 # ---------------------------
 # KAYDET: Tek/çoklu form kaydı
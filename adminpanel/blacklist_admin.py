@@ -3,6 +3,7 @@
 
 import os, json, re, time, traceback
 from flask import Blueprint, render_template, request, jsonify, current_app, session as flask_session
+from config import config_bus
 
 # ŞABLON YOLU:
 # Bu blueprint __name__ = "adminpanel.blacklist_admin" altında çalışır.
@@ -25,7 +26,7 @@ def _ensure_store():
         with open(BLACKLIST_FILE, "w", encoding="utf-8") as f:
             json.dump({"profiles": [], "links": []}, f, ensure_ascii=False, indent=2)
 
-def _load():
+def _load_file():
     _ensure_store()
     try:
         with open(BLACKLIST_FILE, "r", encoding="utf-8") as f:
@@ -38,12 +39,22 @@ def _load():
             with open(BLACKLIST_FILE, "w", encoding="utf-8") as f:
                 json.dump({"profiles": [], "links": []}, f, ensure_ascii=False, indent=2)
 
+def _load():
+    # Güncel kopya config bus'ta (tüm node'lar ortak); çağıran değiştireceği için kopya döner
+    _ver, doc = config_bus.get("blacklist", _load_file, BLACKLIST_FILE)
+    doc = doc or {}
+    return {"profiles": list(doc.get("profiles", [])), "links": list(doc.get("links", []))}
+
 def _save(payload: dict):
     payload = payload or {"profiles": [], "links": []}
     payload.setdefault("profiles", [])
     payload.setdefault("links", [])
     with open(BLACKLIST_FILE, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
+    try:
+        config_bus.publish("blacklist", payload, BLACKLIST_FILE)
+    except Exception:
+        current_app.logger.exception("blacklist publish error")
 
 def _norm(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").strip().lower())
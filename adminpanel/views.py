@@ -18,8 +18,9 @@ LOG_FILE   = os.path.join(BASE_DIR, "adminpanel/session_updater.log")
 NOTIF_FILE = os.path.join(os.path.dirname(__file__), "static/notif_log.json")
 BLOCKED_COOKIES_FILE = os.path.join(os.path.dirname(__file__), "../blocked_cookies.json")
 
-NOTIF_LOG = os.path.join(os.path.dirname(__file__), "../data/notif_log.json")
-SESSION_USE_LOG = os.path.join(os.path.dirname(__file__), "../data/session_use_log.json")
+# session_logger'ın yazdığı JSONL olay logları (sondan okunur)
+from session_logger import NOTIF_LOG, SESSION_LOG as SESSION_USE_LOG, tail_jsonl
+from session_logger import edit_sessions, merge_pending_counters
 
 ADMIN_USERNAME = "srdr"
 ADMIN_PASSWORD = "gizlisifre"
@@ -40,6 +41,7 @@ def load_json(path):
         return json.load(f)
 
 def save_json(path, data):
+    # sessions.json için kullanılmaz: oku-değiştir-yaz edit_sessions() ile kilit altında yapılır
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
@@ -164,24 +166,23 @@ def dashboard():
 @admin_bp.route('/sessions')
 @login_required
 def sessions():
-    session_list = load_json(SESSIONS_FILE)
     blocked = get_blocked_sessions()
-    # Eksik session_key'leri tamamla + blok bayrağı
-    changed = False
-    for sess in session_list:
-        sess['blocked'] = sess.get('sessionid') in blocked
-        if not sess.get('session_key'):
-            sess['session_key'] = generate_unique_session_key(session_list)
-            changed = True
-    if changed:
-        save_json(SESSIONS_FILE, session_list)
+    # Eksik session_key'leri tamamla (yalnızca eksik varsa yazılır)
+    with edit_sessions() as all_sessions:
+        for sess in all_sessions:
+            if not sess.get('session_key'):
+                sess['session_key'] = generate_unique_session_key(all_sessions)
+    # Blok bayrağı yalnızca gösterim için
+    session_list = [dict(sess, blocked=sess.get('sessionid') in blocked) for sess in all_sessions]
+    # Redis'te bekleyen sayaçlar yalnızca gösterim için eklenir (kaydettikten SONRA)
+    merge_pending_counters(session_list)
     return render_template("admin/sessions.html", sessions=session_list)
 
 @admin_bp.route('/get-user-sessions/<username>')
 @login_required
 def get_user_sessions(username):
     all_sessions = load_json(SESSIONS_FILE)
-    user_sessions = [s for s in all_sessions if s.get("user") == username]
+    user_sessions = merge_pending_counters([s for s in all_sessions if s.get("user") == username])
     return json.dumps(user_sessions), 200, {'Content-Type': 'application/json'}
 
 @admin_bp.route('/add-user-session/<username>', methods=["POST"])
@@ -205,12 +206,6 @@ def add_user_session(username):
     if not (sessionid and ds_user_id and csrftoken):
         return "Gerekli alanlar eksik (sessionid, ds_user_id, csrftoken).", 400
 
-    all_sessions = load_json(SESSIONS_FILE)
-    # Aynı kullanıcıya aynı sessionid eklenemesin
-    for s in all_sessions:
-        if s.get("user") == username and s.get("sessionid") == sessionid:
-            return "Bu kullanıcıya ait session zaten var.", 400
-
     # rastgele fingerprint preset
     fp = random.choice(_FINGERPRINT_PRESETS)
 
@@ -225,25 +220,30 @@ def add_user_session(username):
         if k not in cookies_map:
             cookies_map[k] = v
 
-    new_entry = {
-        "user": username,
-        "sessionid": sessionid,
-        "ds_user_id": ds_user_id,
-        "csrftoken": csrftoken,
-        "fail_count": 0,
-        "success_count": 0,
-        "last_used": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "status": "active",
-        "session_key": generate_unique_session_key(all_sessions),
-        "cookies": cookies_map,
-        "fingerprint": fp,
-        "proxy": proxy or None,
-        "blocked": False,
-        "unblock_at": None,
-    }
-
-    all_sessions.append(new_entry)
-    save_json(SESSIONS_FILE, all_sessions)
+    with edit_sessions() as all_sessions:
+        # Aynı kullanıcıya aynı sessionid eklenemesin
+        for s in all_sessions:
+            if s.get("user") == username and s.get("sessionid") == sessionid:
+                return "Bu kullanıcıya ait session zaten var.", 400
+
+        new_entry = {
+            "user": username,
+            "sessionid": sessionid,
+            "ds_user_id": ds_user_id,
+            "csrftoken": csrftoken,
+            "fail_count": 0,
+            "success_count": 0,
+            "last_used": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "active",
+            "session_key": generate_unique_session_key(all_sessions),
+            "cookies": cookies_map,
+            "fingerprint": fp,
+            "proxy": proxy or None,
+            "blocked": False,
+            "unblock_at": None,
+        }
+
+        all_sessions.append(new_entry)
 
     # opsiyonel bildirim listesi
     notif_data = load_json(NOTIF_FILE) if os.path.exists(NOTIF_FILE) else []
@@ -276,45 +276,31 @@ def delete_log():
 @admin_bp.route("/api/live_notifications")
 @login_required
 def api_live_notifications():
-    notif_data = []
     try:
-        if os.path.exists(NOTIF_LOG):
-            with open(NOTIF_LOG, encoding="utf-8") as f:
-                notif_data = json.load(f)
+        notif_data = tail_jsonl(NOTIF_LOG, 20)  # Son 20 bildirim
     except Exception:
         notif_data = []
-    last_session = {}
     try:
-        if os.path.exists(SESSION_USE_LOG):
-            with open(SESSION_USE_LOG, encoding="utf-8") as f:
-                session_log = json.load(f)
-            last_session = session_log[-1] if session_log else {}
+        session_log = tail_jsonl(SESSION_USE_LOG, 1)
+        last_session = session_log[-1] if session_log else {}
     except Exception:
         last_session = {}
     return jsonify({
-        "notifications": notif_data[-20:],  # Son 20 bildirim
+        "notifications": notif_data,
         "last_session": last_session
     })
 
 @admin_bp.route('/get-latest-notif')
 @login_required
 def get_latest_notif():
-    notif_path = os.path.join(os.path.dirname(__file__), 'data/notif_log.json')
-    if not os.path.exists(notif_path):
-        return json.dumps({}), 200, {'Content-Type': 'application/json'}
-    with open(notif_path, "r", encoding="utf-8") as f:
-        notifs = json.load(f)
+    notifs = tail_jsonl(NOTIF_LOG, 1)
     return json.dumps(notifs[-1] if notifs else {}), 200, {'Content-Type': 'application/json'}
 
 @admin_bp.route('/get-last-100-notifs')
 @login_required
 def get_last_100_notifs():
-    notif_path = os.path.join(os.path.dirname(__file__), 'data/notif_log.json')
-    if not os.path.exists(notif_path):
-        return json.dumps([]), 200, {'Content-Type': 'application/json'}
-    with open(notif_path, "r", encoding="utf-8") as f:
-        notifs = json.load(f)
-    return json.dumps(notifs[-100:]), 200, {'Content-Type': 'application/json'}
+    notifs = tail_jsonl(NOTIF_LOG, 100)
+    return json.dumps(notifs), 200, {'Content-Type': 'application/json'}
 
 # ---------------- Session Test API (tekli & toplu) ----------------
 def _merge_cookies(sess: dict) -> dict:
@@ -404,11 +390,15 @@ def api_session_test(session_key):
     if not target:
         return jsonify({"ok": False, "error": "not_found"}), 404
 
+    # Test ağ çağrısı: kilit dışında yapılır, sonuç kilit altında işlenir
     res = _test_cookie_entry(target)
 
     # Görsel kolaylık için status alanını basitçe güncelle
-    target["status"] = "active" if res.get("status") == "active" else "invalid"
-    save_json(SESSIONS_FILE, all_sessions)
+    status = "active" if res.get("status") == "active" else "invalid"
+    with edit_sessions() as all_sessions:
+        for s in all_sessions:
+            if str(s.get("session_key")) == str(session_key):
+                s["status"] = status
 
     return jsonify(res), 200
 
@@ -422,23 +412,27 @@ def api_session_test_all():
     summary = {"active": 0, "blocked": 0, "invalid": 0, "total": len(all_sessions)}
     results = []
 
+    statuses = {}
     for s in all_sessions:
         res = _test_cookie_entry(s)
         results.append(res)
         st = res.get("status")
         if st in summary:
             summary[st] += 1
-        s["status"] = "active" if st == "active" else "invalid"
-
-    save_json(SESSIONS_FILE, all_sessions)
+        statuses[(s.get("session_key"), s.get("sessionid"))] = "active" if st == "active" else "invalid"
+
+    # Testler uzun sürebilir: dosya yalnızca sonuç işlenirken kilitlenir
+    with edit_sessions() as all_sessions:
+        for s in all_sessions:
+            st = statuses.get((s.get("session_key"), s.get("sessionid")))
+            if st:
+                s["status"] = st
     return jsonify({"ok": True, "summary": summary, "results": results}), 200
 
 # ---------------- Update/Delete session ----------------
 @admin_bp.route('/update-user-session/<username>/<session_key>', methods=["POST"])
 @login_required
 def update_user_session(username, session_key):
-    all_sessions = load_json(SESSIONS_FILE)
-
     proxy = (request.form.get("proxy") or "").strip()
     cookie_dump = (request.form.get("cookie_dump") or "").strip()
     cookie_raw  = (request.form.get("cookie_raw") or "").strip()
@@ -449,50 +443,50 @@ def update_user_session(username, session_key):
     elif cookie_raw:
         kv = _parse_cookie_kv(cookie_raw)
 
-    for sess in all_sessions:
-        if sess.get("user") == username and str(sess.get("session_key")) == str(session_key):
-            # alanları ya formdan ya cookie’lerden çek
-            sessionid  = request.form.get('sessionid')  or kv.get("sessionid")  or sess.get("sessionid")
-            ds_user_id = request.form.get('ds_user_id') or kv.get("ds_user_id") or sess.get("ds_user_id")
-            csrftoken  = request.form.get('csrftoken')  or kv.get("csrftoken")  or sess.get("csrftoken")
+    with edit_sessions() as all_sessions:
+        for sess in all_sessions:
+            if sess.get("user") == username and str(sess.get("session_key")) == str(session_key):
+                # alanları ya formdan ya cookie’lerden çek
+                sessionid  = request.form.get('sessionid')  or kv.get("sessionid")  or sess.get("sessionid")
+                ds_user_id = request.form.get('ds_user_id') or kv.get("ds_user_id") or sess.get("ds_user_id")
+                csrftoken  = request.form.get('csrftoken')  or kv.get("csrftoken")  or sess.get("csrftoken")
 
-            if not (sessionid and ds_user_id and csrftoken):
-                return "Gerekli alanlar eksik.", 400
+                if not (sessionid and ds_user_id and csrftoken):
+                    return "Gerekli alanlar eksik.", 400
 
-            sess['sessionid']  = sessionid
-            sess['ds_user_id'] = ds_user_id
-            sess['csrftoken']  = csrftoken
+                sess['sessionid']  = sessionid
+                sess['ds_user_id'] = ds_user_id
+                sess['csrftoken']  = csrftoken
 
-            # cookies birleştir
-            cookies = dict(sess.get("cookies") or {})
-            if kv:
-                cookies.update(kv)
-            cookies["sessionid"]  = sessionid
-            cookies["ds_user_id"] = ds_user_id
-            cookies["csrftoken"]  = csrftoken
-            sess["cookies"] = cookies
+                # cookies birleştir
+                cookies = dict(sess.get("cookies") or {})
+                if kv:
+                    cookies.update(kv)
+                cookies["sessionid"]  = sessionid
+                cookies["ds_user_id"] = ds_user_id
+                cookies["csrftoken"]  = csrftoken
+                sess["cookies"] = cookies
 
-            # fingerprint yoksa ata
-            if not sess.get("fingerprint"):
-                sess["fingerprint"] = random.choice(_FINGERPRINT_PRESETS)
+                # fingerprint yoksa ata
+                if not sess.get("fingerprint"):
+                    sess["fingerprint"] = random.choice(_FINGERPRINT_PRESETS)
 
-            # proxy güncelle (geldiyse)
-            if proxy:
-                sess["proxy"] = proxy
+                # proxy güncelle (geldiyse)
+                if proxy:
+                    sess["proxy"] = proxy
 
-            save_json(SESSIONS_FILE, all_sessions)
-            return "OK", 200
+                return "OK", 200
 
     return "Hatalı index", 400
 
 @admin_bp.route('/delete-session/<session_key>', methods=["POST"])
 @login_required
 def delete_session(session_key):
-    all_sessions = load_json(SESSIONS_FILE)
-    new_sessions = [sess for sess in all_sessions if str(sess.get("session_key")) != str(session_key)]
-    if len(all_sessions) == len(new_sessions):
-        return "Bulunamadı", 404
-    save_json(SESSIONS_FILE, new_sessions)
+    with edit_sessions() as all_sessions:
+        new_sessions = [sess for sess in all_sessions if str(sess.get("session_key")) != str(session_key)]
+        if len(all_sessions) == len(new_sessions):
+            return "Bulunamadı", 404
+        all_sessions[:] = new_sessions
     return "OK", 200
 
 # ---------------- Analytics ----------------
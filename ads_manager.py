@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 # /var/www/instavido/ads_manager.py
-import os, json, time, tempfile, re
+import os, json, time, tempfile, re, copy, logging
 from typing import Dict, Any, List
+from markupsafe import Markup
+from config import config_bus
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ADS_DIR  = os.path.join(BASE_DIR, "ads")
@@ -80,25 +82,61 @@ def _migrate(cfg: Dict[str, Any]) -> Dict[str, Any]:
         cfg["interstitial"] = DEFAULT_CONFIG["interstitial"]
     return cfg
 
-def load_config() -> Dict[str, Any]:
+def _load_file() -> Dict[str, Any]:
     ensure_store()
     cfg = _safe_read(ADS_FILE)
     before = set(cfg.get("slots", {}).keys())
     cfg = _migrate(cfg)
     after = set(cfg.get("slots", {}).keys())
     if after != before:
-        save_config(cfg)
+        cfg["updated_at"] = int(time.time())
+        _atomic_write(ADS_FILE, cfg)
+    return cfg
+
+def _cfg() -> Dict[str, Any]:
+    """Worker'daki sıcak kopya (config bus, sürüm değişince yenilenir). SALT OKUNUR."""
+    _ver, cfg = config_bus.get("ads", _load_file, ADS_FILE)
     return cfg
 
+def config_version() -> str:
+    """ETag vb. için sürüm damgası (yalnızca [A-Za-z0-9._-])."""
+    ver, cfg = config_bus.get("ads", _load_file, ADS_FILE)
+    if isinstance(ver, (tuple, list)):   # Redis yokken ("file", "<mtime_ns>:<size>")
+        ver = "-".join(str(v) for v in ver)
+    return re.sub(r"[^A-Za-z0-9._-]", "", f"{ver}-{cfg.get('updated_at', 0)}")
+
+def slot_html(key: str) -> str:
+    """Aktif slotun HTML'i; pasif/boş/yok ise ''."""
+    s = _cfg().get("slots", {}).get(key) or {}
+    if not (s.get("active") or s.get("enabled")):
+        return ""
+    html = s.get("html") or s.get("code") or ""
+    return html if html.strip() else ""
+
+def ad_html(key: str) -> Markup:
+    """Şablonlarda sunucu tarafı yerleştirme: {{ ad_html("slot") }}"""
+    try:
+        return Markup(slot_html(key))
+    except Exception:
+        return Markup("")
+
+def load_config() -> Dict[str, Any]:
+    # Çağıranlar değiştirip save_config ile yazdığı için kopya döner
+    return copy.deepcopy(_cfg())
+
 def save_config(cfg: Dict[str, Any]):
     cfg["updated_at"] = int(time.time())
     _atomic_write(ADS_FILE, cfg)
+    try:
+        config_bus.publish("ads", cfg, ADS_FILE)
+    except Exception as e:
+        logging.getLogger("ads_manager").warning(f"ads config publish error: {e}")
 
 def list_slots() -> List[str]:
-    return sorted(load_config().get("slots", {}).keys())
+    return sorted(_cfg().get("slots", {}).keys())
 
 def get_slot(key: str) -> Dict[str, Any] | None:
-    return load_config().get("slots", {}).get(key)
+    return copy.deepcopy(_cfg().get("slots", {}).get(key))
 
 def set_slot(key: str, html: str, active: bool, label: str | None = None):
     cfg = load_config()
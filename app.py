@@ -2,27 +2,32 @@
 from seo_instavido.seo_utils import get_meta
 from adminpanel.views import admin_bp
 import adminpanel  # admin_bp ve tüm admin route'larını yükler (views, ads_views)
-import hmac, hashlib, base64, os, re, json, time, io, logging, requests
+import hmac, hashlib, base64, os, re, json, time, logging, requests, codecs
 from urllib.parse import urlparse, urljoin, quote, urlencode
-import socket, ipaddress
+import socket, ipaddress, threading
+from collections import OrderedDict
 from typing import Optional, Dict, Any, Tuple, List
-from session_logger import log_session_use, notify_download, update_session_counters
+from session_logger import edit_sessions, record_download, bookkeeping_stats
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, session, Response, send_file, jsonify
+    url_for, session, Response, send_file, jsonify, g
 )
 from flask_session import Session
+from flask.sessions import SessionInterface, SecureCookieSession
 from flask_babelex import Babel, _
 from adminpanel.blacklist_admin import blacklist_admin_bp
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from config.redis_helpers import get_redis_client
+from config.http_helpers import cdn_get, cdn_post, pool_stats
+from config import config_bus, session_serializer
+import img_cache
+import ig_parse
+import ig_media
 import random
 from datetime import datetime
 
 # --- ENTEGRE --- #
-from session_logger import log_session_use, notify_download
-
 # en üste yakın bir yere (global):
 _auth_soft_fails = {}
 
@@ -55,32 +60,48 @@ def _ub64(s: str) -> bytes:
 def _sign_payload(secret: str, payload: str) -> str:
     return _b64(hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest())
 
+# >0 ise imzalar deterministik: nonce yok, exp sabit kovalara yuvarlanır.
+# Aynı URL bir kova boyunca aynı imzalı linki üretir → tarayıcı/nginx/CDN cache'i tutar.
+SIGN_BUCKET_SEC = int(os.getenv("SIGN_BUCKET_SEC", "0"))
+
+def _sign_exp_nonce(ttl_sec: int) -> Tuple[str, str]:
+    now = int(time.time())
+    if SIGN_BUCKET_SEC > 0:
+        b = SIGN_BUCKET_SEC
+        exp = ((now + ttl_sec) // b + 1) * b   # her zaman en az ttl_sec geçerli
+        return str(exp), ""
+    return str(now + ttl_sec), _b64(os.urandom(8))
+
 def sign_img_proxy(url: str, ttl_sec: int = 900) -> str:
     """
     <img src="/img_proxy?..."> için imzalı URL üretir: url, exp, nonce, sig
+    (SIGN_BUCKET_SEC modunda nonce yoktur)
     """
     if not IMG_PROXY_SECRET:
         # dev modda doğrudan kullan; prod’da mutlaka env ver
         return f"/img_proxy?url={quote(url)}"
-    exp = str(int(time.time()) + ttl_sec)
-    nonce = _b64(os.urandom(8))
+    exp, nonce = _sign_exp_nonce(ttl_sec)
     payload = f"url={url}&exp={exp}&nonce={nonce}"
     sig = _sign_payload(IMG_PROXY_SECRET, payload)
-    qs = urlencode({"url": url, "exp": exp, "nonce": nonce, "sig": sig})
-    return f"/img_proxy?{qs}"
+    params = {"url": url, "exp": exp, "nonce": nonce, "sig": sig}
+    if not nonce:
+        params.pop("nonce")
+    return f"/img_proxy?{urlencode(params)}"
 
 def sign_media_proxy(url: str, fn: str = "instavido", ttl_sec: int = 900) -> str:
     """
     /proxy_download için imzalı URL üretir: url, fn, exp, nonce, sig
+    (SIGN_BUCKET_SEC modunda nonce yoktur)
     """
     if not MEDIA_PROXY_SECRET:
         return f"/proxy_download?url={quote(url)}&fn={quote(fn)}"
-    exp = str(int(time.time()) + ttl_sec)
-    nonce = _b64(os.urandom(8))
+    exp, nonce = _sign_exp_nonce(ttl_sec)
     payload = f"url={url}&fn={fn}&exp={exp}&nonce={nonce}"
     sig = _sign_payload(MEDIA_PROXY_SECRET, payload)
-    qs = urlencode({"url": url, "fn": fn, "exp": exp, "nonce": nonce, "sig": sig})
-    return f"/proxy_download?{qs}"
+    params = {"url": url, "fn": fn, "exp": exp, "nonce": nonce, "sig": sig}
+    if not nonce:
+        params.pop("nonce")
+    return f"/proxy_download?{urlencode(params)}"
 
 ALLOWED_REFERERS   = ("instavido.com", "www.instavido.com")
 def _has_allowed_referer(req) -> bool:
@@ -91,42 +112,50 @@ def _has_allowed_referer(req) -> bool:
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY", "").strip()
 RECAPTCHA_SECRET   = os.getenv("RECAPTCHA_SECRET", "").strip()
 
-RATE_FILE = "/var/www/instavido/.rate_limits.json"
-os.makedirs(os.path.dirname(RATE_FILE), exist_ok=True)
-if not os.path.exists(RATE_FILE):
-    with open(RATE_FILE, "w") as f:
-        json.dump({}, f)
+RATE_KEY_PREFIX = "iv_rl:"
+
+# Kayan pencere: ZSET skorları ms zaman damgası. Pencere dışı kayıtlar silinir,
+# en fazla burst+1 kayıt tutulur, anahtar pencere kadar boşta kalınca kendiliğinden düşer.
+# Lua fonksiyonu olarak tanımlı; kabul betiği (_ADMIT_LUA) bunu gövdesine ekler.
+_SLIDING_WINDOW_LUA = """
+local function sliding_window(key, now, window, cap, member)
+  redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+  redis.call('ZADD', key, now, member)
+  local n = redis.call('ZCARD', key)
+  if n > cap then
+    redis.call('ZREMRANGEBYRANK', key, 0, n - cap - 1)
+    n = cap
+  end
+  redis.call('PEXPIRE', key, window)
+  return n
+end
+"""
 
 class SimpleLimiter:
     """
-    Dakika başına max ve burst limiti uygular.
-    Döner: (allowed: bool, need_captcha: bool)
+    Dakika başına max ve burst limiti (Redis, tüm worker'lar ortak).
+    Sayaç _admit içinde _SLIDING_WINDOW_LUA ile artırılır; bu sınıf anahtarı,
+    betik argümanlarını ve sonucun yorumunu tek yerde tutar.
     """
     def __init__(self, window_seconds=60, max_requests=60, burst=80):
         self.window = window_seconds
         self.max = max_requests
         self.burst = burst
 
-    def hit(self, key: str):
-        now = int(time.time())
-        try:
-            with open(RATE_FILE, "r+") as f:
-                data = json.load(f)
-                arr = data.get(key, [])
-                arr = [t for t in arr if t > now - self.window]
-                arr.append(now)
-                data[key] = arr
-                f.seek(0)
-                json.dump(data, f)
-                f.truncate()
-            count = len(arr)
-            if count > self.burst:
-                return (False, True)   # captcha duvarı
-            if count > self.max:
-                return (False, False)  # kısa blok
-            return (True, False)
-        except Exception:
-            return (True, False)
+    def key(self, name: str) -> str:
+        return RATE_KEY_PREFIX + name
+
+    def args(self, now_ms: int) -> list:
+        """sliding_window(window, cap, member) argümanları."""
+        return [self.window * 1000, self.burst + 1, f"{now_ms}-{random.getrandbits(32):x}"]
+
+    def verdict(self, count: int):
+        """Döner: (allowed: bool, need_captcha: bool)"""
+        if count > self.burst:
+            return (False, True)   # captcha duvarı
+        if count > self.max:
+            return (False, False)  # kısa blok
+        return (True, False)
 
 soft_limiter = SimpleLimiter(window_seconds=60, max_requests=60, burst=80)
 
@@ -145,23 +174,103 @@ def _load_blacklist():
 def _norm(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "").strip().lower())
 
+# ---- Derlenmiş kara liste indeksi ----
+# Kaynak config bus ("blacklist"): indeks yalnızca sürüm değişince yeniden derlenir.
+# Sürüm, admin yayınıyla ya da dosya (mtime/size) değişince artar; Redis yoksa dosya
+# damgasıdır. Sorgu O(1) set üyeliği.
+_IG_HOSTS = ("instagram.com", "instagr.am")
+_USERNAME_RE = re.compile(r"[a-z0-9_.]{1,30}")
+_IG_RESERVED_PATHS = {"p", "reel", "reels", "tv", "explore", "accounts", "direct", "about", "legal", "developer"}
+
+_bl_index = {"ver": None, "exact": frozenset(), "links": frozenset(), "users": frozenset()}
+_bl_lock = threading.Lock()
+
+def _canon_link(s: str) -> str:
+    """Şema/www/m., query, fragment ve sondaki / farkını yok sayan link biçimi."""
+    t = _norm(s)
+    if "://" not in t:
+        t = "https://" + t
+    try:
+        pu = urlparse(t)
+    except Exception:
+        return _norm(s)
+    host = (pu.hostname or "")
+    for pre in ("www.", "m."):
+        if host.startswith(pre):
+            host = host[len(pre):]
+    if host == "instagr.am":
+        host = "instagram.com"
+    return f"{host}{pu.path.rstrip('/')}"
+
+def _username_from_target(s: str) -> Optional[str]:
+    """instagram.com/<user>[/...] veya /stories/<user>/... → user; düz kullanıcı adı → kendisi."""
+    t = _norm(s).lstrip("@")
+    if not t:
+        return None
+    if "/" not in t and t not in _IG_HOSTS and not t.startswith("www."):
+        return t if _USERNAME_RE.fullmatch(t) else None
+    c = _canon_link(t)
+    host, _, path = c.partition("/")
+    if host not in _IG_HOSTS:
+        return None
+    parts = [x for x in path.split("/") if x]
+    if not parts:
+        return None
+    if parts[0] == "stories" and len(parts) > 1 and parts[1] != "highlights":
+        return parts[1]
+    if parts[0] in _IG_RESERVED_PATHS or parts[0] == "stories":
+        return None
+    return parts[0] if _USERNAME_RE.fullmatch(parts[0]) else None
+
+def _compile_blacklist(bl: dict) -> dict:
+    exact, links, users = set(), set(), set()
+    for x in bl.get("profiles", []) or []:
+        exact.add(_norm(x))
+        u = _username_from_target(x)
+        if u:
+            users.add(u)
+    for x in bl.get("links", []) or []:
+        exact.add(_norm(x))
+        c = _canon_link(x)
+        links.add(c)
+        host, _, path = c.partition("/")
+        # Profil kök linki (instagram.com/<user>) o kullanıcının tüm içeriğini kapsar
+        if host in _IG_HOSTS and path and "/" not in path:
+            u = _username_from_target(x)
+            if u:
+                users.add(u)
+    return {"exact": frozenset(exact), "links": frozenset(links), "users": frozenset(users)}
+
+def _blacklist_index() -> dict:
+    global _bl_index
+    ver, doc = config_bus.get("blacklist", _load_blacklist, BLACKLIST_PATH)
+    if ver == _bl_index["ver"]:
+        return _bl_index
+    with _bl_lock:
+        if _bl_index["ver"] != ver:
+            comp = _compile_blacklist(doc or {})
+            # okuyucular yarım güncellenmiş indeks görmesin: tek atamada değiştir
+            _bl_index = dict(comp, ver=ver)
+            app.logger.info(f"blacklist index rebuilt: v={ver} {len(comp['exact'])} entries")
+        return _bl_index
+
 def _is_blocked(target: str) -> bool:
     if not target:
         return False
-    bl = _load_blacklist()
-    t = _norm(target)
-    profs = [_norm(x) for x in bl.get("profiles", [])]
-    links  = [_norm(x) for x in bl.get("links", [])]
-    return t in profs or t in links
+    idx = _blacklist_index()
+    if _norm(target) in idx["exact"] or _canon_link(target) in idx["links"]:
+        return True
+    u = _username_from_target(target)
+    return bool(u and u in idx["users"])
 
 def _recaptcha_verify(token: str, remote_ip: str) -> bool:
     if not (RECAPTCHA_SECRET and token):
         return False
     try:
-        r = requests.post(
+        r = cdn_post(
             "https://www.google.com/recaptcha/api/siteverify",
+            read_timeout=10,
             data={"secret": RECAPTCHA_SECRET, "response": token, "remoteip": remote_ip},
-            timeout=10
         )
         j = r.json()
         return bool(j.get("success"))
@@ -181,42 +290,121 @@ def _ensure_not_blacklisted():
         return render_template("policies/blocked.html", target=target), 200
     return None
 
-# --- Güvenli rate-limit sarmalayıcı (MERKEZİ) ---
-def _enforce_rate_limit(suffix: str = ""):
+# --- Tek geçişli kabul (admission) katmanı (MERKEZİ) ---
+# Sıra: gate → kara liste → IP bütçesi (uç nokta başına sabit pencere, eski
+# @limiter.limit karşılığı) → IP+session kayan pencere (soft_limiter).
+# Redis'e giden iki sayaç tek Lua çağrısında, tek round-trip'te değerlendirilir.
+ADMIT_KEY_PREFIX = "iv_adm:"
+# Server-Timing başlığı kabul katmanının iç sürelerini ifşa eder: yalnızca debug'da
+# ya da SERVER_TIMING=1 ile gönderilir
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+_ADMIT_LUA = _SLIDING_WINDOW_LUA + """
+local now, ip_limit, ip_win = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+if ip_limit > 0 then
+  local n = redis.call('INCR', KEYS[1])
+  if n == 1 then redis.call('EXPIRE', KEYS[1], ip_win + 1) end
+  if n > ip_limit then return {1, n} end
+end
+return {2, sliding_window(KEYS[2], now, tonumber(ARGV[4]), tonumber(ARGV[5]), ARGV[6])}
+"""
+_admit_script = None
+
+# Worker başına kontrol süreleri (ms): /_health/admission
+_admit_stats = {}
+_admit_stats_lock = threading.Lock()
+
+def _admit_observe(check: str, ms: float):
+    with _admit_stats_lock:
+        st = _admit_stats.setdefault(check, {"n": 0, "sum_ms": 0.0, "max_ms": 0.0, "denied": 0})
+        st["n"] += 1
+        st["sum_ms"] += ms
+        if ms > st["max_ms"]:
+            st["max_ms"] = ms
+
+def _admit_deny(check: str):
+    with _admit_stats_lock:
+        _admit_stats.setdefault(check, {"n": 0, "sum_ms": 0.0, "max_ms": 0.0, "denied": 0})["denied"] += 1
+
+def _client_ip() -> str:
+    return (request.headers.get("X-Forwarded-For", request.remote_addr) or "0.0.0.0").split(",")[0].strip()
+
+def _rate_limited_response(need_captcha: bool):
+    # Captcha istiyorsak politika duvarını göster (429 ile)
+    if need_captcha:
+        try:
+            return render_template("policies/captcha_wall.html", sitekey=RECAPTCHA_SITE_KEY, next=request.url), 429
+        except Exception:
+            pass
+        return jsonify({"ok": False, "error": "captcha_required"}), 429
+    # Normal rate-limit (kısa blok) → 429
+    return jsonify({"ok": False, "error": "rate_limited"}), 429
+
+def _admit(suffix: str = "", lang: Optional[str] = None, blacklist: bool = False,
+           ip_per_min: int = 0):
     """
-    Tüm rate-limit kontrolleri için tek nokta.
-    HATA OLURSA: 500 yerine devreye girmeden devam etmek için None döndürür.
-    BAŞARILI DURUM: None (devam et)
-    LİMİTE TAKILIRSA: Flask Response döndürür (Captcha duvarı veya 429).
+    Tüm kabul kontrolleri için tek nokta; ilk ihlali döndürür.
+    lang verilirse gate, blacklist=True ise kara liste, ip_per_min>0 ise
+    uç nokta başına IP bütçesi kontrol edilir; IP+session kayan penceresi her zaman.
+    BAŞARILI DURUM / HATA: None (devam et — kullanıcıyı düşürmeyelim).
     """
+    timings = []
+    t0 = time.perf_counter()
+
+    if lang is not None:
+        r = _ensure_gate(lang)
+        ms = (time.perf_counter() - t0) * 1000
+        _admit_observe("gate", ms); timings.append(("gate", ms))
+        if r is not None:
+            _admit_deny("gate")
+            return r
+
+    if blacklist:
+        t1 = time.perf_counter()
+        r = _ensure_not_blacklisted()
+        ms = (time.perf_counter() - t1) * 1000
+        _admit_observe("blacklist", ms); timings.append(("blacklist", ms))
+        if r is not None:
+            _admit_deny("blacklist")
+            return r
+
+    global _admit_script
+    t1 = time.perf_counter()
     try:
-        # Kullanıcıya göre anahtar (IP + session + opsiyonel suffix)
-        ip = (request.headers.get("X-Forwarded-For", request.remote_addr) or "0.0.0.0").split(",")[0].strip()
+        ip = _client_ip()
         sid = session.get("_sid") or request.cookies.get("instavido_session") or "-"
-        key = f"rl:{ip}:{sid}{suffix}"
-
-        allowed, need_captcha = soft_limiter.hit(key)
+        now_ms = int(time.time() * 1000)
+        scope = request.endpoint or "-"
+        ip_key = f"{ADMIT_KEY_PREFIX}ip:{scope}:{request.remote_addr or ip}:{now_ms // 60000}"
+        sess_key = soft_limiter.key(f"rl:{ip}:{sid}{suffix}")
+        if _admit_script is None:
+            _admit_script = _rds().register_script(_ADMIT_LUA)
+        which, n = _admit_script(
+            keys=[ip_key, sess_key],
+            args=[now_ms, int(ip_per_min or 0), 60] + soft_limiter.args(now_ms),
+        )
+        which, n = int(which), int(n)
     except Exception as e:
-        # Herhangi bir hata → limiti es geç (kullanıcıyı düşürmeyelim)
         app.logger.exception("RateLimit bypass (error): %s", e)
         return None
-
-    # İzin verildiyse None döndür (view devam etsin)
-    if allowed:
-        return None
-
-    # Captcha istiyorsak politika duvarını göster (429 ile)
-    if need_captcha:
+    finally:
+        ms = (time.perf_counter() - t1) * 1000
+        _admit_observe("redis", ms); timings.append(("redis", ms))
         try:
-            nxt = request.url
-            return render_template("policies/captcha_wall.html", sitekey=RECAPTCHA_SITE_KEY, next=nxt), 429
+            request.environ["iv.admit_timing"] = timings
         except Exception:
             pass
-        return jsonify({"ok": False, "error": "captcha_required"}), 429
 
-    # Normal rate-limit (kısa blok) → 429
-    return jsonify({"ok": False, "error": "rate_limited"}), 429
-# --- /Güvenli rate-limit sarmalayıcı ---
+    if which == 1:
+        _admit_deny("ip_budget")
+        return jsonify({"ok": False, "error": "rate_limited"}), 429
+    allowed, need_captcha = soft_limiter.verdict(n)
+    if not allowed:
+        _admit_deny("session_budget")
+        return _rate_limited_response(need_captcha)
+    return None
+
+# --- /Tek geçişli kabul katmanı ---
 
 # =============================================================================
 
@@ -298,10 +486,189 @@ limiter = Limiter(
     app=app,
 )
 
+# Session yalnızca içeriği değiştiğinde yazılsın (her istekte TTL yenileyen SET yok)
+app.config["SESSION_REFRESH_EACH_REQUEST"] = False
+
 # os.makedirs(SESSION_DIR, exist_ok=True)
 Session(app)
 app.url_map.strict_slashes = False
 
+# ---- Session'sız yollar ----
+# Proxy/health/robots/static ve imza uçları session'a ihtiyaç duymaz: Redis'ten
+# yüklenmez, kaydedilmez; bu isteklerde geçici (boş) bir session verilir.
+SESSIONLESS_PREFIXES = ("/img_proxy", "/proxy_download", "/robots.txt", "/_health/", "/static/", "/api/sign")
+SESSION_IDLE_SEC        = 900
+SESSION_LAST_BUCKET_SEC = int(os.getenv("SESSION_LAST_BUCKET_SEC", "60"))
+
+def _is_sessionless_path(path: str) -> bool:
+    return (path or "").startswith(SESSIONLESS_PREFIXES)
+
+class _LeanSessionInterface(SessionInterface):
+    """Flask-Session arayüzünü sarar; session'sız yollarda load/save atlanır."""
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        if _is_sessionless_path(request.path):
+            return SecureCookieSession()
+        return self.inner.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if _is_sessionless_path(request.path):
+            return
+        # Flask-Session'ın bazı sürümleri değişmemiş session'ı da her istekte SET eder
+        if not getattr(session, "modified", True) and not app.config.get("SESSION_REFRESH_EACH_REQUEST", True):
+            return
+        return self.inner.save_session(app, session, response)
+
+app.session_interface = _LeanSessionInterface(app.session_interface)
+
+# Session değerleri pickle yerine kompakt JSON (+ opsiyonel zstd); eski pickle kayıtları okunmaya devam eder.
+# SESSION_SERIALIZER=pickle ile Flask-Session varsayılanına dönülür.
+if os.getenv("SESSION_SERIALIZER", "json").lower() != "pickle":
+    session_serializer.install(app.session_interface)
+
+# --- Paylaşımlı Redis cache yardımcıları (session ile aynı bağlantı) ---
+def _rds():
+    return app.config["SESSION_REDIS"]
+
+def _cache_get_json(key: str):
+    """Redis'ten JSON okur; yoksa/hata olursa None."""
+    try:
+        raw = _rds().get(key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+    except Exception as e:
+        app.logger.warning(f"cache get error key={key}: {e}")
+        return None
+
+def _cache_set_json(key: str, value, ttl: int):
+    try:
+        if ttl and ttl > 0:
+            _rds().set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")), ex=int(ttl))
+    except Exception as e:
+        app.logger.warning(f"cache set error key={key}: {e}")
+
+# --- Single-flight: aynı anahtar için worker/node'lar arası tek upstream çağrısı ---
+SF_LOCK_TTL   = 20    # lider bu sürede bitirmezse kilit kendiliğinden düşer
+SF_RESULT_TTL = 15    # bekleyenlerin okuyacağı ortak sonuç
+SF_WAIT_SEC   = 8.0   # bekleyen en fazla bu kadar bekler, sonra kendisi çağırır
+PROFILE_SF_LOCK_TTL = 60    # profil toplama çok aşamalı, kilit daha uzun
+PROFILE_SF_WAIT_SEC = 25.0
+
+_SF_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def _singleflight(name: str, fn, wait: float = SF_WAIT_SEC, lock_ttl: int = SF_LOCK_TTL):
+    """
+    Redis kilidi + sonuç anahtarı ile istek birleştirme.
+    İlk çağıran fn()'i çalıştırıp sonucu yazar; diğerleri sonucu bekler.
+    fn() JSON'a çevrilebilir bir değer döndürmeli. Redis yoksa doğrudan fn().
+    """
+    lock_key = f"iv_sf:lock:{name}"
+    res_key  = f"iv_sf:res:{name}"
+    token = _b64(os.urandom(9))
+    try:
+        leader = bool(_rds().set(lock_key, token, nx=True, px=lock_ttl * 1000))
+    except Exception as e:
+        app.logger.warning(f"singleflight lock error {name}: {e}")
+        return fn()
+
+    if leader:
+        try:
+            val = fn()
+            _cache_set_json(res_key, {"v": val}, SF_RESULT_TTL)
+            return val
+        finally:
+            try:
+                _rds().eval(_SF_RELEASE_LUA, 1, lock_key, token)
+            except Exception:
+                pass
+
+    deadline = time.time() + wait
+    delay = 0.05
+    while time.time() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.4)
+        hit = _cache_get_json(res_key)
+        if isinstance(hit, dict) and "v" in hit:
+            return hit["v"]
+        try:
+            if not _rds().exists(lock_key):
+                # lider sonuç yazamadan bitti (hata) → son bir kez bak, sonra kendimiz deneriz
+                hit = _cache_get_json(res_key)
+                if isinstance(hit, dict) and "v" in hit:
+                    return hit["v"]
+                break
+        except Exception:
+            break
+    app.logger.info(f"singleflight wait timeout/fallback {name}")
+    return fn()
+
+# ---- Sunucu tarafı sonuç deposu (session'da yalnızca kısa id) ----
+# Medya/story çözümleme sonuçları (video_url, image_urls, stories, raw_comments...)
+# iv_res:<rid> altında bir kez yazılır; session'da sadece "res_id" durur.
+# Böylece her istekte (img_proxy dahil) ser/deser edilen session birkaç yüz byte kalır.
+RESULT_PREFIX = "iv_res:"
+RESULT_TTL    = int(os.getenv("RESULT_TTL", "3600"))
+RESULT_KEYS   = ("video_url", "image_urls", "thumbnail_url", "video_title", "raw_comments", "stories")
+
+def _res_store(fields: dict):
+    """Yeni sonuç kaydı oluşturur ve session'a id'sini yazar. Redis yoksa eski usul session'a yazar."""
+    doc = {k: v for k, v in fields.items() if k in RESULT_KEYS}
+    try:
+        rid = _b64(os.urandom(12))
+        _rds().set(RESULT_PREFIX + rid, json.dumps(doc, ensure_ascii=False, separators=(",", ":")), ex=RESULT_TTL)
+        for k in RESULT_KEYS:
+            session.pop(k, None)
+        session["res_id"] = rid
+        g._res_doc = (rid, doc)
+    except Exception as e:
+        app.logger.warning(f"result store write failed, using session: {e}")
+        session.pop("res_id", None)
+        for k, v in doc.items():
+            session[k] = v
+
+def _res_doc() -> dict:
+    rid = session.get("res_id")
+    if not rid:
+        return {}
+    cached = getattr(g, "_res_doc", None)
+    if cached and cached[0] == rid:
+        return cached[1]
+    doc = {}
+    try:
+        pipe = _rds().pipeline(transaction=False)
+        pipe.get(RESULT_PREFIX + rid)
+        pipe.expire(RESULT_PREFIX + rid, RESULT_TTL)
+        raw, _ok = pipe.execute()
+        if raw:
+            doc = json.loads(raw)
+    except Exception:
+        doc = {}
+    g._res_doc = (rid, doc)
+    return doc
+
+def _res_get(key: str, default=None):
+    """Sonuç alanı: önce sonuç deposu, yoksa (eski/yedek) session."""
+    doc = _res_doc()
+    if key in doc:
+        return doc[key]
+    return session.get(key, default)
+
+def _res_clear():
+    for k in RESULT_KEYS + ("res_id",):
+        session.pop(k, None)
+    g.pop("_res_doc", None)
+
 # --- Ads runtime (server-side fallback) ---
 try:
     from ads_manager import ad_html as _ad_func
@@ -411,9 +778,9 @@ def _parse_cookie_kv(raw: str) -> dict:
 
 # >>> MEDIA STATE TEMİZLEYİCİ
 def _clear_media_state():
+    _res_clear()
     for k in [
-        "video_url","image_urls","thumbnail_url","raw_comments","video_title",
-        "stories","username",
+        "username",
         "from_story","from_idx","from_video","from_fotograf","from_reels","from_igtv","from_load",
         "download_error"
     ]:
@@ -421,14 +788,21 @@ def _clear_media_state():
 
 @app.before_request
 def _refresh():
-    session.permanent = True
-    now  = time.time()
-    last = session.get("last", now)
-    if now - last > 900:
+    if _is_sessionless_path(request.path):
+        return
+    now  = int(time.time())
+    last = session.get("last")
+    if last is not None and now - last > SESSION_IDLE_SEC:
         session.clear()
-    session["last"] = now
+        last = None
+    # Değişmeyen değerleri yeniden yazma: session "modified" olmasın
+    if not session.permanent:
+        session.permanent = True
+    # "last" kaba kovalarla güncellenir: en fazla SESSION_LAST_BUCKET_SEC'te bir yazım
+    if last is None or now - last >= SESSION_LAST_BUCKET_SEC:
+        session["last"] = now
     try:
-        if request.cookies.get("age_ok") == "1":
+        if request.cookies.get("age_ok") == "1" and not session.get("gate_passed"):
             session["gate_passed"] = True
     except Exception:
         pass
@@ -548,25 +922,14 @@ def _build_headers(extra: Optional[Dict[str, str]] = None, html: bool=False) ->
         h.update(extra)
     return h
 
-def _http_get(url: str, cookies: Optional[Dict[str, str]]=None, html: bool=False, timeout: int=12):
-    return requests.get(url, headers=_build_headers(html=html), cookies=cookies or {}, timeout=timeout)
+def _http_get(url: str, cookies: Optional[Dict[str, str]]=None, html: bool=False, timeout: int=12,
+              stream: bool=False):
+    return requests.get(url, headers=_build_headers(html=html), cookies=cookies or {}, timeout=timeout,
+                        stream=stream)
 
 
 # === Cookie utils: "key1=val1; key2=val2; ..." metnini dict'e çevirir ===
 
-def _load_sessions_list() -> list:
-    if not os.path.exists(SESSIONS_PATH):
-        return []
-    with open(SESSIONS_PATH, encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except Exception:
-            return []
-
-def _save_sessions_list(lst: list):
-    with open(SESSIONS_PATH, "w", encoding="utf-8") as f:
-        json.dump(lst, f, indent=2, ensure_ascii=False)
-
 def _next_session_key(lst: list) -> str:
     # session_key sayısal string; en büyüğün +1’i
     mx = 0
@@ -615,59 +978,54 @@ def _extract_video_url_from_gql(j: dict) -> Optional[str]:
 
 def _extract_object_from(text: str, key: str) -> Optional[dict]:
     """
-    text içinde '"<key>":{' veya '[' ile başlayan JSON’u
-    parantez sayarak güvenli çıkarır. Döner: { key: ... } sözlüğü.
+    text içinde '"<key>":' ile başlayan JSON obje/dizisini çıkarır
+    (ig_parse.extract_object_from, raw_decode tabanlı). Döner: { key: ... } sözlüğü.
     """
     try:
-        anchor = f'"{key}":'
-        i = text.find(anchor)
-        if i == -1:
-            return None
-        j = i + len(anchor)
-        while j < len(text) and text[j] not in "{[":
-            j += 1
-        if j >= len(text):
-            return None
-        open_char = text[j]
-        close_char = "}" if open_char == "{" else "]"
-        depth, k = 0, j
-        while k < len(text):
-            c = text[k]
-            if c == open_char:
-                depth += 1
-            elif c == close_char:
-                depth -= 1
-                if depth == 0:
-                    blob = text[i:k+1]  # '"key":{...}' veya '"key":[...]'
-                    js = "{" + blob + "}"
-                    js = js.replace("\\u0026", "&").replace("\\/", "/")
-                    return json.loads(js)
-            k += 1
-        return None
+        return ig_parse.extract_object_from(text, key)
     except Exception as ex:
         logging.exception(f"_extract_object_from error: {ex}")
         return None
 
+PROFILE_HTML_CHUNK     = 32 * 1024
+PROFILE_HTML_MAX_BYTES = 8 * 1024 * 1024
+_PROFILE_PIC_HD_RE = re.compile(r'"profile_pic_url_hd"\s*:\s*"([^"]+)"')
+
 def _profile_html_fallback(username: str):
     """
     Cookie yoksa: https://www.instagram.com/<username>/ HTML’inden
-    edge_owner_to_timeline_media’yı brace‑count ile çek.
+    edge_owner_to_timeline_media’yı akış halinde çek; hedefler tamamlanınca
+    bağlantı kapatılır (sayfanın geri kalanı indirilmez).
     Döner: (profile_dict, posts_list, reels_list)
     """
     try:
         url = f"https://www.instagram.com/{username}/"
-        r = _http_get(url, html=True)
-        if r.status_code != 200:
-            return None, [], []
-
-        html = r.text
+        r = _http_get(url, html=True, stream=True)
+        try:
+            if r.status_code != 200:
+                return None, [], []
+            scanner = ig_parse.StreamScanner(
+                keys=["edge_owner_to_timeline_media"],
+                patterns={"avatar": _PROFILE_PIC_HD_RE},
+            )
+            dec = codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+            read = 0
+            for chunk in r.iter_content(PROFILE_HTML_CHUNK):
+                read += len(chunk)
+                if scanner.feed(dec.decode(chunk)) or read > PROFILE_HTML_MAX_BYTES:
+                    break
+            else:
+                scanner.feed(dec.decode(b"", final=True))
+        finally:
+            r.close()
+        app.logger.debug(f"profile html fallback {username}: read={read} done={scanner.done}")
 
         avatar = None
-        mava = re.search(r'"profile_pic_url_hd"\s*:\s*"([^"]+)"', html)
+        mava = scanner.results.get("avatar")
         if mava:
             avatar = mava.group(1).encode('utf-8').decode('unicode_escape')
 
-        obj = _extract_object_from(html, "edge_owner_to_timeline_media")
+        obj = scanner.results.get("edge_owner_to_timeline_media")
         if not obj:
             return None, [], []
 
@@ -727,123 +1085,133 @@ def _profile_html_fallback(username: str):
         logging.exception(f"_profile_html_fallback error for {username}: {ex}")
         return None, [], []
 
+# ---- Username → uid cache (process içi LRU + Redis, negatif kayıtlar kısa ömürlü) ----
+UID_CACHE_PREFIX  = "iv_uid:"
+UID_CACHE_TTL     = int(os.getenv("UID_CACHE_TTL", str(7 * 86400)))
+UID_NEG_CACHE_TTL = int(os.getenv("UID_NEG_CACHE_TTL", "300"))
+UID_LRU_SIZE      = 4096
+
+_uid_lru: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+_uid_lru_lock = threading.Lock()
+
+def _uid_lru_get(key: str):
+    """Döner: (bulundu_mu, uid_or_None)"""
+    with _uid_lru_lock:
+        hit = _uid_lru.get(key)
+        if not hit:
+            return False, None
+        uid, exp = hit
+        if exp < time.time():
+            _uid_lru.pop(key, None)
+            return False, None
+        _uid_lru.move_to_end(key)
+        return True, uid
+
+def _uid_lru_put(key: str, uid: Optional[str], ttl: int):
+    with _uid_lru_lock:
+        _uid_lru[key] = (uid, time.time() + ttl)
+        _uid_lru.move_to_end(key)
+        while len(_uid_lru) > UID_LRU_SIZE:
+            _uid_lru.popitem(last=False)
+
 def _get_uid(username: str) -> Optional[str]:
+    """
+    _get_uid_upstream önüne cache: önce LRU, sonra Redis, en son IG.
+    IG'nin "yok" dediği kullanıcı adları UID_NEG_CACHE_TTL boyunca negatif cache'lenir;
+    sorgu başarısızsa (401/403/429, timeout, login duvarı) hiç cache'lenmez.
+    """
+    key = (username or "").strip().lower()
+    if not key:
+        return None
+
+    found, uid = _uid_lru_get(key)
+    if found:
+        return uid
+
+    cached = _cache_get_json(UID_CACHE_PREFIX + key)
+    if isinstance(cached, dict):
+        uid = cached.get("uid")
+        _uid_lru_put(key, uid, UID_CACHE_TTL if uid else UID_NEG_CACHE_TTL)
+        return uid
+
+    uid, missing = _singleflight(f"uid2:{key}", lambda: _get_uid_upstream(username))
+    if not uid and not missing:
+        return None
+    ttl = UID_CACHE_TTL if uid else UID_NEG_CACHE_TTL
+    _cache_set_json(UID_CACHE_PREFIX + key, {"uid": uid}, ttl)
+    _uid_lru_put(key, uid, ttl)
+    return uid
+
+def _get_uid_upstream(username: str) -> Tuple[Optional[str], bool]:
+    """
+    Döner: (uid, yok_mu). yok_mu yalnızca IG kullanıcının olmadığını açıkça
+    söylediğinde True olur (404 ya da 200 + data.user boş).
+    """
     url = f"https://i.instagram.com/api/v1/users/web_profile_info/?username={username}"
+    missing = False
     for s in _cookie_pool():
         ck = {k: s.get(k, "") for k in ("sessionid", "ds_user_id", "csrftoken")}
         try:
             r = requests.get(url, headers=_build_headers(), cookies=ck, timeout=10)
-            if r.status_code == 200 and "user" in r.text:
-                return r.json()["data"]["user"]["id"]
+            if r.status_code == 404:
+                missing = True
+                break
+            if r.status_code == 200:
+                user = (ig_media.response_json(r).get("data") or {}).get("user")
+                if user and user.get("id"):
+                    return user["id"], False
+                if not user:
+                    missing = True
+                    break
         except Exception:
             continue
     try:
         r = _http_get(f"https://www.instagram.com/{username}/", html=True)
         m = re.search(r'"profilePage_(\d+)"', r.text)
         if m:
-            return m.group(1)
+            return m.group(1), False
+        if r.status_code == 404:
+            missing = True
     except Exception:
         pass
-    return None
+    return None, missing
 
-def _pick_thumb(node: dict, fallback_url: str = "") -> str:
-    """
-    Bir medya düğümünden en iyi küçük resmi çıkartır; çoklu fallback.
-    """
-    if not isinstance(node, dict):
-        return fallback_url or ""
-    # 1) image_versions2.candidates[0].url
-    try:
-        cand = (node.get("image_versions2", {}) or {}).get("candidates") or []
-        if cand and cand[0].get("url"): 
-            return cand[0]["url"]
-    except Exception:
-        pass
-    # 2) additional_candidates.first_frame (video'larda)
-    try:
-        add = (node.get("image_versions2", {}) or {}).get("additional_candidates", {}) or {}
-        if add.get("first_frame"):
-            return add["first_frame"]
-        if add.get("smart_thumbnail"):
-            return add["smart_thumbnail"]
-    except Exception:
-        pass
-    # 3) thumbnail_url
-    if node.get("thumbnail_url"):
-        return node["thumbnail_url"]
-    # 4) display_url (GQL tarafında)
-    if node.get("display_url"):
-        return node["display_url"]
-    # 5) video_versions ilk frame yoksa: video url'i bile olsa göster (son çare)
-    if node.get("video_versions"):
-        return fallback_url or (node["video_versions"][0].get("url") if node["video_versions"] else "") or ""
-    # 6) en sonda fallback param
-    return fallback_url or ""
-
-
-def _normalize_post_item(it: dict) -> Optional[dict]:
-    """
-    Instagram 'feed/user' ya da 'clips/user' itemlerini tek tipe çevirir.
-    Döner: {type, url, thumb, download_url, like_count, comment_count, view_count, timestamp}
-    """
-    if not it:
-        return None
-
-    node = it  # bazı akışlarda it zaten media düğümü
-    # carousel
-    if it.get("media_type") == 8 and it.get("carousel_media"):
-        first = it["carousel_media"][0] or {}
-        if first.get("video_versions"):
-            u = (first["video_versions"][0] or {}).get("url", "")
-            mtype = "video"
-        else:
-            u = (((first.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
-            mtype = "image"
-        thumb = _pick_thumb(first, u)
-    else:
-        if it.get("video_versions"):
-            u = (it["video_versions"][0] or {}).get("url", "")
-            mtype = "video"
-        else:
-            u = (((it.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
-            mtype = "image"
-        thumb = _pick_thumb(it, u)
-
-    # caption
-    cap_txt = ""
-    try:
-        cap = it.get("caption") or {}
-        cap_txt = (cap.get("text") or "").strip()
-    except Exception:
-        pass
-
-    # sayılar
-    like_count = it.get("like_count") or (it.get("like_and_view_counts_disabled") and 0) or it.get("play_count") or 0
-    comment_count = it.get("comment_count") or 0
-    view_count = it.get("view_count") or it.get("play_count") or (like_count if mtype == "video" else 0)
-    ts = it.get("taken_at") or 0
-
-    return {
-        "type": mtype,
-        "url": u,
-        "thumb": thumb or u,  # thumb boş kalmasın
-        "caption": (cap_txt or "")[:160],
-        "download_url": u,
-        "like_count": int(like_count or 0),
-        "comment_count": int(comment_count or 0),
-        "view_count": int(view_count or 0),
-        "timestamp": int(ts or 0)
-    }
+# Medya öğesi → kart dönüşümleri ig_media'da (tablo tabanlı, sayfa başına tek geçiş):
+#   normalize_posts (feed/clips grid), normalize_reels (api_user_reels),
+#   normalize_simple (story / highlight). Upstream JSON: ig_media.response_json.
 
 # ==== Profile pagination state (per visitor, per profile) ====================
 def _pf_key(username: str, kind: str) -> str:
     return f"pf::{username}::{kind}"  # kind = feed | reels | highlights
 
+# Durum iv_pf:<pf_id> hash'inde (alan = pf::<user>::<kind>); session'da yalnızca pf_id.
+PF_STORE_PREFIX = "iv_pf:"
+PF_STORE_TTL    = int(os.getenv("PF_STORE_TTL", "3600"))
+
 def _pf_get(username: str, kind: str):
+    pid = session.get("pf_id")
+    if pid:
+        try:
+            raw = _rds().hget(PF_STORE_PREFIX + pid, _pf_key(username, kind))
+            if raw:
+                return json.loads(raw)
+        except Exception:
+            pass
     return session.get(_pf_key(username, kind)) or {}
 
 def _pf_set(username: str, kind: str, data: dict):
-    session[_pf_key(username, kind)] = data
+    try:
+        pid = session.get("pf_id") or _b64(os.urandom(9))
+        key = PF_STORE_PREFIX + pid
+        pipe = _rds().pipeline(transaction=False)
+        pipe.hset(key, _pf_key(username, kind), json.dumps(data, separators=(",", ":")))
+        pipe.expire(key, PF_STORE_TTL)
+        pipe.execute()
+        if session.get("pf_id") != pid:
+            session["pf_id"] = pid
+        session.pop(_pf_key(username, kind), None)
+    except Exception:
+        session[_pf_key(username, kind)] = data
 
 def _find_session_by_key(sk: str):
     if not sk: return None
@@ -878,7 +1246,7 @@ def _api_json(url: str, s: dict, extra_headers: Optional[Dict[str, str]] = None,
     """
     IG private/web API JSON GET.
     's' -> cookie havuzundan session objesi (sessionid, ds_user_id, csrftoken).
-    200 -> r.json(), 401/403/429 -> soft-fail + dinamik cooldown (geçici block), diğerleri None.
+    200 -> çözülmüş JSON, 401/403/429 -> soft-fail + dinamik cooldown (geçici block), diğerleri None.
     """
     if not url or not s:
         return None
@@ -899,7 +1267,7 @@ def _api_json(url: str, s: dict, extra_headers: Optional[Dict[str, str]] = None,
         if code == 200:
             _clear_soft_fail(ck["sessionid"])
             try:
-                return r.json()
+                return ig_media.response_json(r)
             except Exception:
                 return None
 
@@ -937,22 +1305,14 @@ def _api_json(url: str, s: dict, extra_headers: Optional[Dict[str, str]] = None,
 def _fetch_user_feed_page(uid: str, s: dict, max_id: Optional[str] = None, count: int = 12):
     """
     Önce /feed/user/{uid}/, olmazsa /users/{uid}/feed/ dener ve
-    dönen öğeleri _normalize_post_item ile grid formatına çevirir.
+    dönen öğeleri ig_media.normalize_posts ile grid formatına çevirir.
     """
-    def _norm_items(items):
-        out = []
-        for it in (items or []):
-            n = _normalize_post_item(it)
-            if n:
-                out.append(n)
-        return out
-
     # 1) feed/user
     url1 = f"https://i.instagram.com/api/v1/feed/user/{uid}/?count={count}"
     if max_id: url1 += f"&max_id={max_id}"
     j = _api_json(url1, s)
     if j:
-        items = _norm_items(j.get("items") or [])
+        items = ig_media.normalize_posts(j.get("items"))
         next_max_id = j.get("next_max_id")
         if items:
             return items, next_max_id
@@ -962,7 +1322,7 @@ def _fetch_user_feed_page(uid: str, s: dict, max_id: Optional[str] = None, count
     if max_id: url2 += f"&max_id={max_id}"
     j2 = _api_json(url2, s)
     if j2:
-        items = _norm_items(j2.get("items") or [])
+        items = ig_media.normalize_posts(j2.get("items"))
         next_max_id = j2.get("next_max_id")
         if items:
             return items, next_max_id
@@ -974,22 +1334,13 @@ def _fetch_user_reels_page(uid: str, s: dict, max_id: Optional[str] = None, page
     Reels/Clips için çoklu şema + sağlam paging.
     Döner: (normalized_items, next_max_id)
     """
-    def _norm_list(lst):
-        out = []
-        for it in (lst or []):
-            media = it.get("media") or it.get("item") or it
-            n = _normalize_post_item(media)
-            if n and n["type"] == "video":
-                out.append(n)
-        return out
-
     # 1) clips/user
     url = f"https://i.instagram.com/api/v1/clips/user/?target_user_id={uid}&page_size={page_size}"
     if max_id: url += f"&max_id={max_id}"
     j = _api_json(url, s)
     if j:
         items = (j.get("items") or j.get("clips") or j.get("clip_items") or [])
-        arr = _norm_list(items)
+        arr = ig_media.normalize_posts(items, unwrap=True, videos_only=True)
         nxt = (j.get("paging_info") or {}).get("max_id") or j.get("next_max_id") or j.get("next_id")
         if not nxt and (j.get("paging_info") or {}).get("more_available"):
             nxt = (j.get("paging_info") or {}).get("max_id")
@@ -1001,12 +1352,7 @@ def _fetch_user_reels_page(uid: str, s: dict, max_id: Optional[str] = None, page
     if max_id: url2 += f"&max_id={max_id}"
     j2 = _api_json(url2, s)
     if j2:
-        filt = []
-        for it in (j2.get("items") or []):
-            if (it.get("product_type") or "").lower() == "clips" or bool(it.get("clips_metadata")):
-                n = _normalize_post_item(it)
-                if n and n["type"] == "video":
-                    filt.append(n)
+        filt = ig_media.normalize_posts(j2.get("items"), videos_only=True, clips_only=True)
         nxt = j2.get("next_max_id") or j2.get("max_id") or (j2.get("paging_info") or {}).get("max_id")
         if filt:
             return filt, nxt
@@ -1029,13 +1375,9 @@ def _fetch_user_feed(uid: str, limit: int = 24) -> List[dict]:
             j = _api_json(url, s)
             if not j:
                 continue
-            items = j.get("items") or []
-            for it in items:
-                norm = _normalize_post_item(it)
-                if norm:
-                    collected.append(norm)
-                if len(collected) >= limit:
-                    return collected[:limit]
+            collected += ig_media.normalize_posts(j.get("items"), limit=limit - len(collected))
+            if len(collected) >= limit:
+                return collected[:limit]
             max_id = j.get("next_max_id")
             if not max_id:
                 return collected[:limit]
@@ -1062,13 +1404,10 @@ def _fetch_user_reels(uid: str, limit: int = 24) -> List[dict]:
                 continue
 
             items = j.get("items") or j.get("clips") or j.get("clip_items") or []
-            for it in items:
-                media = it.get("media") or it.get("item") or it
-                norm = _normalize_post_item(media)
-                if norm and norm["type"] == "video":
-                    collected.append(norm)
-                if len(collected) >= limit:
-                    return collected[:limit]
+            collected += ig_media.normalize_posts(items, unwrap=True, videos_only=True,
+                                                  limit=limit - len(collected))
+            if len(collected) >= limit:
+                return collected[:limit]
 
             next_max_id = j.get("paging_info", {}).get("max_id") or j.get("next_max_id")
             if not next_max_id:
@@ -1077,18 +1416,118 @@ def _fetch_user_reels(uid: str, limit: int = 24) -> List[dict]:
 
     return collected[:limit]
 
+# ---- Profil snapshot cache (bölüm bazlı TTL + stale-while-revalidate) ----
+PROFILE_SNAP_PREFIX   = "iv_prof:"
+PROFILE_SNAP_HARD_TTL = int(os.getenv("PROFILE_SNAP_HARD_TTL", str(24 * 3600)))  # bundan eskisi hiç sunulmaz
+PROFILE_SECTION_TTL = {
+    "header":     3600,
+    "feed":       600,
+    "reels":      600,
+    "stories":    120,
+    "highlights": 3600,
+}
+PROFILE_REFRESH_LOCK_TTL = 90
+
 def _get_profile_data(username: str):
     """
     Profil üst bilgileri + ilk medya sayfaları (post & reels) + stories + highlights.
+    Cache'te snapshot varsa hemen döner; süresi geçen bölümler arka planda yenilenir.
+    Snapshot yoksa aynı profil için eşzamanlı istekler tek upstream turunda birleştirilir.
     """
-    uid = _get_uid(username)
+    key = (username or "").strip().lower()
+    snap = _cache_get_json(PROFILE_SNAP_PREFIX + key)
+    if isinstance(snap, dict) and all(k in (snap.get("sections") or {}) for k in PROFILE_SECTION_TTL):
+        stale = _profile_stale_sections(snap)
+        if stale:
+            _profile_refresh_async(username, stale)
+    else:
+        snap = _singleflight(f"profile:{key}", lambda: _build_profile(username),
+                             wait=PROFILE_SF_WAIT_SEC, lock_ttl=PROFILE_SF_LOCK_TTL) or {}
+    return _apply_profile(username, _assemble_profile(username, snap))
+
+def _apply_profile(username: str, out: dict):
+    """_assemble_profile çıktısındaki sayfalama ve kullanılan cookie bilgisini session'a yazar."""
+    for kind, st in (out.get("pf") or {}).items():
+        _pf_set(username, kind, st)
+    for sk in (out.get("used_keys") or []):
+        _set_used_session_by_key(sk)
+    return out.get("profile"), out.get("sections")
+
+def _profile_stale_sections(snap: dict) -> List[str]:
+    now = time.time()
+    secs = snap.get("sections") or {}
+    return [name for name, ttl in PROFILE_SECTION_TTL.items()
+            if now - float((secs.get(name) or {}).get("ts") or 0) > ttl]
+
+def _profile_refresh_async(username: str, stale: List[str]):
+    """Süresi geçmiş bölümleri arka planda yeniler; cluster genelinde tek yenileyici."""
+    key = (username or "").strip().lower()
+    lock_key = f"iv_prof_lock:{key}"
+    try:
+        if not _rds().set(lock_key, "1", nx=True, ex=PROFILE_REFRESH_LOCK_TTL):
+            return
+    except Exception:
+        return
 
-    user = None
-    profile = None
-    posts, reels, stories, highlights = [], [], [], []
+    def _run():
+        try:
+            base = _cache_get_json(PROFILE_SNAP_PREFIX + key) or {}
+            _build_profile(username, only=stale, base=base)
+        except Exception:
+            app.logger.exception(f"profile refresh error {username}")
+        finally:
+            try:
+                _rds().delete(lock_key)
+            except Exception:
+                pass
 
-    # USER INFO
+    threading.Thread(target=_run, name=f"prof-refresh-{key}", daemon=True).start()
+
+def _build_profile(username: str, only: Optional[List[str]] = None, base: Optional[dict] = None) -> dict:
+    """
+    Session'a dokunmadan profil bölümlerini toplar ve snapshot'ı Redis'e yazar.
+    only verilirse yalnızca o bölümler yenilenir, diğerleri base'den kopyalanır.
+    Döner: {"uid", "sections": {ad: {"ts", "data"}}}
+    """
+    key = (username or "").strip().lower()
+    uid = _get_uid(username)
     pool = _cookie_pool()
+    sections = dict((base or {}).get("sections") or {})
+
+    builders = {
+        "header":     lambda: _profile_section_header(username, pool),
+        "feed":       lambda: _profile_section_feed(username, uid, pool),
+        "reels":      lambda: _profile_section_reels(uid, pool),
+        "stories":    lambda: _profile_section_stories(uid),
+        "highlights": lambda: _profile_section_highlights(uid),
+    }
+    for name, build in builders.items():
+        if only is not None and name in sections and name not in only:
+            continue
+        try:
+            sections[name] = {"ts": time.time(), "data": build()}
+        except Exception as e:
+            # Yenilemede eski bölüm (ve eski ts'i) korunur: rate-limit dalgası
+            # iyi veriyi boşla ezmesin; bölüm bayat kaldığı için tekrar denenir.
+            if isinstance(e, _SectionUnavailable):
+                app.logger.info(f"profile section {name} unavailable for {username}: {e}")
+            else:
+                app.logger.exception(f"profile section {name} error for {username}")
+            sections.setdefault(name, {"ts": 0, "data": {}})
+
+    snap = {"uid": uid, "sections": sections}
+    # Hiçbir şey bulunamadıysa (uid yok, header yok, post yok) cache'leme
+    feed = sections.get("feed", {}).get("data") or {}
+    header = sections.get("header", {}).get("data") or {}
+    if uid or header.get("profile") or feed.get("items"):
+        _cache_set_json(PROFILE_SNAP_PREFIX + key, snap, PROFILE_SNAP_HARD_TTL)
+    return snap
+
+class _SectionUnavailable(Exception):
+    """Bölüm upstream'den alınamadı (boş sonuç doğrulanamadı); _build_profile eskisini korur."""
+
+def _profile_section_header(username: str, pool: list) -> dict:
+    user = None
     if pool:
         try:
             url = f"https://i.instagram.com/api/v1/users/web_profile_info/?username={username}"
@@ -1099,80 +1538,108 @@ def _get_profile_data(username: str):
                     break
         except Exception:
             user = None
-
-    if user:
-        profile = {
-            "username": user.get("username"),
-            "full_name": user.get("full_name") or "",
-            "avatar": user.get("profile_pic_url_hd") or user.get("profile_pic_url"),
-            "followers": user.get("edge_followed_by", {}).get("count", 0),
-            "following": user.get("edge_follow", {}).get("count", 0),
-            "posts_count": user.get("edge_owner_to_timeline_media", {}).get("count", 0),
-            "bio": (user.get("biography") or "").strip(),
-            "external_url": user.get("external_url") or f"https://instagram.com/{user.get('username','')}"
-        }
-
-    # İlk sayfa: FEED & REELS (çalışan cookie'yi bul ve pinle)
+    if not user:
+        raise _SectionUnavailable("no web_profile_info")
+    return {"profile": {
+        "username": user.get("username"),
+        "full_name": user.get("full_name") or "",
+        "avatar": user.get("profile_pic_url_hd") or user.get("profile_pic_url"),
+        "followers": user.get("edge_followed_by", {}).get("count", 0),
+        "following": user.get("edge_follow", {}).get("count", 0),
+        "posts_count": user.get("edge_owner_to_timeline_media", {}).get("count", 0),
+        "bio": (user.get("biography") or "").strip(),
+        "external_url": user.get("external_url") or f"https://instagram.com/{user.get('username','')}"
+    }}
+
+def _profile_section_feed(username: str, uid: Optional[str], pool: list) -> dict:
+    """İlk feed sayfası (çalışan cookie pinlenir); boşsa HTML fallback sonucu da saklanır."""
+    out = {"items": [], "pf": None, "used_key": None}
     if uid and pool:
-        # FEED
-        feed_items, feed_next, feed_sk = [], None, None
         for s in pool:
             try:
                 items, nxt = _fetch_user_feed_page(uid, s, max_id=None, count=12)
                 if items:
-                    feed_items, feed_next, feed_sk = items, nxt, s.get("session_key")
-                    break
-            except Exception:
-                continue
-        if feed_items:
-            posts = feed_items
-            _set_used_session_by_key(feed_sk)
-            _pf_set(username, "feed", {"session_key": feed_sk, "next_max_id": feed_next})
-        else:
-            _pf_set(username, "feed", {"session_key": None, "next_max_id": None})
-
-        # REELS
-        reels_items, reels_next, reels_sk = [], None, None
-        for s in pool:
-            try:
-                items, nxt = _fetch_user_reels_page(uid, s, max_id=None, page_size=12)
-                if items:
-                    reels_items, reels_next, reels_sk = items, nxt, s.get("session_key")
+                    out.update(items=items, used_key=s.get("session_key"),
+                               pf={"session_key": s.get("session_key"), "next_max_id": nxt})
                     break
             except Exception:
                 continue
-        if reels_items:
-            reels = reels_items
-            _set_used_session_by_key(reels_sk)
-            _pf_set(username, "reels", {"session_key": reels_sk, "next_max_id": reels_next})
-        else:
-            _pf_set(username, "reels", {"session_key": None, "next_max_id": None})
+        if not out["items"]:
+            out["pf"] = {"session_key": None, "next_max_id": None}
 
     # Fallback HTML (hala boşsa)
-    if not posts:
+    if not out["items"]:
         prof_fb, posts_fb, reels_fb = _profile_html_fallback(username)
-        if prof_fb and not profile:
-            profile = prof_fb
-        posts = posts or posts_fb
-        reels = reels or reels_fb
-
-    # STORIES
-    if uid:
-        st_raw, _sess = _get_stories(uid)
-        if _sess:
-            _set_used_session(_sess)
-        if st_raw:
-            for it in st_raw:
-                stories.append({
-                    "type": it.get("type"),
-                    "url": it.get("media_url"),
-                    "thumb": it.get("thumb"),
-                    "caption": ""
-                })
-
-    # HIGHLIGHTS
-    if uid:
-        highlights = _get_highlights(uid) or []
+        if not prof_fb:
+            raise _SectionUnavailable("feed api and html fallback failed")
+        out.update(items=posts_fb or [], fb_profile=prof_fb, fb_reels=reels_fb or [])
+    return out
+
+def _profile_section_reels(uid: Optional[str], pool: list) -> dict:
+    out = {"items": [], "pf": None, "used_key": None}
+    if not (uid and pool):
+        return out
+    for s in pool:
+        try:
+            items, nxt = _fetch_user_reels_page(uid, s, max_id=None, page_size=12)
+            if items:
+                out.update(items=items, used_key=s.get("session_key"),
+                           pf={"session_key": s.get("session_key"), "next_max_id": nxt})
+                return out
+        except Exception:
+            continue
+    # clips uçları "reels yok" ile "hata"yı ayırmıyor: boş sonuç doğrulanmış sayılmaz
+    raise _SectionUnavailable("no reels page")
+
+def _profile_section_stories(uid: Optional[str]) -> dict:
+    out = {"items": [], "used_key": None}
+    if not uid:
+        return out
+    st_raw, _sess = _get_stories(uid, empty_ok=True)
+    if not _sess:
+        raise _SectionUnavailable("stories upstream failed")
+    out["used_key"] = _sess.get("session_key")
+    for it in (st_raw or []):
+        out["items"].append({
+            "type": it.get("type"),
+            "url": it.get("media_url"),
+            "thumb": it.get("thumb"),
+            "caption": ""
+        })
+    return out
+
+def _profile_section_highlights(uid: Optional[str]) -> dict:
+    if not uid:
+        return {"items": []}
+    items, used_key = _get_highlights(uid)
+    if not used_key:
+        raise _SectionUnavailable("highlights tray failed")
+    return {"items": items or []}
+
+def _assemble_profile(username: str, snap: dict) -> dict:
+    """
+    Snapshot bölümlerinden şablonun beklediği (profile, sections) yapısını kurar.
+    Döner: {"profile", "sections", "pf": {kind: state}, "used_keys": [...]}
+    """
+    secs = snap.get("sections") or {}
+
+    def data(name: str) -> dict:
+        return (secs.get(name) or {}).get("data") or {}
+
+    header, feed, reel, story = data("header"), data("feed"), data("reels"), data("stories")
+
+    posts = feed.get("items") or []
+    reels = reel.get("items") or feed.get("fb_reels") or []
+    profile = header.get("profile") or feed.get("fb_profile")
+
+    pf, used_keys = {}, []
+    for kind, sec in (("feed", feed), ("reels", reel)):
+        if sec.get("pf"):
+            pf[kind] = sec["pf"]
+        if sec.get("used_key"):
+            used_keys.append(sec["used_key"])
+    if story.get("used_key"):
+        used_keys.append(story["used_key"])
 
     if not profile:
         profile = {
@@ -1188,11 +1655,11 @@ def _get_profile_data(username: str):
 
     sections = {
         "posts": posts,
-        "stories": stories,
-        "highlights": highlights,
+        "stories": story.get("items") or [],
+        "highlights": data("highlights").get("items") or [],
         "reels": reels or [i for i in posts if i.get("type") == "video"]
     }
-    return profile, sections
+    return {"profile": profile, "sections": sections, "pf": pf, "used_keys": used_keys}
 
 
 def _set_used_session_by_key(sk: Optional[str]):
@@ -1206,30 +1673,15 @@ def _set_used_session_by_key(sk: Optional[str]):
 #  STORY İşlevleri                                                            #
 # --------------------------------------------------------------------------- #
 
-def _get_stories(uid: str):
+def _get_stories(uid: str, empty_ok: bool = False):
     """
     Kullanıcının aktif story'lerini çeker.
+    empty_ok: 200 + boş liste gelirse diğer cookie'leri denemeden ([], session) döner
+    (story'si olmayan profil ile upstream hatasını ayırmak için).
     Thumb için güçlü fallback:
       - image_versions2.candidates[0].url
       - image_versions2.additional_candidates.first_frame (poster)
     """
-    def _first_image(it: dict) -> str:
-        # 1) standart candidate
-        try:
-            cands = (it.get("image_versions2", {}).get("candidates") or [])
-            if cands:
-                u = (cands[0] or {}).get("url", "")
-                if u: return u
-        except Exception:
-            pass
-        # 2) video poster / first_frame
-        try:
-            u = it.get("image_versions2", {}).get("additional_candidates", {}).get("first_frame", "")
-            if u: return u
-        except Exception:
-            pass
-        return ""
-
     pool = _cookie_pool()
     pool_len = len(pool)
     if pool_len == 0 or not uid:
@@ -1267,7 +1719,7 @@ def _get_stories(uid: str):
             try:
                 r = requests.get(url, headers=headers, cookies=ck, timeout=10)
                 if r.status_code == 200:
-                    j = r.json()
+                    j = ig_media.response_json(r)
                     items = []
                     if "reels_media" in j:
                         rm = (j.get("reels_media") or [])
@@ -1277,32 +1729,11 @@ def _get_stories(uid: str):
                         items = j.get("items", []) or []
 
                     if not items:
+                        if empty_ok:
+                            return [], s
                         continue
 
-                    stories = []
-                    for it in items:
-                        thumb = _first_image(it)
-
-                        if it.get("video_versions"):
-                            media_url = (it["video_versions"][0] or {}).get("url", "")
-                            typ = "video"
-                            # thumb hâlâ boşsa tekrar deneriz (güvence)
-                            if not thumb:
-                                thumb = _first_image(it)
-                        elif it.get("image_versions2"):
-                            media_url = ((it.get("image_versions2", {}).get("candidates") or [{}])[0]).get("url", "")
-                            typ = "image"
-                        else:
-                            continue
-
-                        if not media_url:
-                            continue
-
-                        stories.append({
-                            "media_url": media_url,
-                            "thumb": thumb,
-                            "type": typ
-                        })
+                    stories = ig_media.normalize_simple(items, "story")
 
                     if stories:
                         try:
@@ -1340,30 +1771,14 @@ def _get_stories(uid: str):
 def _get_highlights(uid: str):
     """
     Kullanıcının highlight tray listesini alır ve her highlight içinden ilk ~3 medyayı toplar.
+    Döner: (items, tray'i alan session_key | None — None ise upstream başarısız).
     Thumb için güçlü fallback:
       - image_versions2.candidates[0].url
       - image_versions2.additional_candidates.first_frame
     """
-    def _pick_thumb(node: dict) -> str:
-        # 1) standart candidate
-        try:
-            cands = (node.get("image_versions2", {}).get("candidates") or [])
-            if cands:
-                u = (cands[0] or {}).get("url", "")
-                if u: return u
-        except Exception:
-            pass
-        # 2) video poster / first_frame
-        try:
-            u = node.get("image_versions2", {}).get("additional_candidates", {}).get("first_frame", "")
-            if u: return u
-        except Exception:
-            pass
-        return ""
-
     pool = _cookie_pool()
     if not pool or not uid:
-        return []
+        return [], None
 
     tray_url = f"https://i.instagram.com/api/v1/highlights/{uid}/highlights_tray/"
     items_all = []
@@ -1377,8 +1792,8 @@ def _get_highlights(uid: str):
         }
         try:
             r = requests.get(tray_url, headers=_build_headers(), cookies=ck, timeout=10)
-            if r.status_code == 200 and "tray" in r.text:
-                tray = (r.json().get("tray") or [])[:12]
+            if r.status_code == 200 and b'"tray"' in r.content:
+                tray = (ig_media.response_json(r).get("tray") or [])[:12]
                 used_session_key = s.get("session_key")
                 for t in tray:
                     hid = t.get("id") or t.get("reel_id")
@@ -1388,30 +1803,11 @@ def _get_highlights(uid: str):
                     try:
                         rr = requests.get(rm_url, headers=_build_headers(), cookies=ck, timeout=10)
                         if rr.status_code == 200:
-                            j = rr.json()
+                            j = ig_media.response_json(rr)
                             reels_media = (j.get("reels_media") or [])
                             if not reels_media:
                                 continue
-                            media_items = (reels_media[0].get("items") or [])[:3]
-                            for it in media_items:
-                                thumb = _pick_thumb(it)
-                                if it.get("video_versions"):
-                                    media_url = (it["video_versions"][0] or {}).get("url", "")
-                                    typ = "video"
-                                    if not thumb:
-                                        thumb = _pick_thumb(it)
-                                elif it.get("image_versions2"):
-                                    media_url = ((it.get("image_versions2", {}).get("candidates") or [{}])[0]).get("url", "")
-                                    typ = "image"
-                                else:
-                                    continue
-                                if not media_url:
-                                    continue
-                                items_all.append({
-                                    "type": typ,
-                                    "url": media_url,
-                                    "thumb": thumb
-                                })
+                            items_all += ig_media.normalize_simple(reels_media[0].get("items"), "highlight", limit=3)
                     except Exception:
                         continue
                 break
@@ -1424,7 +1820,7 @@ def _get_highlights(uid: str):
                 f.write(used_session_key)
         except Exception:
             pass
-    return items_all
+    return items_all, used_session_key
 
 
 def test_sessions():
@@ -1461,25 +1857,30 @@ def _gql_url(sc: str):
     return ("https://www.instagram.com/graphql/query/"
             f"?doc_id=8845758582119845&variables={v}")
 
-def _process_media(j: dict):
+def _parse_media(j: dict) -> Optional[dict]:
+    """
+    GraphQL shortcode_media yanıtını session'dan bağımsız, normalize edilmiş
+    sonuca çevirir: video_url, image_urls, thumbnail_url, video_title, raw_comments.
+    """
     info = (
         j.get("data",{}).get("xdt_shortcode_media")
         or j.get("data",{}).get("shortcode_media") or {}
     )
     if not info:
-        return False
+        return None
 
     typ = info.get("__typename","").lower()
     vurl, iurls = None, []
+    res = {}
 
     if typ.endswith("video"):
         vurl = info.get("video_url") or (info.get("video_resources") or [{}])[0].get("src")
-        session["video_url"] = vurl
+        res["video_url"] = vurl
     elif typ.endswith("image"):
         img = info.get("display_url") or (info.get("display_resources") or [{}])[-1].get("src")
         if img and not img.endswith(".heic"):
             iurls = [img]
-        session["image_urls"] = iurls
+        res["image_urls"] = iurls
     elif "sidecar" in typ:
         for edge in info.get("edge_sidecar_to_children",{}).get("edges",[]):
             node = edge.get("node",{})
@@ -1489,10 +1890,10 @@ def _process_media(j: dict):
                 iu = node.get("display_url") or (node.get("display_resources") or [{}])[-1].get("src")
                 if iu and not iu.endswith(".heic"):
                     iurls.append(iu)
-        session["video_url"]  = vurl
-        session["image_urls"] = iurls
+        res["video_url"]  = vurl
+        res["image_urls"] = iurls
 
-    session["thumbnail_url"] = (
+    res["thumbnail_url"] = (
         info.get("thumbnail_src")
         or (info.get("display_resources") or [{}])[0].get("src")
     )
@@ -1500,15 +1901,59 @@ def _process_media(j: dict):
         (info.get("edge_media_to_caption",{}).get("edges") or [{}])[0]
         .get("node",{}).get("text","")
     ) or info.get("owner",{}).get("username") or "instagram"
-    title = re.sub(r'[^a-zA-Z0-9_\-]', '_', raw_title)[:50]
-    session["video_title"] = title
+    res["video_title"] = re.sub(r'[^a-zA-Z0-9_\-]', '_', raw_title)[:50]
 
     comments = [
         f"{e['node']['owner']['username']}: {e['node']['text']}"
         for e in info.get("edge_media_to_parent_comment",{}).get("edges",[])
     ]
-    session["raw_comments"] = json.dumps(comments[:40])
-    return bool(session.get("video_url") or session.get("image_urls"))
+    res["raw_comments"] = json.dumps(comments[:40])
+    return res
+
+def _apply_media(res: dict) -> bool:
+    """_parse_media sonucunu sonuç deposuna yazar (session'da yalnızca res_id)."""
+    _res_store(res)
+    return bool(res.get("video_url") or res.get("image_urls"))
+
+# ---- Shortcode → medya sonucu cache'i (Redis, CDN 'oe' süresine göre TTL) ----
+MEDIA_CACHE_PREFIX      = "iv_media:"
+MEDIA_CACHE_DEFAULT_TTL = int(os.getenv("MEDIA_CACHE_DEFAULT_TTL", "900"))
+MEDIA_CACHE_MAX_TTL     = int(os.getenv("MEDIA_CACHE_MAX_TTL", str(6 * 3600)))
+MEDIA_CACHE_SAFETY_SEC  = 600   # CDN linki bitmeden bu kadar önce düşür
+MEDIA_CACHE_MIN_TTL     = 60
+
+def _cdn_expiry(url: str) -> Optional[int]:
+    """fbcdn/cdninstagram URL'lerindeki 'oe' (hex epoch) parametresini döndürür."""
+    if not url:
+        return None
+    m = re.search(r"[?&]oe=([0-9A-Fa-f]{6,16})(?:&|$)", url)
+    if not m:
+        return None
+    try:
+        return int(m.group(1), 16)
+    except ValueError:
+        return None
+
+def _media_cache_ttl(res: dict) -> int:
+    urls = [res.get("video_url"), res.get("thumbnail_url")] + list(res.get("image_urls") or [])
+    exps = [e for e in (_cdn_expiry(u) for u in urls if u) if e]
+    if not exps:
+        return MEDIA_CACHE_DEFAULT_TTL
+    ttl = min(exps) - int(time.time()) - MEDIA_CACHE_SAFETY_SEC
+    return max(0, min(ttl, MEDIA_CACHE_MAX_TTL))
+
+def _media_cache_get(sc: str) -> Optional[dict]:
+    if not sc:
+        return None
+    return _cache_get_json(MEDIA_CACHE_PREFIX + sc)
+
+def _media_cache_set(sc: str, res: dict):
+    if not (sc and res and (res.get("video_url") or res.get("image_urls"))):
+        return
+    ttl = _media_cache_ttl(res)
+    if ttl < MEDIA_CACHE_MIN_TTL:
+        return
+    _cache_set_json(MEDIA_CACHE_PREFIX + sc, res, ttl)
 
 def _fetch_media(gql: str):
     """
@@ -1548,7 +1993,7 @@ def _fetch_media(gql: str):
                         f.write(s.get("session_key", ""))
                 except Exception:
                     pass
-                return r.json(), s
+                return ig_media.response_json(r), s
             else:
                 if r.status_code in (401, 403):
                     block_session(ck["sessionid"])
@@ -1577,6 +2022,17 @@ def _fetch_media(gql: str):
 #  Flow Yardımcısı                                                            #
 # --------------------------------------------------------------------------- #
 
+def _resolve_media(sc: str) -> dict:
+    """
+    Upstream'den çöz + cache'e yaz. Single-flight ile paylaşıldığı için
+    session'a dokunmaz. Döner: {"media": dict|None, "sessionid": str}
+    """
+    data, used_session = _fetch_media(_gql_url(sc))
+    res = _parse_media(data) if data else None
+    if res:
+        _media_cache_set(sc, res)
+    return {"media": res, "sessionid": (used_session or {}).get("sessionid", "") if res else ""}
+
 def _media_flow(template: str, flag: str, lang=None):
     try:
         _clear_media_state()
@@ -1591,12 +2047,20 @@ def _media_flow(template: str, flag: str, lang=None):
         if not sc:
             return render_template(template, error=_("Enter a valid Instagram link."), lang=lang)
 
-        data, used_session = _fetch_media(_gql_url(sc))
-        if not data or not _process_media(data):
-            return render_template(template, error=_("Media could not be retrieved, please try again."), lang=lang)
+        # Önceki akıştan kalan çerez bu indirmeye yazılmasın: yalnızca bu akışta
+        # gerçekten kullanılan IG oturumu kaydedilir (cache hit'te hiçbiri)
+        session.pop("sessionid", None)
+        res = _media_cache_get(sc)
+        if res:
+            app.logger.debug(f"media cache hit sc={sc}")
+        else:
+            out = _singleflight(f"media:{sc}", lambda: _resolve_media(sc)) or {}
+            res = out.get("media")
+            if res and out.get("sessionid"):
+                session["sessionid"] = out["sessionid"]
 
-        if used_session:
-            session["sessionid"] = used_session.get("sessionid", "")
+        if not res or not _apply_media(res):
+            return render_template(template, error=_("Media could not be retrieved, please try again."), lang=lang)
 
         session[flag] = True
         return redirect(url_for("loading", lang=lang))
@@ -1700,7 +2164,7 @@ def index(lang=None):
                                        error=_("No active story found."),
                                        lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -1733,11 +2197,7 @@ def catch_all_root(path):
 @app.route("/loading", defaults={"lang": "en"})
 @app.route("/<lang>/loading")
 def loading(lang):
-    r = _ensure_gate(lang)
-    if r: return r
-    r = _ensure_not_blacklisted()
-    if r: return r
-    r = _enforce_rate_limit(suffix=":loading")
+    r = _admit(suffix=":loading", lang=lang, blacklist=True)
     if r is not None:
         return r
 
@@ -1763,21 +2223,12 @@ def loading(lang):
 
 @app.route("/download", defaults={"lang": "en"})
 @app.route("/<lang>/download")
-@limiter.limit("20 per minute")
 def download(lang):
     # --- GATE / BLACKLIST / RATE-LIMIT KONTROLLERİ --- #
-    r = _ensure_gate(lang)
-    if r is not None:
-        return r
-
-    r = _ensure_not_blacklisted()
-    if r is not None:
-        return r
-
-    # NOT: _enforce_rate_limit() mutlaka "None" (devam) veya
+    # NOT: _admit() mutlaka "None" (devam) veya
     # bir Flask Response/dict/redirect döndürmeli. True/False döndürürse
     # Flask "bool döndü" hatası verir (TypeError).
-    r = _enforce_rate_limit(suffix=":download")
+    r = _admit(suffix=":download", lang=lang, blacklist=True, ip_per_min=20)
     if r is not None:
         return r
     # --- /KONTROLLER --- #
@@ -1806,16 +2257,16 @@ def download(lang):
 
             # --- LOG: profil görüntüleme/indirme bildirimi (ayrı try ile güvenli) ---
             try:
-                sessid = session.get("sessionid", "")
-                actor  = session.get("user", "")  # sessions.json’daki "user" etiketi
-                if sessid or actor:
-                    log_session_use(sessid, "success")
-                    notify_download(actor)
-                    if sessid:
-                        update_session_counters(sessid, "success")
+                # sessions.json’daki "user" etiketi; kayıt arka planda yazılır
+                record_download(session.get("sessionid", ""), session.get("user", ""))
             except Exception:
                 app.logger.exception("profile log error")
 
+            # İlk render'daki kartlar da imzalı gelsin (client /api/sign çağırmasın)
+            uname = profile.get("username") or pending
+            sections = dict(sections or {})
+            for k in ("posts", "stories", "reels"):
+                sections[k] = _presign_items(sections.get(k) or [], uname)
             return render_template("profile.html", profile=profile, sections=sections, lang=lang)
 
         except Exception:
@@ -1829,51 +2280,33 @@ def download(lang):
             )
 
     # --- Eski davranış: Hikaye / tekil medya indirme ekranı ---
-    sessionid = session.get("sessionid", "")
-    username = session.get("username", "") or session.get("user", "")
-
-    # Username yoksa sessionid'den bulmayı dene (loglar için)
-    if not username and sessionid:
-        try:
-            with open(SESSIONS_PATH, encoding="utf-8") as f:
-                all_sessions = json.load(f)
-            for s in all_sessions:
-                if s.get("sessionid") == sessionid:
-                    username = s.get("user", "")
-                    break
-        except Exception:
-            pass
-
-    # Başarılı akış logları
-    if sessionid or username:
-        try:
-            log_session_use(sessionid, "success")
-            notify_download(username)
-            if sessionid:
-                update_session_counters(sessionid, "success")
-        except Exception:
-            app.logger.exception("download log error")
+    # Başarılı akış logları (arka planda; username yoksa sessionid'den bulunur)
+    try:
+        record_download(session.get("sessionid", ""),
+                        session.get("username", "") or session.get("user", ""))
+    except Exception:
+        app.logger.exception("download log error")
 
     # Eğer story listesi varsa story_list.html'ü bas
-    if session.get("stories"):
+    if _res_get("stories"):
         return render_template(
             "story_list.html",
-            stories=session["stories"],
+            stories=_res_get("stories"),
             username=session.get("username", ""),
             lang=lang
         )
 
     # Tekil medya (video / foto) verilerini hazırla
-    vurl   = session.get("video_url")
-    imgs   = session.get("image_urls", []) or []
-    poster = session.get("thumbnail_url", "")  # poster/thumbnail
+    vurl   = _res_get("video_url")
+    imgs   = _res_get("image_urls", []) or []
+    poster = _res_get("thumbnail_url", "")  # poster/thumbnail
 
     # --- İndirilebilirler listesini oluştur ---
     downloads = []
 
     # Video → imzalı proxy indir (tarayıcıda açılmaz, direkt indirilir)
     if vurl:
-        safe_fn = (session.get("video_title") or "instavido").strip() or "instavido"
+        safe_fn = (_res_get("video_title") or "instavido").strip() or "instavido"
         downloads.append({
             "url":   sign_media_proxy(vurl, fn=safe_fn),  # /proxy_download?...sig=...
             "label": _("MP4"),
@@ -1897,7 +2330,7 @@ def download(lang):
     }
 
     # Yorumlar
-    raw_comments = session.get("raw_comments")
+    raw_comments = _res_get("raw_comments")
     try:
         comments = json.loads(raw_comments) if raw_comments else []
     except Exception:
@@ -1914,16 +2347,52 @@ def download(lang):
     )
 
 
+# ---- HTTP Range / 206 passthrough (indirme uç noktaları) ----
+def _range_headers() -> Dict[str, str]:
+    """İstemcinin Range/If-Range başlıklarını upstream'e aktarmak için toplar."""
+    h = {}
+    rng = (request.headers.get("Range") or "").strip()
+    if rng.lower().startswith("bytes="):
+        h["Range"] = rng
+        if request.headers.get("If-Range"):
+            h["If-Range"] = request.headers["If-Range"]
+    return h
+
+def _is_initial_request() -> bool:
+    """Range yok ya da 0'dan başlıyorsa 'yeni indirme' sayılır (seek/resume tekrar loglanmaz)."""
+    rng = (request.headers.get("Range") or "").replace(" ", "").lower()
+    return not rng or rng.startswith("bytes=0-")
+
+def _relay_range_response(up, body, mimetype: str, headers: Optional[Dict[str, str]] = None):
+    """Upstream 200/206 yanıtını status, Content-Range, Accept-Ranges ile birlikte aktarır."""
+    status = 206 if up.status_code == 206 else 200
+    resp = Response(body, status=status, mimetype=mimetype, direct_passthrough=True)
+    for k in ("Content-Length", "Content-Range", "ETag", "Last-Modified"):
+        if up.headers.get(k):
+            resp.headers[k] = up.headers[k]
+    resp.headers["Accept-Ranges"] = up.headers.get("Accept-Ranges") or "bytes"
+    if headers:
+        resp.headers.update(headers)
+    resp.call_on_close(up.close)   # istemci koparsa da bağlantı serbest kalsın
+    return resp
+
+def _range_not_satisfiable(up):
+    resp = Response("", status=416)
+    if up.headers.get("Content-Range"):
+        resp.headers["Content-Range"] = up.headers["Content-Range"]
+    try: up.close()
+    except: pass
+    return resp
+
 @app.route("/photo_download/<int:i>")
-@limiter.limit("60 per minute")
 def photo_dl(i):
-    r = _enforce_rate_limit(suffix=":photo")
+    r = _admit(suffix=":photo", ip_per_min=60)
     if r: return r
 
     try:
-        imgs = session.get("image_urls", [])
+        imgs = _res_get("image_urls", [])
         if 0 <= i < len(imgs):
-            rqs = requests.get(
+            rqs = cdn_get(
                 imgs[i],
                 headers={
                     "User-Agent": "Mozilla/5.0",
@@ -1931,27 +2400,11 @@ def photo_dl(i):
                     "Accept": "*/*",
                     "Accept-Encoding": "identity",  # <<< önemli
                 },
-                stream=True, timeout=15
+                stream=True, read_timeout=15
             )
 
-            sessionid = session.get("sessionid", "")
-            username = session.get("username", "") or session.get("user", "")
-            if not username and sessionid:
-                try:
-                    with open(SESSIONS_PATH, encoding="utf-8") as f:
-                        all_sessions = json.load(f)
-                    for s in all_sessions:
-                        if s.get("sessionid") == sessionid:
-                            username = s.get("user", "")
-                            break
-                except Exception:
-                    pass
-
-            if sessionid or username:
-                log_session_use(sessionid, "success")
-                notify_download(username)
-                if sessionid:
-                    update_session_counters(sessionid, "success")
+            record_download(session.get("sessionid", ""),
+                            session.get("username", "") or session.get("user", ""))
 
             def gen():
                 for c in rqs.iter_content(65536):
@@ -1966,71 +2419,59 @@ def photo_dl(i):
             if rqs.headers.get("Content-Length"):
                 resp.headers["Content-Length"] = rqs.headers["Content-Length"]
             resp.headers["Cache-Control"] = "no-transform, private, max-age=0"
+            resp.call_on_close(rqs.close)
             return resp
     except Exception:
         app.logger.exception(f"Error in photo_dl index={i}")
-        sessionid = session.get("sessionid", "")
-        if sessionid:
-            update_session_counters(sessionid, "fail")
+        record_download(session.get("sessionid", ""), result="fail", log=False)
     return redirect(url_for("index"))
 
 @app.route("/direct_download")
-@limiter.limit("20 per minute")
 def direct_dl():
-    r = _enforce_rate_limit(suffix=":video")
+    r = _admit(suffix=":video", ip_per_min=20)
     if r: return r
 
     try:
-        url  = session.get("video_url")
-        name = session.get("video_title","instagram_video") + ".mp4"
+        url  = _res_get("video_url")
+        name = _res_get("video_title","instagram_video") + ".mp4"
         if not url:
             return render_template("download.html",
                                    error=_("Video URL not found."),
                                    media={"downloads":[], "kind":None, "poster":""})
-        rqs = requests.get(
-            url, headers={"User-Agent":"Mozilla/5.0","Referer":"https://www.instagram.com/"},
-            stream=True, timeout=10
+        rqs = cdn_get(
+            url,
+            headers={"User-Agent":"Mozilla/5.0","Referer":"https://www.instagram.com/",
+                     "Accept-Encoding":"identity", **_range_headers()},
+            stream=True, read_timeout=10
         )
-        if rqs.status_code != 200:
+        if rqs.status_code == 416:
+            return _range_not_satisfiable(rqs)
+        if rqs.status_code not in (200, 206):
             raise RuntimeError
-        sessionid = session.get("sessionid", "")
-        username = session.get("username", "") or session.get("user", "")
-        if not username and sessionid:
-            try:
-                with open(SESSIONS_PATH, encoding="utf-8") as f:
-                    all_sessions = json.load(f)
-                for s in all_sessions:
-                    if s.get("sessionid") == sessionid:
-                        username = s.get("user", "")
-                        break
-            except Exception:
-                pass
-
-        if sessionid or username:
-            log_session_use(sessionid, "success")
-            notify_download(username)
-            if sessionid:
-                update_session_counters(sessionid, "success")
-        return Response(
-            (c for c in rqs.iter_content(65536) if c),
-            content_type=rqs.headers.get("Content-Type","video/mp4"),
-            headers={"Content-Disposition": f'attachment; filename="{name}"'}
+        if not _is_initial_request():
+            return _relay_range_response(
+                rqs, (c for c in rqs.iter_content(65536) if c),
+                rqs.headers.get("Content-Type","video/mp4"),
+                {"Content-Disposition": f'attachment; filename="{name}"'}
+            )
+        record_download(session.get("sessionid", ""),
+                        session.get("username", "") or session.get("user", ""))
+        return _relay_range_response(
+            rqs, (c for c in rqs.iter_content(65536) if c),
+            rqs.headers.get("Content-Type","video/mp4"),
+            {"Content-Disposition": f'attachment; filename="{name}"'}
         )
     except Exception:
         app.logger.exception("Error in direct_dl")
-        sessionid = session.get("sessionid", "")
-        if sessionid:
-            log_session_use(sessionid, "fail")
-            update_session_counters(sessionid, "fail")
+        record_download(session.get("sessionid", ""), result="fail")
         return render_template("download.html",
                                error=_("Error occurred during download."),
                                media={"downloads":[], "kind":None, "poster":""})
 
 # --- Safe proxy downloader (same-origin download) ---
 @app.route("/proxy_download")
-@limiter.limit("20 per minute")
 def proxy_download():
-    r = _enforce_rate_limit(suffix=":proxy_dl")
+    r = _admit(suffix=":proxy_dl", ip_per_min=20)
     if r: return r
 
     url   = (request.args.get("url") or "").strip()
@@ -2039,7 +2480,7 @@ def proxy_download():
     nonce = (request.args.get("nonce") or "").strip()
     sig   = (request.args.get("sig") or "").strip()
 
-    if not (MEDIA_PROXY_SECRET and url and fn and exp and nonce and sig):
+    if not (MEDIA_PROXY_SECRET and url and fn and exp and sig):
         return "forbidden", 403
     try:
         if int(exp) < int(time.time()):
@@ -2072,8 +2513,11 @@ def proxy_download():
             "Accept": "*/*",
             "Accept-Encoding": "identity",  # <<< BOZULMAYAN BINARY
         }
-        rq = requests.get(url, headers=up_headers, stream=True, timeout=20)
-        if rq.status_code != 200:
+        up_headers.update(_range_headers())
+        rq = cdn_get(url, headers=up_headers, stream=True, read_timeout=20)
+        if rq.status_code == 416:
+            return _range_not_satisfiable(rq)
+        if rq.status_code not in (200, 206):
             return f"upstream {rq.status_code}", 502
 
         mime = (rq.headers.get("Content-Type") or "application/octet-stream").split(";")[0]
@@ -2087,12 +2531,10 @@ def proxy_download():
                 if chunk:
                     yield chunk
 
-        resp = Response(gen(), mimetype=mime, direct_passthrough=True)
-        resp.headers["Content-Disposition"] = f'attachment; filename="{fn}"'
-        resp.headers["Cache-Control"] = "no-transform, private, max-age=0"
-        if rq.headers.get("Content-Length"):
-            resp.headers["Content-Length"] = rq.headers["Content-Length"]
-        return resp
+        return _relay_range_response(rq, gen(), mime, {
+            "Content-Disposition": f'attachment; filename="{fn}"',
+            "Cache-Control": "no-transform, private, max-age=0",
+        })
     except Exception as e:
         app.logger.exception(f"proxy_download error: {e}")
         return "download error", 500
@@ -2110,6 +2552,26 @@ ALLOWED_IMG_HOSTS = (
 
 MAX_IMG_BYTES = 15 * 1024 * 1024
 ALLOWED_IMG_MIME_PREFIX = ("image/",)
+IMG_CHUNK_BYTES = 64 * 1024
+
+def _img_cache_headers(resp, etag: str, exp: str):
+    """İmzalı link geçerli olduğu sürece tarayıcı/ara cache'ler aynı URL'yi saklayabilir."""
+    try:
+        max_age = max(0, int(exp) - int(time.time()))
+    except (TypeError, ValueError):
+        max_age = 0
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return resp
+
+def _looks_like_image(mime: str, first: bytes) -> bool:
+    """image/* başlığına rağmen HTML/hata sayfası dönen upstream'leri ilk parçadan yakalar."""
+    if not first:
+        return False
+    head = first.lstrip()[:1]
+    if head == b"<":
+        return mime == "image/svg+xml"
+    return True
 
 def _is_private_ip(hostname: str) -> bool:
     try:
@@ -2147,7 +2609,7 @@ def _safe_get_follow_redirects(url: str, headers: dict, timeout: int, max_hops:
             return None, ("private ip blocked", 400)
 
         try:
-            r = requests.get(cur, headers=headers, timeout=timeout, stream=True, allow_redirects=False)
+            r = cdn_get(cur, headers=headers, read_timeout=timeout, stream=True, allow_redirects=False)
         except Exception as e:
             return None, (f"upstream error: {e}", 502)
 
@@ -2157,6 +2619,8 @@ def _safe_get_follow_redirects(url: str, headers: dict, timeout: int, max_hops:
                 try: r.close()
                 except: pass
                 return None, ("redirect without location", 502)
+            try: r.close()   # bağlantı havuza dönsün
+            except: pass
             cur = urljoin(cur, loc)
             continue
 
@@ -2165,9 +2629,8 @@ def _safe_get_follow_redirects(url: str, headers: dict, timeout: int, max_hops:
     return None, ("too many redirects", 310)
 
 @app.route("/img_proxy", methods=["GET", "HEAD"])
-@limiter.limit("120 per minute")
 def img_pxy():
-    rr = _enforce_rate_limit(suffix=":img_proxy")
+    rr = _admit(suffix=":img_proxy", ip_per_min=120)
     if rr: return rr
 
     u     = (request.args.get("url") or "").strip()
@@ -2175,7 +2638,7 @@ def img_pxy():
     nonce = (request.args.get("nonce") or "").strip()
     sig   = (request.args.get("sig") or "").strip()
 
-    if not (IMG_PROXY_SECRET and u and exp and nonce and sig):
+    if not (IMG_PROXY_SECRET and u and exp and sig):
         return "forbidden", 403
     try:
         if int(exp) < int(time.time()):
@@ -2201,6 +2664,15 @@ def img_pxy():
     if request.method == "HEAD":
         return ("", 204, {"Content-Type": "image/*"})
 
+    # Disk cache: URL içerik adresli olduğundan ETag URL'den türetilir
+    etag = img_cache.etag_for(u)
+    if request.if_none_match.contains(etag):
+        return _img_cache_headers(Response(status=304), etag, exp)
+    hit = img_cache.lookup(u)
+    if hit:
+        resp = send_file(hit["path"], mimetype=(hit.get("mime") or "image/jpeg"))
+        return _img_cache_headers(resp, etag, exp)
+
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Accept": "image/avif,image/webp,image/apng,image/*;q=0.8,*/*;q=0.5",
@@ -2235,28 +2707,71 @@ def img_pxy():
         except: pass
         return "too large", 413
 
+    # İlk parçayı response başlamadan oku: gövde gerçekten görsel mi?
+    chunks = r.iter_content(IMG_CHUNK_BYTES)
     try:
-        total = 0
-        buf = bytearray()
-        for chunk in r.iter_content(65536):
-            if not chunk:
-                continue
-            total += len(chunk)
-            if total > MAX_IMG_BYTES:
-                try: r.close()
-                except: pass
-                return "too large", 413
-            buf.extend(chunk)
+        first = next((c for c in chunks if c), b"")
     except Exception as e:
         try: r.close()
         except: pass
         app.logger.error(f"img_proxy read error for {u}: {e}")
         return "upstream read error", 502
-    finally:
+    if not _looks_like_image(mime, first):
         try: r.close()
         except: pass
+        return "unsupported content", 415
 
-    return send_file(io.BytesIO(bytes(buf)), mimetype=(mime or "image/jpeg"))
+    if not clen:
+        # Boyut bilinmiyor: sınır aşılırsa 413 dönebilmek için gövde response başlamadan
+        # (en fazla MAX_IMG_BYTES) okunur; yarım gövde asla 200 olarak gönderilmez/önbelleğe yazılmaz.
+        buf, total = [first], len(first)
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                total += len(chunk)
+                if total > MAX_IMG_BYTES:
+                    app.logger.warning(f"img_proxy too large (no Content-Length): {u}")
+                    return "too large", 413
+                buf.append(chunk)
+        except Exception as e:
+            app.logger.error(f"img_proxy read error for {u}: {e}")
+            return "upstream read error", 502
+        finally:
+            try: r.close()
+            except: pass
+        body = img_cache.store_stream(u, mime or "image/jpeg", buf)
+        resp = Response(body, mimetype=(mime or "image/jpeg"), direct_passthrough=True)
+        resp.headers["Content-Length"] = str(total)
+        return _img_cache_headers(resp, etag, exp)
+
+    def gen():
+        # Content-Length biliniyor: akıtılır. Upstream sözünü tutmazsa (fazla/eksik gövde)
+        # istisna yükseltilir: sunucu bağlantıyı keser (istemci kısa 200 görmez),
+        # store_stream da yarım dosyayı siler.
+        total = len(first)
+        try:
+            yield first
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                total += len(chunk)
+                if total > clen:
+                    raise IOError(f"body exceeds Content-Length ({total} > {clen})")
+                yield chunk
+            if total != clen:
+                raise IOError(f"short body ({total} / {clen})")
+        except Exception as e:
+            app.logger.error(f"img_proxy stream aborted for {u}: {e}")
+            raise
+        finally:
+            try: r.close()
+            except: pass
+
+    body = img_cache.store_stream(u, mime or "image/jpeg", gen())
+    resp = Response(body, mimetype=(mime or "image/jpeg"), direct_passthrough=True)
+    resp.headers["Content-Length"] = str(clen)
+    return _img_cache_headers(resp, etag, exp)
 
 # kısa yollar
 @app.route("/video", defaults={"lang": "en"}, methods=["GET", "POST"])
@@ -2293,7 +2808,7 @@ def video(lang):
             if not stories:
                 return render_template("video.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2311,7 +2826,7 @@ def video(lang):
             if not stories:
                 return render_template("video.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2356,7 +2871,7 @@ def photo(lang):
             if not stories:
                 return render_template("photo.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2374,7 +2889,7 @@ def photo(lang):
             if not stories:
                 return render_template("photo.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2419,7 +2934,7 @@ def reels(lang):
             if not stories:
                 return render_template("reels.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2437,7 +2952,7 @@ def reels(lang):
             if not stories:
                 return render_template("reels.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2481,7 +2996,7 @@ def igtv(lang):
             if not stories:
                 return render_template("igtv.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2499,7 +3014,7 @@ def igtv(lang):
             if not stories:
                 return render_template("igtv.html", error=_("No active story found."), lang=lang, meta=meta)
 
-            session["stories"]    = stories
+            _res_store({"stories": stories})
             session["username"]   = uname
             session["from_story"] = True
             if used_session:
@@ -2557,7 +3072,7 @@ def story(lang):
         if not stories:
             return render_template("story.html", error=_("No active story found."), lang=lang, meta=meta)
 
-        session["stories"]    = stories
+        _res_store({"stories": stories})
         session["username"]   = uname
         session["from_story"] = True
         if used_session:
@@ -2567,15 +3082,14 @@ def story(lang):
     return render_template("story.html", lang=lang, meta=meta)
 
 @app.route("/story-download/<int:i>")
-@limiter.limit("20 per minute")
 def story_download(i):
     # İsteğe küçük hız limiti (opsiyonel ama tutarlı olsun)
-    r = _enforce_rate_limit(suffix=":story_dl")
+    r = _admit(suffix=":story_dl", ip_per_min=20)
     if r:
         return r
 
     try:
-        stories = session.get("stories", [])
+        stories = _res_get("stories", [])
         if not stories or i < 0 or i >= len(stories):
             return "Story not found", 404
 
@@ -2586,59 +3100,44 @@ def story_download(i):
 
         ext = "mp4" if story.get("type") == "video" else "jpg"
 
-        rqs = requests.get(
+        rqs = cdn_get(
             media_url,
             headers={
                 "User-Agent": "Mozilla/5.0",
                 "Referer": "https://www.instagram.com/",
                 "Accept": "*/*",
                 "Accept-Encoding": "identity",
+                **_range_headers(),
             },
             stream=True,
-            timeout=15
+            read_timeout=15
         )
-        if rqs.status_code != 200:
+        if rqs.status_code == 416:
+            return _range_not_satisfiable(rqs)
+        if rqs.status_code not in (200, 206):
             return "Download error", 502
 
         # -------- LOG: güvenli try/except içinde -------------
         try:
-            sessid = session.get("sessionid", "")
-            actor  = session.get("username", "") or session.get("user", "")
-
-            # actor yoksa sessions.json’dan bulmayı dene
-            if not actor and sessid:
-                try:
-                    with open(SESSIONS_PATH, encoding="utf-8") as f:
-                        all_sessions = json.load(f)
-                    for s in all_sessions:
-                        if s.get("sessionid") == sessid:
-                            actor = s.get("user", "")
-                            break
-                except Exception:
-                    pass
-
-            if sessid or actor:
-                log_session_use(sessid, "success")
-                notify_download(actor)
-                if sessid:
-                    update_session_counters(sessid, "success")
+            if _is_initial_request():  # devam/seek istekleri tekrar loglanmaz
+                # actor yoksa worker sessions.json’dan bulur
+                record_download(session.get("sessionid", ""),
+                                session.get("username", "") or session.get("user", ""))
         except Exception:
             app.logger.exception("story_download log error")
         # ------------------------------------------------------
 
-        return Response(
-            (c for c in rqs.iter_content(65536) if c),
-            content_type=("video/mp4" if ext == "mp4" else "image/jpeg"),
-            headers={"Content-Disposition": f'attachment; filename=story_{i}.{ext}'}
+        return _relay_range_response(
+            rqs, (c for c in rqs.iter_content(65536) if c),
+            ("video/mp4" if ext == "mp4" else "image/jpeg"),
+            {"Content-Disposition": f'attachment; filename=story_{i}.{ext}'}
         )
 
     except Exception as e:
         app.logger.error(f"Story download error: {e}")
         # İsteğe bağlı: sayaçları fail olarak güncelle
         try:
-            sessionid = session.get("sessionid", "")
-            if sessionid:
-                update_session_counters(sessionid, "fail")
+            record_download(session.get("sessionid", ""), result="fail", log=False)
         except Exception:
             pass
         return "Download error", 500
@@ -2646,11 +3145,7 @@ def story_download(i):
 @app.route("/profile", defaults={"lang": "en"}, methods=["GET", "POST"])
 @app.route("/<lang>/profile", methods=["GET", "POST"])
 def profile_search(lang):
-    r = _ensure_gate(lang)
-    if r: return r
-    r = _ensure_not_blacklisted()
-    if r: return r
-    r = _enforce_rate_limit(suffix=":profile_search")
+    r = _admit(suffix=":profile_search", lang=lang, blacklist=True)
     if r: return r
 
     if request.method == "POST":
@@ -2667,6 +3162,13 @@ def profile_search(lang):
     return render_template("profile.html", profile=None, sections=None, lang=lang)
 
 # --- SONRADAN EKLEME: signing helpers (IMG + MEDIA tek endpoint) ---
+SIGN_BATCH_MAX = 200
+
+def _sign_for(kind: str, url: str, fn: str = "instavido") -> str:
+    if kind == "img":
+        return sign_img_proxy(url, 900)  # -> "/img_proxy?...sig=..."
+    return sign_media_proxy(url, fn=fn, ttl_sec=900)  # -> "/proxy_download?...sig=..."
+
 @app.route("/api/sign", methods=["POST"])
 def api_sign():
     # sadece kendi sayfalarımızdan çağrı
@@ -2680,16 +3182,66 @@ def api_sign():
         if not url:
             return jsonify({"ok": False, "err": "missing url"}), 400
 
-        if kind == "img":
-            signed = sign_img_proxy(url, 900)  # -> "/img_proxy?...sig=..."
-        else:
-            signed = sign_media_proxy(url, fn=fn, ttl_sec=900)  # -> "/proxy_download?...sig=..."
-
-        return jsonify({"ok": True, "url": signed})
+        return jsonify({"ok": True, "url": _sign_for(kind, url, fn)})
     except Exception as e:
         app.logger.error(f"/api/sign error: {e}")
         return jsonify({"ok": False, "err": "server"}), 500
 
+@app.route("/api/sign/batch", methods=["POST"])
+def api_sign_batch():
+    """
+    Body: {"items": [{"url": "...", "kind": "img"|"media", "fn": "..."}, ...]}
+    Döner: {"ok": true, "urls": [...]} — sıra korunur, url'si boş olanlar için "".
+    """
+    if not _has_allowed_referer(request):
+        return jsonify({"ok": False, "err": "forbidden"}), 403
+    try:
+        data  = request.get_json(force=True) or {}
+        items = data.get("items") or []
+        if not isinstance(items, list):
+            return jsonify({"ok": False, "err": "bad items"}), 400
+        if len(items) > SIGN_BATCH_MAX:
+            return jsonify({"ok": False, "err": "too many"}), 413
+
+        urls = []
+        for it in items:
+            it   = it if isinstance(it, dict) else {}
+            url  = (it.get("url") or "").strip()
+            fn   = (it.get("fn") or "instavido").strip()
+            kind = (it.get("kind") or "media").strip()
+            urls.append(_sign_for(kind, url, fn) if url else "")
+        return jsonify({"ok": True, "urls": urls})
+    except Exception as e:
+        app.logger.error(f"/api/sign/batch error: {e}")
+        return jsonify({"ok": False, "err": "server"}), 500
+
+def _want_presigned() -> bool:
+    return request.args.get("signed") == "1"
+
+def _presign_items(items: List[dict], uname: str) -> List[dict]:
+    """
+    Kart öğelerine imzalı proxy alanları ekler (client'ın /api/sign çağırmasına gerek kalmaz):
+      thumb_px → /img_proxy (profile.html'deki pickThumb ile aynı kaynak)
+      dl_px    → /proxy_download
+    """
+    out = []
+    for i, it in enumerate(items or []):
+        it = dict(it or {})
+        video = it.get("type") == "video"
+        if video:
+            raw_thumb = it.get("thumb") or it.get("url") or it.get("download_url") or ""
+        else:
+            raw_thumb = it.get("url") or it.get("download_url") or it.get("thumb") or ""
+        raw_dl = it.get("download_url") or it.get("url") or it.get("thumb") or ""
+        if raw_thumb:
+            it["thumb_px"] = sign_img_proxy(raw_thumb, 900)
+        if raw_dl:
+            base = f"{uname or 'insta'}_{it.get('id') or it.get('timestamp') or i}"
+            fn = re.sub(r"[^a-zA-Z0-9_.-]", "", base + (".mp4" if video else ".jpg")) or "instavido"
+            it["dl_px"] = sign_media_proxy(raw_dl, fn=fn, ttl_sec=900)
+        out.append(it)
+    return out
+
 # ---- Date range helper (YYYY-MM-DD -> epoch) --------------------------------
 # ---- Date range helper (YYYY-MM-DD -> epoch) --------------------------------
 def _parse_date_range_args():
@@ -2765,11 +3317,15 @@ def api_profile_feed(username):
             out.append(it)
         return out
 
+    presign = _want_presigned()
+
     if s:
         items, nxt = _fetch_user_feed_page(uid, s, max_id=max_id, count=count)
         items = _filter_by_date(items)
         if items:
             _pf_set(uname, "feed", {"session_key": s.get("session_key"), "next_max_id": nxt})
+            if presign:
+                items = _presign_items(items, uname)
             return jsonify({"ok": True, "items": items, "next_max_id": nxt})
 
     for s in pool:
@@ -2777,6 +3333,8 @@ def api_profile_feed(username):
         items = _filter_by_date(items)
         if items or nxt is not None:
             _pf_set(uname, "feed", {"session_key": s.get("session_key"), "next_max_id": nxt})
+            if presign:
+                items = _presign_items(items, uname)
             return jsonify({"ok": True, "items": items, "next_max_id": nxt})
 
     _pf_set(uname, "feed", {"session_key": None, "next_max_id": None})
@@ -2820,28 +3378,11 @@ def api_user_reels(username):
         try:
             r = requests.get(url, headers=h, cookies=ck, timeout=12)
             if r.status_code == 200:
-                return r.json(), s, url
+                return ig_media.response_json(r), s, url
         except Exception:
             pass
         return None, None, url
 
-    def strip_query(u: str) -> str:
-        try:    return (u or "").split("?")[0]
-        except: return u or ""
-
-    def first_url(node, key):
-        try:
-            arr = node.get(key, {}).get("candidates") or []
-            return (arr[0] or {}).get("url", "")
-        except Exception:
-            return ""
-
-    def pick_id(node: dict, fallback_url: str) -> str:
-        sid = (node.get("pk") or node.get("id") or node.get("shortcode") or node.get("code"))
-        if sid is None:
-            sid = strip_query(fallback_url or "")
-        return str(sid)
-
     used = None
     used_url = None
     data = None
@@ -2910,58 +3451,8 @@ def api_user_reels(username):
                 next_token = f"FEED:{feed_next}" if feed_next else None
                 debug_info.update({"flow": "FEED", "hit": used_url, "len_items": len(items_raw)})
 
-    # ---- Normalize + DATE FILTER
-    out = []
-    seen = set()
-    for it in items_raw:
-        node = it.get("media", it) or {}
-        ptype = node.get("product_type") or it.get("product_type")
-        clips_meta = node.get("clips_metadata") or {}
-        is_reel = (ptype == "clips") or bool(clips_meta)
-        if not is_reel:
-            continue
-
-        vvers = node.get("video_versions") or clips_meta.get("video_versions")
-        if not vvers:
-            continue
-
-        vurl = (vvers[0] or {}).get("url", "")
-        if not vurl:
-            continue
-
-        thumb = first_url(node, "image_versions2")
-        if not thumb:
-            thumb = node.get("thumbnail_url") \
-                 or node.get("image_versions2",{}).get("additional_candidates",{}).get("first_frame", "")
-
-        ts = int(node.get("taken_at") or it.get("taken_at") or 0)
-
-        # tarih filtresi burada uygulanır
-        if ts_start and ts < ts_start:
-            continue
-        if ts_end and ts > ts_end:
-            continue
-
-        _id = pick_id(node, vurl)
-        if _id in seen:
-            continue
-        seen.add(_id)
-
-        likes    = node.get("like_count") or it.get("like_count") or 0
-        comments = node.get("comment_count") or it.get("comment_count") or 0
-        views    = node.get("view_count") or node.get("play_count") or it.get("view_count") or 0
-
-        out.append({
-            "id": _id,
-            "type": "video",
-            "url": vurl,
-            "thumb": thumb,
-            "download_url": vurl,
-            "like_count": int(likes or 0),
-            "comment_count": int(comments or 0),
-            "view_count": int(views or 0),
-            "timestamp": ts
-        })
+    # ---- Normalize + DATE FILTER (tek geçiş)
+    out = ig_media.normalize_reels(items_raw, ts_start, ts_end)
 
     if next_token and (next_token == raw_token):
         next_token = None
@@ -2973,6 +3464,8 @@ def api_user_reels(username):
     except Exception:
         pass
 
+    if _want_presigned():
+        out = _presign_items(out, uname)
     resp = {"ok": True, "items": out, "next_max_id": next_token}
     if want_debug:
         resp["debug"] = debug_info
@@ -3000,6 +3493,8 @@ def api_profile_stories(username):
             "thumb": it.get("thumb"),
             "caption": ""
         })
+    if _want_presigned():
+        out = _presign_items(out, uname)
     return jsonify({"ok": True, "items": out})
 
 @app.route("/api/u/<username>/hl_tray")
@@ -3040,7 +3535,10 @@ def api_hl_tray(username):
                          or "")
             except Exception:
                 cover = ""
-            out.append({"id": str(hid), "title": title, "cover": cover})
+            row = {"id": str(hid), "title": title, "cover": cover}
+            if cover and _want_presigned():
+                row["cover_px"] = sign_img_proxy(cover, 900)
+            out.append(row)
         return jsonify({"ok": True, "items": out})
 
     return jsonify({"ok": True, "items": []})
@@ -3073,7 +3571,7 @@ def api_hl_items(username, hid):
         try:
             r = requests.get(url, headers=h, cookies=ck, timeout=10)
             if r.status_code == 200:
-                return r.json()
+                return ig_media.response_json(r)
         except Exception:
             pass
         return None
@@ -3120,23 +3618,10 @@ def api_hl_items(username, hid):
             return payload["items"]
         return []
 
-    raw_items = _extract_items(j) or []
-
-    out = []
-    for it in raw_items:
-        try:
-            thumb = (((it.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
-            if it.get("video_versions"):
-                media_url = (it["video_versions"][0] or {}).get("url", "")
-                typ = "video"
-            else:
-                media_url = (((it.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
-                typ = "image"
-            if media_url:
-                out.append({"type": typ, "url": media_url, "thumb": thumb, "caption": ""})
-        except Exception:
-            continue
+    out = ig_media.normalize_simple(_extract_items(j), "hl_item")
 
+    if _want_presigned():
+        out = _presign_items(out, uname)
     return jsonify({"ok": True, "items": out})
 # -------------------------- DEBUG: Profil Teşhis --------------------------
 @app.route("/__dbg_feed/<username>")
@@ -3199,6 +3684,9 @@ def _set_security_headers(resp):
         "geolocation=(), microphone=(), camera=(), usb=(), payment=()")
     resp.headers.setdefault("Cross-Origin-Resource-Policy", "same-site")
     resp.headers.setdefault("Cross-Origin-Opener-Policy", "same-origin")
+    timings = request.environ.get("iv.admit_timing") if (SERVER_TIMING or app.debug) else None
+    if timings:
+        resp.headers["Server-Timing"] = ", ".join(f"admit-{k};dur={ms:.2f}" for k, ms in timings)
     return resp
 
 @app.route("/privacy-policy", defaults={"lang": "en"})
@@ -3264,70 +3752,86 @@ def api_admin_session_ingest():
     status = (data.get("status") or "active").strip()
     proxy  = (data.get("proxy") or "").strip()
 
-    lst = _load_sessions_list()
-
-    # Upsert
-    found = None
-    for s in lst:
-        if s.get("sessionid") == sessionid or s.get("ds_user_id") == ds_user_id:
-            found = s
-            break
+    # Oku-değiştir-yaz tek kilit altında (sayaç flush'ı arada ezilmesin)
+    with edit_sessions() as lst:
+        # Upsert
+        found = None
+        for s in lst:
+            if s.get("sessionid") == sessionid or s.get("ds_user_id") == ds_user_id:
+                found = s
+                break
 
-    # rastgele fingerprint preset
-    fp = random.choice(_FINGERPRINT_PRESETS)
-
-    # geniş cookies
-    full_cookies = {}
-    for k in ("sessionid","ds_user_id","csrftoken","ig_did","rur","mid","datr","dpr","wd"):
-        if kv.get(k):
-            full_cookies[k] = kv[k]
-
-    if not found:
-        sk = (data.get("session_key") or "").strip()
-        if not sk:
-            sk = _next_session_key(lst)
-        newrow = {
-            "user": label or "",
-            "sessionid": sessionid,
-            "ds_user_id": ds_user_id,
-            "csrftoken": csrftoken,
-            "status": status,
-            "session_key": sk,
-            "cookies": full_cookies,
-            "fingerprint": fp,
-        }
-        if kv.get("ig_did"): newrow["ig_did"] = kv["ig_did"]
-        if kv.get("rur"):    newrow["rur"]    = kv["rur"]
-        if kv.get("mid"):    newrow["mid"]    = kv["mid"]
+        # rastgele fingerprint preset
+        fp = random.choice(_FINGERPRINT_PRESETS)
+
+        # geniş cookies
+        full_cookies = {}
+        for k in ("sessionid","ds_user_id","csrftoken","ig_did","rur","mid","datr","dpr","wd"):
+            if kv.get(k):
+                full_cookies[k] = kv[k]
+
+        if not found:
+            sk = (data.get("session_key") or "").strip()
+            if not sk:
+                sk = _next_session_key(lst)
+            newrow = {
+                "user": label or "",
+                "sessionid": sessionid,
+                "ds_user_id": ds_user_id,
+                "csrftoken": csrftoken,
+                "status": status,
+                "session_key": sk,
+                "cookies": full_cookies,
+                "fingerprint": fp,
+            }
+            if kv.get("ig_did"): newrow["ig_did"] = kv["ig_did"]
+            if kv.get("rur"):    newrow["rur"]    = kv["rur"]
+            if kv.get("mid"):    newrow["mid"]    = kv["mid"]
 
-        if proxy:
-            newrow["proxy"] = proxy
+            if proxy:
+                newrow["proxy"] = proxy
 
-        lst.append(newrow)
-        _save_sessions_list(lst)
-        return jsonify({"ok": True, "mode": "insert", "entry": newrow})
-    else:
-        found["sessionid"]  = sessionid
-        found["ds_user_id"] = ds_user_id
-        found["csrftoken"]  = csrftoken
-        if label:
-            found["user"] = label
-        if data.get("status"):
-            found["status"] = status
-
-        if full_cookies:
-            found["cookies"] = full_cookies
-        if not found.get("fingerprint"):
-            found["fingerprint"] = fp
-        if proxy:
-            found["proxy"] = proxy
-
-        for extra_k in ("ig_did","rur","mid","ig_nrcb"):
-            if kv.get(extra_k):
-                found[extra_k] = kv[extra_k]
-
-        _save_sessions_list(lst)
-        return jsonify({"ok": True, "mode": "update", "entry": found})
+            lst.append(newrow)
+            return jsonify({"ok": True, "mode": "insert", "entry": newrow})
+        else:
+            found["sessionid"]  = sessionid
+            found["ds_user_id"] = ds_user_id
+            found["csrftoken"]  = csrftoken
+            if label:
+                found["user"] = label
+            if data.get("status"):
+                found["status"] = status
+
+            if full_cookies:
+                found["cookies"] = full_cookies
+            if not found.get("fingerprint"):
+                found["fingerprint"] = fp
+            if proxy:
+                found["proxy"] = proxy
+
+            for extra_k in ("ig_did","rur","mid","ig_nrcb"):
+                if kv.get(extra_k):
+                    found[extra_k] = kv[extra_k]
+
+            return jsonify({"ok": True, "mode": "update", "entry": found})
+
+@app.route("/_health/http")
+def _health_http():
+    """Bu worker'ın CDN bağlantı havuzu kullanımı."""
+    return pool_stats(), 200
+
+@app.route("/_health/admission")
+def _health_admission():
+    """Bu worker'da kabul kontrollerinin ortalama/maks süresi ve red sayıları."""
+    with _admit_stats_lock:
+        out = {k: dict(v, avg_ms=round(v["sum_ms"] / v["n"], 3) if v["n"] else 0.0)
+               for k, v in _admit_stats.items()}
+    return {"pid": os.getpid(), "checks": out}, 200
+
+@app.route("/_health/bookkeeping")
+def _health_bookkeeping():
+    """Bu worker'ın write-behind kuyruğu: derinlik, işlenen, düşürülen."""
+    return bookkeeping_stats(), 200
 
 @app.route("/_health/redis")
 def _health_redis():
@@ -0,0 +1,139 @@
+import os, json, time, threading, logging
+from typing import Any, Callable, Dict, Optional, Tuple
+from config.redis_helpers import get_redis_client
+
+# Sürümlü config deposu (Redis) + pub/sub invalidation.
+#   iv_cfg:<name>      → JSON doküman
+#   iv_cfg:<name>:ver  → INCR ile artan sürüm
+#   iv_cfg:<name>:src  → dokümanın geldiği dosyanın damgası ("<mtime_ns>:<size>")
+#   iv_cfg:bus         → "<name>:<ver>" yayınları
+# Her worker dokümanın sıcak kopyasını tutar; yalnızca sürüm değişince yeniden okur.
+# JSON dosyaları kalıcı kayıttır: dosya damgası Redis'tekinden farklıysa (elle düzenleme,
+# Redis kapalıyken yapılan admin kaydı) dosya yeniden okunup yayınlanır.
+# Redis yoksa sürüm ("file", damga) olur ve dosya her değiştiğinde yeniden okunur.
+CFG_PREFIX   = "iv_cfg:"
+CFG_CHANNEL  = CFG_PREFIX + "bus"
+CFG_POLL_SEC = float(os.getenv("CONFIG_BUS_POLL_SEC", "5"))   # kaçan mesajlara karşı sürüm yoklama aralığı
+
+log = logging.getLogger("config_bus")
+
+_lock = threading.Lock()
+_cache: Dict[str, Dict[str, Any]] = {}
+_seen: Dict[str, str] = {}    # name → bu süreçte son görülen dosya damgası
+_state = {"pid": None, "client": None, "listener": None}
+
+def _client():
+    pid = os.getpid()
+    if _state["pid"] != pid:
+        with _lock:
+            if _state["pid"] != pid:
+                _state.update(pid=pid, client=get_redis_client(), listener=None)
+                _cache.clear()
+    return _state["client"]
+
+def _listen():
+    while True:
+        try:
+            ps = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            ps.subscribe(CFG_CHANNEL)
+            while True:
+                msg = ps.get_message(timeout=1.0)
+                if not msg:
+                    continue
+                name = (msg.get("data") or b"").decode("utf-8", "ignore").rsplit(":", 1)[0]
+                ent = _cache.get(name)
+                if ent is not None:
+                    ent["dirty"] = True
+        except Exception as e:
+            log.warning(f"config bus listener error: {e}")
+            # bağlantı koptuysa herkes bir sonraki okumada sürümü kontrol etsin
+            for ent in list(_cache.values()):
+                ent["dirty"] = True
+            time.sleep(2)
+
+def _ensure_listener():
+    if _state["listener"] is not None and _state["pid"] == os.getpid():
+        return
+    with _lock:
+        if _state["listener"] is None:
+            t = threading.Thread(target=_listen, name="config-bus", daemon=True)
+            _state["listener"] = t
+            t.start()
+
+def _stamp(path: Optional[str]) -> str:
+    """Dosyanın değişim damgası; yoksa/okunamazsa ''."""
+    if not path:
+        return ""
+    try:
+        st = os.stat(path)
+        return f"{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        return ""
+
+def publish(name: str, doc: Any, path: Optional[str] = None) -> int:
+    """
+    Dokümanı Redis'e yazar, sürümü artırır ve diğer worker/node'lara duyurur.
+    path: dokümanın az önce yazıldığı dosya; damgası kaydedilir ki dosya tekrar yayınlanmasın.
+    """
+    r = _client()
+    stamp = _stamp(path)
+    raw = json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+    pipe = r.pipeline(transaction=True)
+    pipe.set(CFG_PREFIX + name, raw)
+    pipe.set(CFG_PREFIX + name + ":src", stamp)
+    pipe.incr(CFG_PREFIX + name + ":ver")
+    _, _, ver = pipe.execute()
+    ver = int(ver)
+    if path:
+        _seen[name] = stamp
+    _cache[name] = {"ver": ver, "doc": doc, "checked": time.monotonic(), "dirty": False}
+    try:
+        r.publish(CFG_CHANNEL, f"{name}:{ver}")
+    except Exception:
+        pass
+    return ver
+
+def get(name: str, loader: Callable[[], Any], path: Optional[str] = None) -> Tuple[Any, Any]:
+    """
+    (sürüm, doküman) döner. Doküman paylaşımlıdır: çağıran DEĞİŞTİRMEMELİ.
+    loader() path'teki dosyayı okur. Redis'te doküman yoksa ya da dosya bu süreç son
+    baktığından beri değişmiş ve Redis'teki damgadan farklıysa dosya yeniden yayınlanır.
+    Redis erişilemezse dosya damgası sürüm olarak kullanılır.
+    """
+    ent = _cache.get(name)
+    now = time.monotonic()
+    if ent is not None and not ent["dirty"] and now - ent["checked"] < CFG_POLL_SEC:
+        return ent["ver"], ent["doc"]
+    stamp = _stamp(path)
+    try:
+        r = _client()
+        _ensure_listener()
+        ver, src = r.mget(CFG_PREFIX + name + ":ver", CFG_PREFIX + name + ":src")
+        src = src.decode("utf-8", "ignore") if isinstance(src, bytes) else (src or "")
+        if ver is None or (path and stamp != _seen.get(name) and stamp != src):
+            doc = loader()
+            return publish(name, doc, path), doc
+        _seen[name] = stamp
+        ver = int(ver)
+        if ent is not None and ver == ent["ver"]:
+            ent.update(checked=now, dirty=False)
+            return ent["ver"], ent["doc"]
+        pipe = r.pipeline(transaction=True)
+        pipe.get(CFG_PREFIX + name + ":ver")
+        pipe.get(CFG_PREFIX + name)
+        ver, raw = pipe.execute()
+        if raw is None:
+            doc = loader()
+            return publish(name, doc, path), doc
+        ver, doc = int(ver), json.loads(raw)
+        _cache[name] = {"ver": ver, "doc": doc, "checked": now, "dirty": False}
+        return ver, doc
+    except Exception as e:
+        log.warning(f"config bus get({name}) fallback: {e}")
+        ver = ("file", stamp)
+        if ent is not None and ent["ver"] == ver:
+            ent.update(checked=now, dirty=False)
+            return ent["ver"], ent["doc"]
+        doc = loader()
+        _cache[name] = {"ver": ver, "doc": doc, "checked": now, "dirty": False}
+        return ver, doc
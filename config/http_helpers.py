@@ -0,0 +1,82 @@
+import os, threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+
+# Anonim CDN / reCAPTCHA trafiği için worker başına ortak, keep-alive'lı transport.
+# IG oturum çerezli istekler burada DEĞİL (çerez jar'ı kapalı, kimlik taşımaz).
+HTTP_POOL_HOSTS   = int(os.getenv("HTTP_POOL_HOSTS", "16"))     # host başına ayrı havuz sayısı
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))   # host başına açık bağlantı üst sınırı
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+
+_lock = threading.Lock()
+_sess = None
+_sess_pid = None
+_stats = {"requests": 0, "errors": 0}
+
+def cdn_timeout(read: float):
+    """(connect, read) timeout çifti."""
+    return (min(HTTP_CONNECT_TIMEOUT, read), read)
+
+def _new_session() -> requests.Session:
+    s = requests.Session()
+    # Upstream'in Set-Cookie'leri kullanıcılar arasında taşınmasın
+    s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                          max_retries=0, pool_block=False)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+def get_cdn_session() -> requests.Session:
+    """Fork sonrası (gunicorn preload) her worker kendi havuzunu kurar."""
+    global _sess, _sess_pid
+    pid = os.getpid()
+    if _sess is None or _sess_pid != pid:
+        with _lock:
+            if _sess is None or _sess_pid != pid:
+                _sess, _sess_pid = _new_session(), pid
+                _stats.update(requests=0, errors=0)
+    return _sess
+
+def cdn_request(method: str, url: str, read_timeout: float = 15, **kw) -> requests.Response:
+    kw.setdefault("timeout", cdn_timeout(read_timeout))
+    with _lock:
+        _stats["requests"] += 1
+    try:
+        return get_cdn_session().request(method, url, **kw)
+    except Exception:
+        with _lock:
+            _stats["errors"] += 1
+        raise
+
+def cdn_get(url: str, read_timeout: float = 15, **kw) -> requests.Response:
+    return cdn_request("GET", url, read_timeout, **kw)
+
+def cdn_post(url: str, read_timeout: float = 10, **kw) -> requests.Response:
+    return cdn_request("POST", url, read_timeout, **kw)
+
+def pool_stats() -> dict:
+    """Worker'ın havuz kullanımı: host başına açılan bağlantı / yapılan istek / boşta bekleyen."""
+    s = get_cdn_session()
+    out = {"pid": os.getpid(), "requests": _stats["requests"], "errors": _stats["errors"],
+           "new_connections": 0, "reused": 0, "pools": {}}
+    adapter = s.get_adapter("https://")
+    try:
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            p = pools.get(key)
+            if p is None:
+                continue
+            idle = sum(1 for c in list(p.pool.queue) if c is not None) if p.pool else 0
+            out["pools"][f"{p.scheme}://{p.host}"] = {
+                "connections": p.num_connections,
+                "requests": p.num_requests,
+                "idle": idle,
+                "maxsize": p.pool.maxsize if p.pool else 0,
+            }
+            out["new_connections"] += p.num_connections
+            out["reused"] += max(0, p.num_requests - p.num_connections)
+    except Exception:
+        pass
+    return out
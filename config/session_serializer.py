@@ -0,0 +1,58 @@
+import os, pickle
+from flask.json.tag import TaggedJSONSerializer
+
+try:
+    import zstandard as _zstd
+except ImportError:  # opsiyonel: yoksa yalnızca sıkıştırmasız JSON
+    _zstd = None
+
+# Redis'teki (iv_sess:) Flask session değerleri için kompakt serializer.
+#   b"IVJ1" + JSON        → Flask'ın tagged JSON'u (tuple/bytes/datetime/Markup korunur)
+#   b"IVZ1" + zstd(JSON)  → SESSION_ZSTD_MIN_BYTES üstü ve zstandard kuruluysa
+# Ön eki olmayan değerler eski pickle kayıtlarıdır: okunur, ilk değişiklikte yeni biçimde yazılır.
+MAGIC_JSON = b"IVJ1"
+MAGIC_ZSTD = b"IVZ1"
+SESSION_ZSTD_MIN_BYTES = int(os.getenv("SESSION_ZSTD_MIN_BYTES", "1024"))
+SESSION_ZSTD_LEVEL     = int(os.getenv("SESSION_ZSTD_LEVEL", "3"))
+
+
+class SessionSerializer:
+    """Flask-Session'ın beklediği dumps/loads (eski sürümler) ve encode/decode (yeni sürümler)."""
+
+    def __init__(self, zstd_min_bytes: int = SESSION_ZSTD_MIN_BYTES, level: int = SESSION_ZSTD_LEVEL):
+        self._json = TaggedJSONSerializer()
+        self.zstd_min_bytes = zstd_min_bytes
+        self._cctx = _zstd.ZstdCompressor(level=level) if _zstd else None
+        self._dctx = _zstd.ZstdDecompressor() if _zstd else None
+
+    def dumps(self, value) -> bytes:
+        try:
+            raw = self._json.dumps(value).encode("utf-8")
+        except (TypeError, ValueError):
+            # JSON'a sığmayan bir değer varsa veri kaybetmek yerine eski biçim
+            return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._cctx is not None and len(raw) >= self.zstd_min_bytes:
+            return MAGIC_ZSTD + self._cctx.compress(raw)
+        return MAGIC_JSON + raw
+
+    def loads(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        head = data[:4]
+        if head == MAGIC_JSON:
+            return self._json.loads(data[4:].decode("utf-8"))
+        if head == MAGIC_ZSTD:
+            if self._dctx is None:
+                raise ValueError("zstd session value but zstandard is not installed")
+            return self._json.loads(self._dctx.decompress(data[4:]).decode("utf-8"))
+        return pickle.loads(data)   # eski kayıt
+
+    encode = dumps
+    decode = loads
+
+
+def install(session_interface, serializer: "SessionSerializer" = None):
+    """Flask-Session Redis arayüzüne serializer'ı takar; sarmalayıcıysa iç arayüzü bulur."""
+    target = getattr(session_interface, "inner", session_interface)
+    target.serializer = serializer or SessionSerializer()
+    return target.serializer
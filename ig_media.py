@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# /var/www/instavido/ig_media.py
+"""
+Instagram private API medya öğelerini şablonların beklediği kart dict'lerine çevirir.
+
+Medya / küçük resim URL'leri istisnasız .get zinciriyle okunur; her normalize_*
+fonksiyonu bir sayfadaki tüm öğeleri tek geçişte işler.
+Upstream gövdeleri orjson kuruluysa onunla çözülür (r.json() yerine).
+"""
+import json
+from typing import Iterable, List, Optional
+
+try:
+    import orjson as _orjson
+except ImportError:  # opsiyonel: yoksa stdlib json
+    _orjson = None
+
+
+def loads(data):
+    """bytes/str JSON → Python nesnesi (orjson varsa onunla)."""
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def response_json(r):
+    """requests.Response gövdesini çözer; r.json()'un yerine geçer."""
+    return loads(r.content)
+
+
+# ---- URL seçiciler ---------------------------------------------------------
+def _cand0(iv):
+    """image_versions2 değerinden candidates[0].url (yoksa None)."""
+    if iv.__class__ is dict:
+        c = iv.get("candidates")
+        if c.__class__ is list and c:
+            c = c[0]
+            if c.__class__ is dict:
+                return c.get("url")
+    return None
+
+
+def _video0(vv):
+    """video_versions değerinden [0].url (yoksa None)."""
+    if vv.__class__ is list and vv:
+        v = vv[0]
+        if v.__class__ is dict:
+            return v.get("url")
+    return None
+
+
+def _frame(node):
+    """image_versions2.additional_candidates.first_frame (yoksa None)."""
+    iv = node.get("image_versions2")
+    if iv.__class__ is dict:
+        add = iv.get("additional_candidates")
+        if add.__class__ is dict:
+            return add.get("first_frame")
+    return None
+
+
+def _post_thumb_rest(node, u):
+    """Post küçük resminin yedek zinciri: first_frame, smart_thumbnail,
+    thumbnail_url, display_url, medya URL'i, video_versions[0].url."""
+    iv = node.get("image_versions2")
+    if iv.__class__ is dict:
+        add = iv.get("additional_candidates")
+        if add.__class__ is dict:
+            v = add.get("first_frame") or add.get("smart_thumbnail")
+            if v:
+                return v
+    return node.get("thumbnail_url") or node.get("display_url") or u or _video0(node.get("video_versions")) or ""
+
+
+# ---- Post / feed ----------------------------------------------------------
+def normalize_post(it: dict) -> Optional[dict]:
+    """
+    'feed/user' ya da 'clips/user' öğesini tek tipe çevirir.
+    Döner: {type, url, thumb, caption, download_url, like_count, comment_count, view_count, timestamp}
+    """
+    out = normalize_posts((it,))
+    return out[0] if out else None
+
+
+def normalize_posts(items: Iterable, unwrap: bool = False, videos_only: bool = False,
+                    clips_only: bool = False, limit: Optional[int] = None) -> List[dict]:
+    """
+    Bir sayfa öğeyi normalize_post biçimine çevirir.
+    unwrap: {"media": ...} / {"item": ...} sarmalını aç; videos_only: yalnızca video;
+    clips_only: product_type=clips ya da clips_metadata olanlar.
+    """
+    out = []
+    for it in (items or ()):
+        if it.__class__ is not dict:
+            continue
+        if unwrap:
+            it = it.get("media") or it.get("item") or it
+            if it.__class__ is not dict:
+                continue
+        if clips_only and (it.get("product_type") or "").lower() != "clips" and not it.get("clips_metadata"):
+            continue
+        if not it:
+            continue
+
+        src = it
+        if it.get("media_type") == 8:
+            cm = it.get("carousel_media")
+            if cm:
+                src = cm[0] or {}
+        vv = src.get("video_versions")
+        if vv:
+            u, mtype = _video0(vv) or "", "video"
+            thumb = _cand0(src.get("image_versions2"))
+        elif videos_only:
+            continue
+        else:
+            thumb = u = _cand0(src.get("image_versions2")) or ""
+            mtype = "image"
+        if not thumb:
+            thumb = _post_thumb_rest(src, u)
+
+        cap = it.get("caption")
+        cap = cap.get("text") if cap.__class__ is dict else None
+        like_count = it.get("like_count") or it.get("play_count") or 0
+        view_count = it.get("view_count") or it.get("play_count") or (like_count if mtype == "video" else 0)
+        out.append({
+            "type": mtype,
+            "url": u,
+            "thumb": thumb or u,
+            "caption": cap.strip()[:160] if cap.__class__ is str else "",
+            "download_url": u,
+            "like_count": int(like_count or 0),
+            "comment_count": int(it.get("comment_count") or 0),
+            "view_count": int(view_count or 0),
+            "timestamp": int(it.get("taken_at") or 0),
+        })
+        if limit is not None and len(out) >= limit:
+            break
+    return out
+
+
+# ---- Reels (api_user_reels) ----------------------------------------------
+def normalize_reels(items: Iterable, ts_start: Optional[int] = None, ts_end: Optional[int] = None) -> List[dict]:
+    """
+    clips/user ya da feed/user öğelerinden reels kartları; tarih aralığı filtresi
+    ve id bazlı tekilleştirme aynı geçişte yapılır.
+    """
+    out, seen = [], set()
+    for it in (items or ()):
+        if it.__class__ is not dict:
+            continue
+        node = it.get("media", it) or {}
+        clips_meta = node.get("clips_metadata") or {}
+        if (node.get("product_type") or it.get("product_type")) != "clips" and not clips_meta:
+            continue
+
+        vurl = _video0(node.get("video_versions") or clips_meta.get("video_versions"))
+        if not vurl or vurl.__class__ is not str:
+            continue
+
+        ts = int(node.get("taken_at") or it.get("taken_at") or 0)
+        if ts_start and ts < ts_start:
+            continue
+        if ts_end and ts > ts_end:
+            continue
+
+        sid = node.get("pk") or node.get("id") or node.get("shortcode") or node.get("code")
+        _id = str(sid) if sid is not None else vurl.split("?")[0]
+        if _id in seen:
+            continue
+        seen.add(_id)
+
+        likes    = node.get("like_count") or it.get("like_count") or 0
+        comments = node.get("comment_count") or it.get("comment_count") or 0
+        views    = node.get("view_count") or node.get("play_count") or it.get("view_count") or 0
+        out.append({
+            "id": _id,
+            "type": "video",
+            "url": vurl,
+            "thumb": _cand0(node.get("image_versions2")) or node.get("thumbnail_url") or _frame(node) or "",
+            "download_url": vurl,
+            "like_count": int(likes or 0),
+            "comment_count": int(comments or 0),
+            "view_count": int(views or 0),
+            "timestamp": ts,
+        })
+    return out
+
+
+# ---- Story / highlight ----------------------------------------------------
+def normalize_simple(items: Iterable, shape: str, limit: Optional[int] = None) -> List[dict]:
+    """
+    Story/highlight öğelerini karta çevirir; URL'siz öğeler atlanır.
+      story     → {media_url, thumb, type}
+      highlight → {type, url, thumb}
+      hl_item   → {type, url, thumb, caption}  (küçük resimde first_frame yedeği yok)
+    limit: işlenecek en fazla öğe sayısı (highlight önizlemesi için).
+    """
+    if shape not in ("story", "highlight", "hl_item"):
+        raise ValueError(f"unknown shape: {shape}")
+    items = items or ()
+    if limit is not None:
+        items = items[:limit]
+    out = []
+    for it in items:
+        if it.__class__ is not dict:
+            continue
+        thumb = _cand0(it.get("image_versions2"))
+        vv = it.get("video_versions")
+        if vv:
+            u, typ = _video0(vv), "video"
+        else:
+            u, typ = thumb, "image"
+        if not u:
+            continue
+        if shape == "story":
+            out.append({"media_url": u, "thumb": thumb or _frame(it) or "", "type": typ})
+        elif shape == "highlight":
+            out.append({"type": typ, "url": u, "thumb": thumb or _frame(it) or ""})
+        else:
+            out.append({"type": typ, "url": u, "thumb": thumb or "", "caption": ""})
+    return out
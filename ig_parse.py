@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# /var/www/instavido/ig_parse.py
+"""
+Instagram HTML sayfalarına gömülü JSON'u çıkarma yardımcıları.
+
+Parantez saymak yerine anchor str.find ile bulunur, gerisi json'un C
+tarayıcısına (JSONDecoder.raw_decode) bırakılır: string içindeki { } ve
+kaçışlı karakterler doğru ele alınır, \\u0026 / \\/ zaten JSON tarafından çözülür.
+"""
+import json, re
+from typing import Optional
+
+_DECODER = json.JSONDecoder()
+_WS = " \t\r\n"
+# Tampon sonunda yarım kalmış olabilecek sayı / true / false / null parçası
+_TOKEN_TAIL = re.compile(r"[\s0-9eE.+\-truefalsn]*\Z")
+
+
+def _incomplete(buf: str, e: json.JSONDecodeError) -> bool:
+    """Çözme hatası tamponun sonundaki yarım token'dan mı (daha fazla veri gerekir)?"""
+    n = len(buf)
+    if e.pos >= n - 1 or e.msg.startswith("Unterminated string"):
+        return True
+    if e.msg.startswith("Invalid \\uXXXX escape"):
+        return e.pos >= n - 6
+    return _TOKEN_TAIL.match(buf, e.pos) is not None
+
+
+def extract_object_from(text: str, key: str) -> Optional[dict]:
+    """
+    text içinde '"<key>":' ardından gelen ilk geçerli JSON obje/dizisini
+    çözer. Döner: {key: değer} veya None.
+    """
+    if not text:
+        return None
+    anchor = f'"{key}":'
+    start, n = 0, len(text)
+    while True:
+        i = text.find(anchor, start)
+        if i == -1:
+            return None
+        j = i + len(anchor)
+        while j < n and text[j] in _WS:
+            j += 1
+        if j < n and text[j] in "{[":
+            try:
+                val, _end = _DECODER.raw_decode(text, j)
+                return {key: val}
+            except ValueError:
+                pass   # kesik/kaçışlı bağlam: sonraki geçişi dene
+        start = j
+
+
+class StreamScanner:
+    """
+    Parça parça gelen HTML'de hedef JSON objelerini ve regex'leri artımlı arar.
+    feed() tüm hedefler bulununca True döner: çağıran bağlantıyı erkenden kapatabilir.
+    Tampon yalnızca henüz tamamlanmamış objeyi ve kısa bir örtüşme payını tutar.
+    """
+    OVERLAP = 4096   # parça sınırına denk gelen anchor/regex eşleşmeleri için
+
+    def __init__(self, keys=(), patterns=None):
+        self.results = {}
+        self._keys = {k: 0 for k in keys}    # key -> anchor aramasının başlayacağı yer
+        self._patterns = dict(patterns or {})
+        self._pending = {}                   # key -> değerin başladığı yer
+        self._buf = ""
+        self._scanned = 0                    # regex aramasının ulaştığı yer
+
+    @property
+    def done(self) -> bool:
+        return not self._keys and not self._patterns and not self._pending
+
+    def feed(self, chunk: str) -> bool:
+        if not chunk or self.done:
+            return self.done
+        self._buf += chunk
+        buf, n = self._buf, len(self._buf)
+
+        for name in list(self._patterns):
+            m = self._patterns[name].search(buf, max(0, self._scanned - self.OVERLAP))
+            if m:
+                self.results[name] = m
+                del self._patterns[name]
+        self._scanned = n
+
+        progress = True
+        while progress:   # reddedilen geçişten sonra aynı tamponda sonrakini ara
+            progress = False
+            for key in list(self._keys):
+                anchor = f'"{key}":'
+                i = buf.find(anchor, self._keys[key])
+                if i == -1:
+                    self._keys[key] = max(0, n - len(anchor))
+                    continue
+                del self._keys[key]
+                self._pending[key] = i + len(anchor)
+
+            for key, j in list(self._pending.items()):
+                while j < n and buf[j] in _WS:
+                    j += 1
+                self._pending[key] = j
+                if j >= n:
+                    continue
+                if buf[j] in "{[":
+                    try:
+                        val, _end = _DECODER.raw_decode(buf, j)
+                        self.results[key] = {key: val}
+                        del self._pending[key]
+                        continue
+                    except json.JSONDecodeError as e:
+                        if _incomplete(buf, e):
+                            continue   # parça sınırı: daha fazla veri gerekiyor
+                # obje/dizi değil ya da bozuk: sonraki geçişi ara
+                del self._pending[key]
+                self._keys[key] = j
+                progress = True
+
+        # Artık gerekmeyen baştaki kısmı at
+        keep = min([n - self.OVERLAP] + list(self._pending.values()) + list(self._keys.values()))
+        if keep > 0:
+            self._buf = buf[keep:]
+            self._scanned -= keep
+            for d in (self._pending, self._keys):
+                for k in d:
+                    d[k] -= keep
+        return self.done
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# /var/www/instavido/img_cache.py
+"""
+/img_proxy için disk cache'i.
+
+Anahtar: normalize edilmiş CDN URL'sinin sha256'sı. İmza/yönlendirme
+parametreleri (oh, oe, _nc_*) ve IG CDN host'u anahtara girmez; böylece
+aynı görselin her yeni imzalı linki aynı dosyaya düşer.
+
+Yerleşim: <IMG_CACHE_DIR>/ab/cd/<sha256>.bin  + .json (mime, etag, size)
+Tahliye: mtime'a göre LRU; toplam boyut IMG_CACHE_MAX_BYTES'ı geçince
+en eski dosyalar silinir (worker'lar arası flock ile tek süpürücü).
+"""
+import os, json, time, hashlib, tempfile, threading, logging, fcntl
+from urllib.parse import urlparse, parse_qsl, urlencode
+from typing import Optional, Dict, Any, Iterable, Iterator, Callable
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMG_CACHE_DIR       = os.getenv("IMG_CACHE_DIR", os.path.join(BASE_DIR, ".img_cache"))
+IMG_CACHE_MAX_BYTES = int(os.getenv("IMG_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # 2 GB
+IMG_CACHE_ENABLED   = IMG_CACHE_MAX_BYTES > 0
+
+EVICT_LOW_WATERMARK = 0.9          # süpürme bu orana kadar siler
+TOUCH_INTERVAL_SEC  = 300          # her hit'te değil, 5 dk'da bir mtime güncelle
+SWEEP_EVERY_BYTES   = max(IMG_CACHE_MAX_BYTES // 20, 16 * 1024 * 1024)
+TMP_MAX_AGE_SEC     = 600          # yarıda kalan (öldürülen worker) .img_* geçici dosyaları
+
+# CDN'in her istekte değiştirdiği imza / edge parametreleri
+_VOLATILE_PARAMS = {"oh", "oe", "_nc_ohc", "_nc_oc", "_nc_gid", "_nc_ht", "_nc_sid", "_nc_zt", "ccb", "edm"}
+_IG_CDN_SUFFIXES = (".fbcdn.net", ".cdninstagram.com", ".cdninstagram.org")
+
+log = logging.getLogger("img_cache")
+
+_written_since_sweep = 0
+_sweep_lock = threading.Lock()
+
+
+def normalize_url(url: str) -> str:
+    pu = urlparse(url or "")
+    host = (pu.hostname or "").lower()
+    if host.endswith(_IG_CDN_SUFFIXES):
+        host = "igcdn"   # scontent-xxx edge'leri aynı içeriği verir
+    qs = sorted((k, v) for k, v in parse_qsl(pu.query, keep_blank_values=True) if k not in _VOLATILE_PARAMS)
+    return f"{host}{pu.path}?{urlencode(qs)}"
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def etag_for(url: str) -> str:
+    return cache_key(url)[:32]
+
+
+def _paths(key: str):
+    d = os.path.join(IMG_CACHE_DIR, key[:2], key[2:4])
+    return d, os.path.join(d, key + ".bin"), os.path.join(d, key + ".json")
+
+
+def lookup(url: str) -> Optional[Dict[str, Any]]:
+    """Cache'te varsa {"path", "mime", "etag", "size"} döner."""
+    if not IMG_CACHE_ENABLED:
+        return None
+    key = cache_key(url)
+    _, body_path, meta_path = _paths(key)
+    try:
+        st = os.stat(body_path)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    now = time.time()
+    if now - st.st_mtime > TOUCH_INTERVAL_SEC:
+        try:
+            os.utime(body_path, (now, now))
+        except OSError:
+            pass
+    meta["path"] = body_path
+    return meta
+
+
+def store_stream(url: str, mime: str, chunks: Iterable[bytes],
+                 is_complete: Callable[[], bool] = lambda: True) -> Iterator[bytes]:
+    """
+    chunks'ı olduğu gibi yield eder ve aynı anda geçici dosyaya yazar.
+    Akış hatasız biter ve is_complete() True dönerse dosya yerine taşınır;
+    aksi halde (istemci koptu, boyut sınırı aşıldı...) geçici dosya silinir.
+    """
+    if not IMG_CACHE_ENABLED:
+        yield from chunks
+        return
+
+    key = cache_key(url)
+    d, body_path, meta_path = _paths(key)
+    tmp_path, f, total, done = None, None, 0, False
+    try:
+        os.makedirs(d, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".img_", dir=d)
+        f = os.fdopen(fd, "wb")
+    except OSError as e:
+        log.warning(f"img_cache open error: {e}")
+        f = None
+
+    try:
+        for chunk in chunks:
+            if f is not None:
+                try:
+                    f.write(chunk)
+                    total += len(chunk)
+                except OSError:
+                    f.close(); f = None
+            yield chunk
+        done = True
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            try: close()
+            except Exception: pass
+        if f is not None:
+            try:
+                f.close()
+                if done and total and is_complete():
+                    meta = {"mime": mime, "etag": key[:32], "size": total, "stored_at": int(time.time())}
+                    with open(meta_path + ".tmp", "w", encoding="utf-8") as mf:
+                        json.dump(meta, mf)
+                    os.replace(tmp_path, body_path)
+                    os.replace(meta_path + ".tmp", meta_path)
+                    tmp_path = None
+                    _account(total)
+            except OSError as e:
+                log.warning(f"img_cache commit error: {e}")
+        if tmp_path:
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+
+def _account(nbytes: int):
+    global _written_since_sweep
+    with _sweep_lock:
+        _written_since_sweep += nbytes
+        if _written_since_sweep < SWEEP_EVERY_BYTES:
+            return
+        _written_since_sweep = 0
+    threading.Thread(target=sweep, name="img-cache-sweep", daemon=True).start()
+
+
+def sweep() -> int:
+    """
+    Toplam boyut bütçeyi aşıyorsa en eski (mtime) dosyaları siler; TMP_MAX_AGE_SEC'ten
+    eski .img_* geçici dosyaları her durumda temizler. Döner: silinen byte.
+    """
+    os.makedirs(IMG_CACHE_DIR, exist_ok=True)
+    lock_path = os.path.join(IMG_CACHE_DIR, ".sweep.lock")
+    with open(lock_path, "w") as lf:
+        try:
+            fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return 0   # başka worker zaten süpürüyor
+
+        entries, total, tmp_freed = [], 0, 0
+        tmp_cutoff = time.time() - TMP_MAX_AGE_SEC
+        for root, _dirs, files in os.walk(IMG_CACHE_DIR):
+            for name in files:
+                is_tmp = name.startswith(".img_")
+                if not (is_tmp or name.endswith(".bin")):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                if is_tmp:
+                    if st.st_mtime < tmp_cutoff:
+                        try:
+                            os.remove(p)
+                            tmp_freed += st.st_size
+                        except OSError:
+                            pass
+                    else:
+                        total += st.st_size   # yazımı süren dosya da bütçeden yer tutar
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+
+        if total <= IMG_CACHE_MAX_BYTES:
+            if tmp_freed:
+                log.info(f"img_cache sweep: freed={tmp_freed} (stale tmp)")
+            return tmp_freed
+
+        target = int(IMG_CACHE_MAX_BYTES * EVICT_LOW_WATERMARK)
+        freed = 0
+        entries.sort()
+        for _mtime, size, p in entries:
+            if total - freed <= target:
+                break
+            for path in (p, p[:-4] + ".json"):
+                try: os.remove(path)
+                except OSError: pass
+            freed += size
+        log.info(f"img_cache sweep: freed={freed} tmp_freed={tmp_freed} total_before={total}")
+        return freed + tmp_freed
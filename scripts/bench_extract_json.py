@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /var/www/instavido/scripts/bench_extract_json.py
+"""
+Gömülü JSON çıkarıcı: doğruluk fikstürleri + eski (parantez sayan)
+implementasyonla hız karşılaştırması. Aynı fikstürler StreamScanner'a her
+parça boyutunda (1..64, 4096, 65536) beslenir: parça sınırı token ortasına
+düştüğünde de obje bulunmalı.
+
+    python3 scripts/bench_extract_json.py            # fikstürler + sentetik sayfa
+    python3 scripts/bench_extract_json.py page.html  # kayıtlı profil HTML'i ile
+Çıkış kodu: fikstürlerden biri başarısızsa 1.
+"""
+import json, os, sys
+
+import benchlib
+from ig_parse import extract_object_from, StreamScanner  # noqa: E402
+
+KEY = "edge_owner_to_timeline_media"
+
+
+def legacy_extract(text, key):
+    """app.py'deki eski _extract_object_from (karşılaştırma için birebir kopya)."""
+    try:
+        anchor = f'"{key}":'
+        i = text.find(anchor)
+        if i == -1:
+            return None
+        j = i + len(anchor)
+        while j < len(text) and text[j] not in "{[":
+            j += 1
+        if j >= len(text):
+            return None
+        open_char = text[j]
+        close_char = "}" if open_char == "{" else "]"
+        depth, k = 0, j
+        while k < len(text):
+            c = text[k]
+            if c == open_char:
+                depth += 1
+            elif c == close_char:
+                depth -= 1
+                if depth == 0:
+                    blob = text[i:k+1]
+                    js = "{" + blob + "}"
+                    js = js.replace("\\u0026", "&").replace("\\/", "/")
+                    return json.loads(js)
+            k += 1
+        return None
+    except Exception:
+        return None
+
+
+def _media(n, caption="güzel bir gün"):
+    edges = [{"node": {"id": str(1000 + i), "shortcode": f"SC{i}", "is_video": i % 2 == 0,
+                       "display_url": benchlib.cdn_url(i),
+                       "edge_media_to_caption": {"edges": [{"node": {"text": caption}}]}}} for i in range(n)]
+    return {"count": n, "page_info": {"has_next_page": True, "end_cursor": "QVFD"}, "edges": edges}
+
+
+def _page(obj_json, before="", after=""):
+    return ('<html><head><script type="text/javascript">window._sharedData = {"entry_data":{"ProfilePage":[{"graphql":{"user":{'
+            + before + f'"{KEY}":' + obj_json + after + '}}}]}};</script></head><body></body></html>')
+
+
+def fixtures():
+    plain = _media(3)
+    yield "plain", _page(json.dumps(plain)), {KEY: plain}
+
+    braces = _media(2, caption="süslü } parantez { ve ] köşeli [ ")
+    yield "braces-in-strings", _page(json.dumps(braces)), {KEY: braces}
+
+    quotes = _media(2, caption='tırnak \\" ve } kaçış')
+    yield "escaped-quotes", _page(json.dumps(quotes)), {KEY: quotes}
+
+    raw = '{"count":1,"edges":[{"node":{"display_url":"https:\\/\\/x.cdninstagram.com\\/a.jpg?x=1\\u0026y=2"}}]}'
+    yield "slash-and-u0026", _page(raw), {KEY: json.loads(raw)}
+
+    ws = _media(1)
+    yield "whitespace-after-colon", _page(" \n " + json.dumps(ws)).replace(f'"{KEY}": \n ', f'"{KEY}":\n  '), {KEY: ws}
+
+    arr = [1, {"a": "]"}, [2, 3]]
+    yield "array-value", _page(json.dumps(arr)), {KEY: arr}
+
+    yield "missing", "<html>no data</html>", None
+
+    lit = {"count": -12, "ratio": 1.5e+3, "flags": [True, False, None, 0, -0.25, 1E-7],
+           "edges": [{"node": {"is_video": i % 2 == 0, "owner": None, "n": -i, "text": "çğ \" }"}} for i in range(20)]}
+    yield "literals-and-numbers", _page(json.dumps(lit)), {KEY: lit}
+
+    yield "null-then-object", _page("null," + f'"{KEY}":' + json.dumps(lit)), {KEY: lit}
+
+    good = _media(1)
+    yield "first-occurrence-truncated", ('"' + KEY + '":{"count": 1, "edges": [' + "\n" + _page(json.dumps(good))), {KEY: good}
+
+
+def run_fixtures(checks):
+    for name, text, expected in fixtures():
+        old = legacy_extract(text, KEY)
+        checks.report(extract_object_from(text, KEY) == expected, f"{name:<28}",
+                      f"legacy={'ok' if old == expected else 'WRONG'}")
+
+
+STREAM_CHUNKS = list(range(1, 65)) + [4096, 65536]
+
+
+def stream_extract(text, chunk):
+    sc = StreamScanner([KEY])
+    for i in range(0, len(text), chunk):
+        if sc.feed(text[i:i + chunk]):
+            break
+    return sc.results.get(KEY)
+
+
+def run_stream_fuzz(checks):
+    for name, text, expected in fixtures():
+        lost = [c for c in STREAM_CHUNKS if stream_extract(text, c) != expected]
+        checks.report(not lost, f"stream/{name:<21}",
+                      f"parça={lost}" if lost else f"{len(STREAM_CHUNKS)} parça boyutu")
+
+
+def main():
+    checks = benchlib.Checks()
+    run_fixtures(checks)
+    run_stream_fuzz(checks)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8", errors="replace") as f:
+            pages = {os.path.basename(sys.argv[1]): f.read()}
+    else:
+        filler = '<script>var noise = "' + ("x" * 4096) + '";</script>\n'
+        pages = {"synthetic-3MB": filler * 350 + _page(json.dumps(_media(600))) + filler * 350}
+    for pname, text in pages.items():
+        n = 5 if len(text) > 1_000_000 else 50
+        print(f"\n{pname}: {len(text) / 1e6:.1f} MB, {n} tekrar")
+        t_old, t_new = benchlib.timeit((lambda t: legacy_extract(t, KEY), lambda t: extract_object_from(t, KEY)),
+                                       text, n, repeat=3)
+        for name, us in (("legacy", t_old), ("raw_decode", t_new)):
+            print(f"  {name:<11} {us / 1000:8.2f} ms/çağrı")
+    checks.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /var/www/instavido/scripts/bench_media_normalize.py
+"""
+Medya normalizer karşılaştırması: app.py'deki eski öğe→kart dönüşümleri
+(birebir kopya) vs ig_media; ayrıca r.json() (stdlib json) vs orjson çözme.
+
+Her akış için eski ve yeni çıktının birebir aynı olduğu doğrulanır.
+    python3 scripts/bench_media_normalize.py                     # sentetik sayfalar
+    python3 scripts/bench_media_normalize.py feed.json reels.json  # kayıtlı API yanıtları
+Kayıtlı yanıtlarda öğeler items / clips / reels_media[0].items altından alınır.
+Çıkış kodu: bir akışta çıktı farklıysa 1.
+"""
+import json, os, sys
+from typing import Optional
+
+import benchlib
+from benchlib import cdn_url
+import ig_media  # noqa: E402
+
+
+
+# ---- app.py'deki eski implementasyonlar (karşılaştırma için) -------------
+def legacy_pick_thumb(node: dict, fallback_url: str = "") -> str:
+    """
+    Bir medya düğümünden en iyi küçük resmi çıkartır; çoklu fallback.
+    """
+    if not isinstance(node, dict):
+        return fallback_url or ""
+    # 1) image_versions2.candidates[0].url
+    try:
+        cand = (node.get("image_versions2", {}) or {}).get("candidates") or []
+        if cand and cand[0].get("url"): 
+            return cand[0]["url"]
+    except Exception:
+        pass
+    # 2) additional_candidates.first_frame (video'larda)
+    try:
+        add = (node.get("image_versions2", {}) or {}).get("additional_candidates", {}) or {}
+        if add.get("first_frame"):
+            return add["first_frame"]
+        if add.get("smart_thumbnail"):
+            return add["smart_thumbnail"]
+    except Exception:
+        pass
+    # 3) thumbnail_url
+    if node.get("thumbnail_url"):
+        return node["thumbnail_url"]
+    # 4) display_url (GQL tarafında)
+    if node.get("display_url"):
+        return node["display_url"]
+    # 5) video_versions ilk frame yoksa: video url'i bile olsa göster (son çare)
+    if node.get("video_versions"):
+        return fallback_url or (node["video_versions"][0].get("url") if node["video_versions"] else "") or ""
+    # 6) en sonda fallback param
+    return fallback_url or ""
+
+
+def legacy_normalize_post_item(it: dict) -> Optional[dict]:
+    """
+    Instagram 'feed/user' ya da 'clips/user' itemlerini tek tipe çevirir.
+    Döner: {type, url, thumb, download_url, like_count, comment_count, view_count, timestamp}
+    """
+    if not it:
+        return None
+
+    node = it  # bazı akışlarda it zaten media düğümü
+    # carousel
+    if it.get("media_type") == 8 and it.get("carousel_media"):
+        first = it["carousel_media"][0] or {}
+        if first.get("video_versions"):
+            u = (first["video_versions"][0] or {}).get("url", "")
+            mtype = "video"
+        else:
+            u = (((first.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
+            mtype = "image"
+        thumb = legacy_pick_thumb(first, u)
+    else:
+        if it.get("video_versions"):
+            u = (it["video_versions"][0] or {}).get("url", "")
+            mtype = "video"
+        else:
+            u = (((it.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
+            mtype = "image"
+        thumb = legacy_pick_thumb(it, u)
+
+    # caption
+    cap_txt = ""
+    try:
+        cap = it.get("caption") or {}
+        cap_txt = (cap.get("text") or "").strip()
+    except Exception:
+        pass
+
+    # sayılar
+    like_count = it.get("like_count") or (it.get("like_and_view_counts_disabled") and 0) or it.get("play_count") or 0
+    comment_count = it.get("comment_count") or 0
+    view_count = it.get("view_count") or it.get("play_count") or (like_count if mtype == "video" else 0)
+    ts = it.get("taken_at") or 0
+
+    return {
+        "type": mtype,
+        "url": u,
+        "thumb": thumb or u,  # thumb boş kalmasın
+        "caption": (cap_txt or "")[:160],
+        "download_url": u,
+        "like_count": int(like_count or 0),
+        "comment_count": int(comment_count or 0),
+        "view_count": int(view_count or 0),
+        "timestamp": int(ts or 0)
+    }
+
+
+def legacy_posts(items):
+    out = []
+    for it in (items or []):
+        n = legacy_normalize_post_item(it)
+        if n:
+            out.append(n)
+    return out
+
+
+def legacy_clips(items):
+    out = []
+    for it in (items or []):
+        media = it.get("media") or it.get("item") or it
+        n = legacy_normalize_post_item(media)
+        if n and n["type"] == "video":
+            out.append(n)
+    return out
+
+
+def legacy_reels(items_raw, ts_start=None, ts_end=None):
+    def strip_query(u: str) -> str:
+        try:    return (u or "").split("?")[0]
+        except: return u or ""
+
+    def first_url(node, key):
+        try:
+            arr = node.get(key, {}).get("candidates") or []
+            return (arr[0] or {}).get("url", "")
+        except Exception:
+            return ""
+
+    def pick_id(node: dict, fallback_url: str) -> str:
+        sid = (node.get("pk") or node.get("id") or node.get("shortcode") or node.get("code"))
+        if sid is None:
+            sid = strip_query(fallback_url or "")
+        return str(sid)
+
+    out = []
+    seen = set()
+    for it in items_raw:
+        node = it.get("media", it) or {}
+        ptype = node.get("product_type") or it.get("product_type")
+        clips_meta = node.get("clips_metadata") or {}
+        is_reel = (ptype == "clips") or bool(clips_meta)
+        if not is_reel:
+            continue
+
+        vvers = node.get("video_versions") or clips_meta.get("video_versions")
+        if not vvers:
+            continue
+
+        vurl = (vvers[0] or {}).get("url", "")
+        if not vurl:
+            continue
+
+        thumb = first_url(node, "image_versions2")
+        if not thumb:
+            thumb = node.get("thumbnail_url") \
+                 or node.get("image_versions2",{}).get("additional_candidates",{}).get("first_frame", "")
+
+        ts = int(node.get("taken_at") or it.get("taken_at") or 0)
+
+        # tarih filtresi burada uygulanır
+        if ts_start and ts < ts_start:
+            continue
+        if ts_end and ts > ts_end:
+            continue
+
+        _id = pick_id(node, vurl)
+        if _id in seen:
+            continue
+        seen.add(_id)
+
+        likes    = node.get("like_count") or it.get("like_count") or 0
+        comments = node.get("comment_count") or it.get("comment_count") or 0
+        views    = node.get("view_count") or node.get("play_count") or it.get("view_count") or 0
+
+        out.append({
+            "id": _id,
+            "type": "video",
+            "url": vurl,
+            "thumb": thumb,
+            "download_url": vurl,
+            "like_count": int(likes or 0),
+            "comment_count": int(comments or 0),
+            "view_count": int(views or 0),
+            "timestamp": ts
+        })
+    return out
+
+
+def _first_image(it: dict) -> str:
+    try:
+        cands = (it.get("image_versions2", {}).get("candidates") or [])
+        if cands:
+            u = (cands[0] or {}).get("url", "")
+            if u: return u
+    except Exception:
+        pass
+    try:
+        u = it.get("image_versions2", {}).get("additional_candidates", {}).get("first_frame", "")
+        if u: return u
+    except Exception:
+        pass
+    return ""
+
+
+def legacy_stories(items):
+    stories = []
+    for it in items:
+        thumb = _first_image(it)
+        if it.get("video_versions"):
+            media_url = (it["video_versions"][0] or {}).get("url", "")
+            typ = "video"
+        elif it.get("image_versions2"):
+            media_url = ((it.get("image_versions2", {}).get("candidates") or [{}])[0]).get("url", "")
+            typ = "image"
+        else:
+            continue
+        if not media_url:
+            continue
+        stories.append({"media_url": media_url, "thumb": thumb, "type": typ})
+    return stories
+
+
+def legacy_hl_items(raw_items):
+    out = []
+    for it in raw_items:
+        try:
+            thumb = (((it.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
+            if it.get("video_versions"):
+                media_url = (it["video_versions"][0] or {}).get("url", "")
+                typ = "video"
+            else:
+                media_url = (((it.get("image_versions2", {}) or {}).get("candidates") or [{}])[0]).get("url", "")
+                typ = "image"
+            if media_url:
+                out.append({"type": typ, "url": media_url, "thumb": thumb, "caption": ""})
+        except Exception:
+            continue
+    return out
+
+
+# ---- Sentetik sayfalar ----------------------------------------------------
+def _image_versions(i, frame=False):
+    iv = {"candidates": [{"width": w, "height": w, "url": cdn_url(f"{i}_{w}")} for w in (1080, 750, 640, 480, 320, 240, 150)]}
+    if frame:
+        iv["additional_candidates"] = {"igtv_first_frame": {"url": cdn_url(f"{i}_ig")},
+                                       "first_frame": cdn_url(f"{i}_ff"), "smart_thumbnail": None}
+    return iv
+
+
+def _video_versions(i):
+    return [{"type": t, "width": 720, "height": 1280, "url": cdn_url(f"{i}_{t}", "mp4"),
+             "id": f"{i}{t}"} for t in (101, 102, 103)]
+
+
+def _item(i, child=False):
+    """Gerçek yanıtlara yakın, geniş bir öğe: çok sayıda kullanılmayan alan da içerir."""
+    kind = i % 5
+    it = {
+        "pk": str(3400000000000000000 + i), "id": f"{3400000000000000000 + i}_123", "code": f"C{i:09d}",
+        "taken_at": 1720000000 + i * 3600, "media_type": 2 if kind in (0, 1) else 1,
+        "product_type": "clips" if kind == 0 else ("feed" if kind != 4 else "carousel_container"),
+        "user": {"pk": "123", "username": "someuser", "full_name": "Some User", "is_private": False,
+                 "profile_pic_url": cdn_url("pp"), "friendship_status": {"following": False}},
+        "caption": {"text": ("  çok güzel bir gün 🌞 #tag " * 12) if i % 7 else None, "pk": str(i)},
+        "like_count": 0 if i % 11 == 0 else 100 + i, "comment_count": i % 13,
+        "like_and_view_counts_disabled": i % 11 == 0, "has_liked": False,
+        "location": {"name": "İstanbul", "lat": 41.0, "lng": 28.9}, "usertags": {"in": []},
+        "image_versions2": _image_versions(i, frame=kind in (0, 1)),
+        "original_width": 1080, "original_height": 1350,
+    }
+    if kind in (0, 1):
+        it["video_versions"] = _video_versions(i)
+        it["play_count"] = 1000 + i
+        if i % 3 == 0:
+            it["view_count"] = 900 + i
+    if kind == 0:
+        it["clips_metadata"] = {"music_info": None, "original_sound_info": {"audio_asset_id": str(i)}}
+    if kind == 4 and not child:
+        it["media_type"] = 8
+        it["carousel_media"] = [dict(_item(i + 1000 + k, child=True), media_type=1, carousel_parent_id=it["id"]) for k in range(3)]
+    if i % 17 == 0:
+        it.pop("image_versions2")
+        it["thumbnail_url"] = cdn_url(f"{i}_tn")
+    if i % 19 == 0 and kind in (0, 1):
+        it["image_versions2"] = {"candidates": []}
+    return it
+
+
+def synthetic():
+    feed = [_item(i) for i in range(60)]
+    clips = [{"media": _item(i * 5)} for i in range(50)]
+    story = [{k: v for k, v in _item(i).items() if k != "carousel_media"} for i in range(40)]
+    story.append({"pk": "x", "taken_at": 1})     # medyasız öğe: atlanmalı
+    return {"feed": {"items": feed}, "clips": {"items": clips}, "story": {"reels_media": [{"items": story}]}}
+
+
+def _items_of(doc):
+    if isinstance(doc.get("reels_media"), list) and doc["reels_media"]:
+        return doc["reels_media"][0].get("items") or []
+    return doc.get("items") or doc.get("clips") or []
+
+
+# ---- Akışlar: (ad, eski, yeni) -------------------------------------------
+FLOWS = (
+    ("posts",     legacy_posts,    lambda xs: ig_media.normalize_posts(xs)),
+    ("clips",     legacy_clips,    lambda xs: ig_media.normalize_posts(xs, unwrap=True, videos_only=True)),
+    ("reels",     legacy_reels,    lambda xs: ig_media.normalize_reels(xs)),
+    ("reels+ts",  lambda xs: legacy_reels(xs, 1720000000 + 3600 * 10, 1720000000 + 3600 * 200),
+                  lambda xs: ig_media.normalize_reels(xs, 1720000000 + 3600 * 10, 1720000000 + 3600 * 200)),
+    ("stories",   legacy_stories,  lambda xs: ig_media.normalize_simple(xs, "story")),
+    ("hl_items",  legacy_hl_items, lambda xs: ig_media.normalize_simple(xs, "hl_item")),
+)
+
+
+def main():
+    if len(sys.argv) > 1:
+        pages = {}
+        for p in sys.argv[1:]:
+            with open(p, "rb") as f:
+                pages[os.path.basename(p)] = f.read()
+    else:
+        pages = {k: json.dumps(v, ensure_ascii=False).encode("utf-8") for k, v in synthetic().items()}
+
+    backend = "orjson" if ig_media._orjson is not None else "json (orjson kurulu değil)"
+    print(f"JSON backend: {backend}")
+    checks = benchlib.Checks()
+    for pname, raw in pages.items():
+        n = max(200, 20_000_000 // max(1, len(raw)))
+        doc = json.loads(raw)
+        items = _items_of(doc)
+        print(f"\n{pname}: {len(raw) / 1e3:.0f} KB, {len(items)} öğe, {n} tekrar")
+        t_json, t_fast = benchlib.timeit((json.loads, ig_media.loads), raw, n)
+        print(f"  {'decode':<10} json {t_json:9.1f} µs   ig_media {t_fast:9.1f} µs")
+        for fname, old, new in FLOWS:
+            try:
+                expected = old(items)
+            except Exception as e:          # eski kod bazı şemalarda patlıyordu
+                expected = f"<{type(e).__name__}>"
+            got = new(items)
+            if isinstance(expected, str):
+                t_old, (t_new,) = float("nan"), benchlib.timeit((new,), items, n)
+            else:
+                t_old, t_new = benchlib.timeit((old, new), items, n)
+            checks.report(got == expected or isinstance(expected, str), f"{fname:<10}",
+                          f"kart={len(got):<3} eski {t_old:9.1f} µs   yeni {t_new:9.1f} µs"
+                          + (f"  (eski: {expected})" if isinstance(expected, str) else ""))
+    checks.exit()
+
+
+if __name__ == "__main__":
+    main()
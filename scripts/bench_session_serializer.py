@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /var/www/instavido/scripts/bench_session_serializer.py
+"""
+Session serializer karşılaştırması: pickle (Flask-Session varsayılanı) vs
+config.session_serializer (JSON / JSON+zstd).
+
+Örnek session'lar: küçük (yalnızca bayraklar + res_id), eski biçim medya
+sonucu (image_urls + raw_comments session içinde) ve story listesi.
+Çıktı: her biçim için byte ve ortalama dumps/loads süresi (µs).
+
+    python3 scripts/bench_session_serializer.py [--n 20000]
+    python3 scripts/bench_session_serializer.py --redis   # iv_sess:* örneklemi
+"""
+import argparse, json, pickle, time
+
+import benchlib
+from benchlib import cdn_url
+from config.session_serializer import SessionSerializer, _zstd  # noqa: E402
+
+
+def sample_sessions():
+    base = {"_permanent": True, "last": int(time.time()), "gate_passed": True,
+            "last_target": "https://www.instagram.com/p/C9xYzAbCdEf/", "sessionid": "1234567890%3AabcDEF%3A12",
+            "user": "pool_user_7", "from_load": False}
+    small = dict(base, res_id="Zk3mX0aQ1b2C3d4E")
+    comments = [{"user": f"user_{i}", "text": "çok güzel olmuş 😍 " * 3, "ts": 1720000000 + i} for i in range(40)]
+    legacy_media = dict(base, video_url=cdn_url(1, "mp4"),
+                        image_urls=[cdn_url(i) for i in range(10)], thumbnail_url=cdn_url(99),
+                        video_title="instagram_video_C9xYzAbCdEf", raw_comments=json.dumps(comments),
+                        **{"pf::someuser::feed": {"session_key": "3", "next_max_id": "3412345678901234567_123"}})
+    stories = [{"type": "video" if i % 3 == 0 else "image", "media_url": cdn_url(i),
+                "thumb": cdn_url(i + 100), "taken_at": 1720000000 + i} for i in range(30)]
+    legacy_story = dict(base, stories=stories, username="someuser", from_story=True)
+    return {"small(res_id)": small, "legacy_media": legacy_media, "legacy_story": legacy_story}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--redis", action="store_true", help="iv_sess:* anahtarlarından örnek al")
+    args = ap.parse_args()
+
+    codecs = {
+        "pickle": (lambda v: pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+        "json": SessionSerializer(zstd_min_bytes=1 << 62),
+    }
+    if _zstd is not None:
+        codecs["json+zstd"] = SessionSerializer(zstd_min_bytes=0)
+    else:
+        print("(zstandard kurulu değil: json+zstd atlandı)")
+
+    samples = sample_sessions()
+    if args.redis:
+        from config.redis_helpers import get_redis_client
+        r, ser = get_redis_client(), SessionSerializer()
+        for i, k in enumerate(r.scan_iter(match="iv_sess:*", count=500)):
+            if i >= 200:
+                break
+            raw = r.get(k)
+            if raw:
+                try:
+                    samples[k.decode()[-12:]] = ser.loads(raw)
+                except Exception:
+                    pass
+
+    checks = benchlib.Checks()
+    print(f"      {'sample':<16} {'codec':<10} {'bytes':>8} {'dumps µs':>10} {'loads µs':>10}")
+    for name, sess in samples.items():
+        for cname, codec in codecs.items():
+            dumps, loads = (codec.dumps, codec.loads) if isinstance(codec, SessionSerializer) else codec
+            blob = dumps(sess)
+            n = max(1, args.n // (1 + len(blob) // 4096))
+            (t_dumps,), (t_loads,) = benchlib.timeit((dumps,), sess, n, repeat=3), benchlib.timeit((loads,), blob, n, repeat=3)
+            checks.report(loads(blob) == sess, f"{name[:16]:<16} {cname:<10} {len(blob):>8} {t_dumps:>10.1f} {t_loads:>10.1f}")
+    checks.exit()
+
+
+if __name__ == "__main__":
+    main()
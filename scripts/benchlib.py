@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# /var/www/instavido/scripts/benchlib.py
+"""
+scripts/bench_*.py ortak parçaları: repo kökünü import yoluna ekler, sentetik CDN
+URL'i üretir, eski/yeni implementasyonları dönüşümlü ölçer ve PASS/FAIL sayar.
+
+    import benchlib
+    checks = benchlib.Checks()
+    checks.report(got == expected, "fikstür adı", "ek bilgi")
+    t_old, t_new = benchlib.timeit((old, new), arg, n)
+    checks.exit()
+"""
+import os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CDN = ("https://scontent-ist1-1.cdninstagram.com/v/t51.2885-15/{0}_n.{1}"
+       "?stp=dst-jpg_e35&_nc_ht=scontent-ist1-1.cdninstagram.com&oh=00_AfB{0}&oe=66C0FFEE")
+
+
+def cdn_url(tag, ext="jpg") -> str:
+    """Gerçek imzalı CDN linklerine benzer uzunlukta sentetik URL."""
+    return CDN.format(tag, ext)
+
+
+def timeit(fns, arg, n, repeat=7):
+    """
+    fns'i dönüşümlü ölçer, her biri için repeat turun en iyisi (µs / çağrı).
+    Dönüşümlü ölçüm makinedeki yük dalgalanmasını taraflara eşit dağıtır.
+    """
+    best = [float("inf")] * len(fns)
+    for _ in range(repeat):
+        for k, fn in enumerate(fns):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn(arg)
+            best[k] = min(best[k], time.perf_counter() - t0)
+    return [b / n * 1e6 for b in best]
+
+
+class Checks:
+    """Doğruluk kontrollerini yazdırır ve sayar; exit() başarısız varsa 1 ile çıkar."""
+
+    def __init__(self):
+        self.failed = 0
+
+    def report(self, ok, label, detail="") -> bool:
+        self.failed += not ok
+        print(f"{'PASS' if ok else 'FAIL'}  {label}" + (f"  {detail}" if detail else ""))
+        return ok
+
+    def exit(self):
+        sys.exit(1 if self.failed else 0)
@@ -1,54 +1,370 @@
 import json
 import os
 import datetime
+import fcntl
+import threading
+import time
+import atexit
+import queue
+import logging
+from contextlib import contextmanager
 
-NOTIF_LOG = "/var/www/instavido/adminpanel/data/notif_log.json"
-SESSION_LOG = "/var/www/instavido/adminpanel/data/session_use_log.json"
+# Append-only JSONL olay logları (satır başına bir kayıt). Dosya LOG_MAX_BYTES'ı
+# geçince <dosya>.1'e döndürülür (tek nesil yedek). Okuyucular sondan okur (tail_jsonl).
+NOTIF_LOG = "/var/www/instavido/adminpanel/data/notif_log.jsonl"
+SESSION_LOG = "/var/www/instavido/adminpanel/data/session_use_log.jsonl"
+LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
 SESSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.json")
 
+logger = logging.getLogger(__name__)
+
+# ---- Tamponlanmış oturum sayaçları ----
+# İndirme başına sessions.json yeniden yazılmaz: sayaçlar Redis hash'inde birikir
+#   iv_sesscnt  alanları  s:<sid> (success), f:<sid> (fail), l:<sid> (last_used)
+# ve arka plan flusher'ı SESSION_COUNTER_FLUSH_SEC'te bir dosyaya toplu işler.
+SESSCNT_KEY       = "iv_sesscnt"
+SESSCNT_FLUSHING  = "iv_sesscnt:flushing"
+SESSCNT_LOCK      = "iv_sesscnt:lock"
+SESSION_COUNTER_FLUSH_SEC = float(os.getenv("SESSION_COUNTER_FLUSH_SEC", "30"))
+
+_cnt_state = {"pid": None, "client": None, "flusher": None}
+_cnt_lock = threading.Lock()
+
+def _cnt_redis():
+    pid = os.getpid()
+    if _cnt_state["pid"] != pid:
+        with _cnt_lock:
+            if _cnt_state["pid"] != pid:
+                from config.redis_helpers import get_redis_client
+                _cnt_state.update(pid=pid, client=get_redis_client(), flusher=None)
+    return _cnt_state["client"]
+
+@contextmanager
+def sessions_file_lock():
+    """sessions.json'u yazan herkes (flusher, admin panel) bu kilidi alır."""
+    with open(SESSIONS_PATH + ".lock", "w") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+def write_sessions_atomic(sessions):
+    tmp = SESSIONS_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sessions, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, SESSIONS_PATH)
+
+@contextmanager
+def edit_sessions():
+    """
+    sessions.json oku → değiştir → yaz; kilit tüm işlem boyunca tutulur, böylece
+    araya giren sayaç flush'ı ezilmez. Liste yerinde değiştirilmeli; değişmediyse yazılmaz.
+        with edit_sessions() as sessions: ...
+    """
+    with sessions_file_lock():
+        sessions = []
+        if os.path.exists(SESSIONS_PATH):
+            with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
+                sessions = json.load(f)   # bozuksa yaz(ma): tüm havuzu silmeyelim
+        before = json.dumps(sessions, sort_keys=True)
+        yield sessions
+        if json.dumps(sessions, sort_keys=True) != before:
+            write_sessions_atomic(sessions)
+
+def _update_session_counters_file(sessionid, result):
+    # Redis yoksa eski davranış: doğrudan dosyaya yaz
+    if not os.path.exists(SESSIONS_PATH):
+        return
+    with sessions_file_lock():
+        with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
+            sessions = json.load(f)
+        for s in sessions:
+            if s.get("sessionid") == sessionid:
+                # SAYAÇLAR: Alan adları dosyadaki ile birebir aynı olmalı!
+                s["last_used"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                if result == "success":
+                    s["success_count"] = s.get("success_count", 0) + 1
+                elif result == "fail":
+                    s["fail_count"] = s.get("fail_count", 0) + 1
+                write_sessions_atomic(sessions)
+                break
+
 def update_session_counters(sessionid, result="success"):
-    print(">>> update_session_counters ÇAĞRILDI:", sessionid, result)
     # sessionid parametresi zorunlu!
     if not sessionid:
         return
-    if not os.path.exists(SESSIONS_PATH):
+    update_session_counters_many([(sessionid, result)])
+
+def update_session_counters_many(items):
+    """[(sessionid, result), ...] tek pipeline'da."""
+    items = [(sid, res) for sid, res in items if sid]
+    if not items:
         return
-    with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
-        sessions = json.load(f)
-    updated = False
-    for s in sessions:
-        if s.get("sessionid") == sessionid:
-            # SAYAÇLAR: Alan adları dosyadaki ile birebir aynı olmalı!
-            s["last_used"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        r = _cnt_redis()
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        pipe = r.pipeline(transaction=False)
+        for sid, result in items:
+            pipe.hset(SESSCNT_KEY, f"l:{sid}", now)
             if result == "success":
-                s["success_count"] = s.get("success_count", 0) + 1
+                pipe.hincrby(SESSCNT_KEY, f"s:{sid}", 1)
             elif result == "fail":
-                s["fail_count"] = s.get("fail_count", 0) + 1
-            updated = True
-            break
-    if updated:
-        with open(SESSIONS_PATH, "w", encoding="utf-8") as f:
-            json.dump(sessions, f, ensure_ascii=False, indent=2)
+                pipe.hincrby(SESSCNT_KEY, f"f:{sid}", 1)
+        pipe.execute()
+        _ensure_flusher()
+    except Exception:
+        for sid, result in items:
+            _update_session_counters_file(sid, result)
 
-def log_session_use(sessionid, status):
-    if not os.path.exists(SESSION_LOG):
-        with open(SESSION_LOG, "w") as f:
-            json.dump([], f)
+def _parse_counters(raw):
+    out = {}
+    for k, v in (raw or {}).items():
+        k = k.decode() if isinstance(k, bytes) else k
+        v = v.decode() if isinstance(v, bytes) else v
+        kind, _, sid = k.partition(":")
+        d = out.setdefault(sid, {"success": 0, "fail": 0, "last": None})
+        if kind == "s":
+            d["success"] += int(v)
+        elif kind == "f":
+            d["fail"] += int(v)
+        elif kind == "l":
+            d["last"] = v
+    return out
 
+def pending_session_counters():
+    """Henüz dosyaya işlenmemiş sayaçlar: {sid: {"success", "fail", "last"}} (admin görünümü için)."""
     try:
-        with open(SESSION_LOG, "r") as f:
-            data = json.load(f)
-    except:
-        data = []
-
-    data.append({
-        "sessionid": sessionid,
-        "status": status,
-        "timestamp": datetime.datetime.utcnow().isoformat()
-    })
+        r = _cnt_redis()
+        pipe = r.pipeline(transaction=False)
+        pipe.hgetall(SESSCNT_FLUSHING)
+        pipe.hgetall(SESSCNT_KEY)
+        flushing, live = pipe.execute()
+    except Exception:
+        return {}
+    out = _parse_counters(flushing)
+    for sid, d in _parse_counters(live).items():
+        cur = out.setdefault(sid, {"success": 0, "fail": 0, "last": None})
+        cur["success"] += d["success"]
+        cur["fail"] += d["fail"]
+        cur["last"] = d["last"] or cur["last"]
+    return out
+
+def merge_pending_counters(sessions):
+    """Dosyadan okunmuş listeye bekleyen sayaçları ekler (YALNIZCA gösterim; geri yazılmamalı)."""
+    pending = pending_session_counters()
+    if not pending:
+        return sessions
+    for s in sessions:
+        d = pending.get(s.get("sessionid"))
+        if d:
+            s["success_count"] = s.get("success_count", 0) + d["success"]
+            s["fail_count"] = s.get("fail_count", 0) + d["fail"]
+            if d["last"]:
+                s["last_used"] = d["last"]
+    return sessions
+
+# Kilit yalnızca sahibi tarafından silinir (GET+DEL atomik değil; başka worker'ın kilidini silebilir)
+_LOCK_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def flush_session_counters():
+    """
+    Biriken sayaçları sessions.json'a tek yazımda işler. Döner: güncellenen oturum sayısı.
+    Flushing hash'i dosya yazılmadan ÖNCE silinir, yazım başarısızsa geri konur: yazım ile
+    silme arasında çökme aynı sayaçları iki kez işletmez (en kötü ihtimalle bir parti kaybolur).
+    """
+    r = _cnt_redis()
+    token = f"{os.getpid()}:{os.urandom(8).hex()}"
+    if not r.set(SESSCNT_LOCK, token, nx=True, ex=120):
+        return 0   # başka worker işliyor
+    try:
+        # Önceki yarım kalmış flush varsa önce onu bitir; yoksa canlı hash'i atomik devral
+        if not r.exists(SESSCNT_FLUSHING):
+            if not r.exists(SESSCNT_KEY):
+                return 0
+            r.rename(SESSCNT_KEY, SESSCNT_FLUSHING)
+        raw = r.hgetall(SESSCNT_FLUSHING)
+        pending = _parse_counters(raw)
+        if not (pending and os.path.exists(SESSIONS_PATH)):
+            r.delete(SESSCNT_FLUSHING)
+            return 0
+        n = 0
+        with sessions_file_lock():
+            with open(SESSIONS_PATH, "r", encoding="utf-8") as f:
+                sessions = json.load(f)
+            for s in sessions:
+                d = pending.get(s.get("sessionid"))
+                if not d:
+                    continue
+                if d["last"]:
+                    s["last_used"] = d["last"]
+                if d["success"]:
+                    s["success_count"] = s.get("success_count", 0) + d["success"]
+                if d["fail"]:
+                    s["fail_count"] = s.get("fail_count", 0) + d["fail"]
+                n += 1
+            r.delete(SESSCNT_FLUSHING)
+            if n:
+                try:
+                    write_sessions_atomic(sessions)
+                except Exception:
+                    r.hset(SESSCNT_FLUSHING, mapping=raw)   # sonraki flush yeniden denesin
+                    raise
+        return n
+    finally:
+        try:
+            r.eval(_LOCK_RELEASE_LUA, 1, SESSCNT_LOCK, token)
+        except Exception:
+            pass
+
+def _flush_loop():
+    while True:
+        time.sleep(SESSION_COUNTER_FLUSH_SEC)
+        try:
+            flush_session_counters()
+        except Exception:
+            logger.exception("session counter flush error")
 
-    with open(SESSION_LOG, "w") as f:
-        json.dump(data[-500:], f, indent=2)  # sadece son 500 log
+def _ensure_flusher():
+    if _cnt_state["flusher"] is not None:
+        return
+    with _cnt_lock:
+        if _cnt_state["flusher"] is None:
+            t = threading.Thread(target=_flush_loop, name="sesscnt-flush", daemon=True)
+            _cnt_state["flusher"] = t
+            t.start()
+            atexit.register(_flush_at_exit)
+
+def _flush_at_exit():
+    try:
+        flush_session_counters()
+    except Exception:
+        pass
+
+# ---- sessionid → user indeksi ----
+# sessions.json yalnızca değiştiğinde (mtime/size/inode) yeniden okunur; stat en fazla
+# SESSION_USER_STAT_SEC'te bir yapılır. Sorgu dict erişimi.
+SESSION_USER_STAT_SEC = float(os.getenv("SESSION_USER_STAT_SEC", "2"))
+
+_su_index = {"sig": None, "checked": 0.0, "map": {}}
+_su_stats = {"hits": 0, "misses": 0, "reloads": 0}
+_su_lock = threading.Lock()
+
+def _session_user_map():
+    global _su_index
+    idx = _su_index
+    now = time.monotonic()
+    if idx["sig"] is not None and now - idx["checked"] < SESSION_USER_STAT_SEC:
+        return idx["map"]
+    try:
+        st = os.stat(SESSIONS_PATH)
+        sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        sig = (0, 0, 0)
+    if sig == idx["sig"]:
+        idx["checked"] = now
+        return idx["map"]
+    with _su_lock:
+        if _su_index["sig"] != sig:
+            mp = {}
+            try:
+                with open(SESSIONS_PATH, encoding="utf-8") as f:
+                    for s in json.load(f):
+                        if s.get("sessionid"):
+                            mp[s["sessionid"]] = s.get("user", "")
+            except Exception:
+                mp = _su_index["map"]   # yarım/bozuk dosya: eski indeksle devam
+            _su_index = {"sig": sig, "checked": now, "map": mp}
+            _su_stats["reloads"] += 1
+        return _su_index["map"]
+
+def lookup_session_user(sessionid):
+    """sessions.json'daki "user" etiketi; bulunamazsa ''."""
+    if not sessionid:
+        return ""
+    user = _session_user_map().get(sessionid)
+    if user is None:
+        _su_stats["misses"] += 1
+        return ""
+    _su_stats["hits"] += 1
+    return user
+
+def session_user_stats():
+    return dict(_su_stats, size=len(_su_index["map"]))
+
+def _rotate_if_needed(path, max_bytes):
+    # Birden çok worker aynı anda döndürmesin: kilit altında boyutu tekrar kontrol et
+    try:
+        with open(path + ".lock", "w") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            if os.path.getsize(path) > max_bytes:
+                os.replace(path, path + ".1")
+    except OSError:
+        pass
+
+def append_jsonl(path, entry, max_bytes=LOG_MAX_BYTES):
+    """Tek satırı O_APPEND ile yazar (tek write çağrısı; okuma/yeniden yazma yok)."""
+    append_jsonl_many(path, [entry], max_bytes)
+
+def append_jsonl_many(path, entries, max_bytes=LOG_MAX_BYTES):
+    if not entries:
+        return
+    line = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in entries).encode("utf-8")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+        size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+    if size > max_bytes:
+        _rotate_if_needed(path, max_bytes)
+
+def _tail_lines(path, n, block=8192):
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos, buf = f.tell(), b""
+            while pos > 0 and buf.count(b"\n") <= n:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+    except OSError:
+        return []
+    lines = [x for x in buf.split(b"\n") if x.strip()]
+    return lines[-n:] if n > 0 else []
+
+def tail_jsonl(path, n):
+    """Son n kaydı (eskiden yeniye) döndürür; gerekirse döndürülmüş .1 dosyasına da bakar."""
+    lines = _tail_lines(path, n)
+    if len(lines) < n:
+        lines = _tail_lines(path + ".1", n - len(lines)) + lines
+    out = []
+    for ln in lines:
+        try:
+            out.append(json.loads(ln))
+        except ValueError:
+            continue
+    return out
+
+def log_session_use(sessionid, status):
+    try:
+        append_jsonl(SESSION_LOG, {
+            "sessionid": sessionid,
+            "status": status,
+            "timestamp": datetime.datetime.utcnow().isoformat()
+        })
+    except Exception:
+        pass
 
 def notify_download(username):
     notif = {
@@ -56,17 +372,104 @@ def notify_download(username):
         "user": username,
         "timestamp": datetime.datetime.utcnow().isoformat()
     }
+    try:
+        append_jsonl(NOTIF_LOG, notif)
+    except Exception:
+        pass
+
+# ---- İndirme kayıtları için write-behind kuyruğu ----
+# İstek thread'i yalnızca kuyruğa koyar (bloklamaz); arka plan thread'i olayları
+# toplu işler: tek sessions.json okuması, log başına tek append, tek Redis pipeline.
+# Kuyruk doluysa olay düşürülür ve sayılır (indirmeyi asla yavaşlatmaz).
+BOOKKEEP_QUEUE_MAX = int(os.getenv("BOOKKEEP_QUEUE_MAX", "10000"))
+BOOKKEEP_BATCH     = int(os.getenv("BOOKKEEP_BATCH", "200"))
+
+_bk_state = {"pid": None, "queue": None, "thread": None}
+_bk_stats = {"enqueued": 0, "processed": 0, "dropped": 0, "batches": 0, "errors": 0}
+_bk_lock = threading.Lock()
+_bk_stats_lock = threading.Lock()   # sayaçlar istek thread'leri + yazıcı thread'inden artar
+
+def _bk_count(**inc):
+    with _bk_stats_lock:
+        for k, v in inc.items():
+            _bk_stats[k] += v
+
+def _bk_queue():
+    pid = os.getpid()
+    if _bk_state["pid"] != pid:
+        with _bk_lock:
+            if _bk_state["pid"] != pid:
+                q = queue.Queue(maxsize=BOOKKEEP_QUEUE_MAX)
+                t = threading.Thread(target=_bk_loop, args=(q,), name="bookkeeping", daemon=True)
+                _bk_state.update(pid=pid, queue=q, thread=t)
+                t.start()
+                atexit.register(_bk_drain_at_exit, q)
+    return _bk_state["queue"]
+
+def record_download(sessionid, username="", result="success", log=True, notify=None):
+    """
+    İndirme sonrası kayıtları (log_session_use, notify_download, update_session_counters)
+    kuyruğa atar. username boşsa worker sessions.json'dan bulur.
+    """
+    if not (sessionid or username):
+        return
+    ev = {"sid": sessionid or "", "user": username or "", "result": result, "log": bool(log),
+          "notify": (result == "success") if notify is None else bool(notify),
+          "ts": datetime.datetime.utcnow().isoformat()}
+    try:
+        _bk_queue().put_nowait(ev)
+        _bk_count(enqueued=1)
+    except queue.Full:
+        _bk_count(dropped=1)
 
-    if not os.path.exists(NOTIF_LOG):
-        with open(NOTIF_LOG, "w") as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
+def _resolve_users(events):
+    need = {e["sid"] for e in events if e["notify"] and e["sid"] and not e["user"]}
+    return {sid: lookup_session_user(sid) for sid in need}
 
+def _bk_process(events):
+    users = _resolve_users(events)
+    logs, notifs, counters = [], [], []
+    for e in events:
+        if e["log"]:
+            logs.append({"sessionid": e["sid"], "status": e["result"], "timestamp": e["ts"]})
+        if e["notify"]:
+            u = e["user"] or users.get(e["sid"], "")
+            notifs.append({"message": f"✅ Kullanıcı {u} üzerinden indirme yapıldı.", "user": u, "timestamp": e["ts"]})
+        if e["sid"]:
+            counters.append((e["sid"], e["result"]))
+    append_jsonl_many(SESSION_LOG, logs)
+    append_jsonl_many(NOTIF_LOG, notifs)
+    update_session_counters_many(counters)
+
+def _bk_take_batch(q, first):
+    batch = [first]
+    while len(batch) < BOOKKEEP_BATCH:
+        try:
+            batch.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _bk_loop(q):
+    while True:
+        batch = _bk_take_batch(q, q.get())
+        try:
+            _bk_process(batch)
+            _bk_count(processed=len(batch), batches=1)
+        except Exception:
+            _bk_count(errors=1)
+            logger.exception(f"bookkeeping batch error ({len(batch)} events)")
+
+def _bk_drain_at_exit(q):
     try:
-        with open(NOTIF_LOG, "r") as f:
-            data = json.load(f)
-    except:
-        data = []
-
-    data.append(notif)
-    with open(NOTIF_LOG, "w") as f:
-        json.dump(data[-100:], f, ensure_ascii=False, indent=2)  # son 100 bildirim
+        while True:
+            _bk_process(_bk_take_batch(q, q.get_nowait()))
+    except Exception:
+        pass
+
+def bookkeeping_stats():
+    q = _bk_state["queue"] if _bk_state["pid"] == os.getpid() else None
+    with _bk_stats_lock:
+        stats = dict(_bk_stats)
+    return dict(stats, depth=(q.qsize() if q is not None else 0), capacity=BOOKKEEP_QUEUE_MAX,
+                session_user_index=session_user_stats())
@@ -2,8 +2,8 @@ import json
 import os
 import time
 from datetime import datetime
+from session_logger import edit_sessions
 
-SESSIONS_FILE = "sessions.json"
 BLOCKED_FILE = "blocked_cookies.json"
 
 def load_json(path):
@@ -63,14 +63,14 @@ def detect_status(entry, active_blocked_sids: set):
     return "active"
 
 def update_sessions():
-    sessions = load_json(SESSIONS_FILE)
     active_blocked = _blocked_set_with_expiry()
 
-    for s in sessions:
-        normalize_session(s)
-        s["status"] = detect_status(s, active_blocked)
+    # kilit oku-değiştir-yaz boyunca tutulur: sayaç flush'ı / admin kaydı ezilmesin
+    with edit_sessions() as sessions:
+        for s in sessions:
+            normalize_session(s)
+            s["status"] = detect_status(s, active_blocked)
 
-    save_json(SESSIONS_FILE, sessions)
     print(f"✔ Güncellendi: {len(sessions)} session")
 
 if __name__ == "__main__":